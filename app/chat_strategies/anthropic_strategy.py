@@ -4,9 +4,13 @@ This strategy adheres to the ChatModelStrategy interface and encapsulates Anthro
 """
 
 from typing import List, Dict
-from anthropic import Anthropic
+import time
+from anthropic import AsyncAnthropic
+from chat_strategies.async_adapter import LoopLocal
+from chat_strategies.chat_response import AsyncChatStream, ChatResponse, Usage
 from chat_strategies.chat_model_strategy import ChatModelStrategy
-from chat_strategies.model import Model
+from chat_strategies.model_catalog import get_model_catalog
+from chat_strategies.rate_limiter import estimate_prompt_tokens, get_rate_limiter
 
 
 # https://docs.anthropic.com/claude/docs/models-overview
@@ -25,14 +29,10 @@ class AnthropicChatStrategy(ChatModelStrategy):
         The API key for accessing the Anthropic API.
     models : List[Model]
         A list of available Anthropic models.
-    client : Anthropic
-        The Anthropic client instance for making API requests.
-    input_tokens : int
-        The number of input tokens used in the last API request.
-    output_tokens : int
-        The number of output tokens generated in the last API response.
-    model : str
-        The name of the model used in the last API request.
+    catalog : ModelCatalog
+        The process-wide model catalog with the models, limits and prices.
+    clients : LoopLocal[AsyncAnthropic]
+        The Anthropic client instances for making API requests, one per event loop.
 
     Methods
     -------
@@ -40,102 +40,43 @@ class AnthropicChatStrategy(ChatModelStrategy):
         Returns a list of available model names.
     get_output_max_tokens(model_name)
         Returns the maximum number of output tokens for the specified model.
-    get_input_tokens()
-        Returns the number of input tokens used in the last API request.
-    get_output_tokens()
-        Returns the number of output tokens generated in the last API response.
-    get_full_price()
-        Calculates and returns the total price based on the input and output tokens.
-    send_message(system_prompt, messages, model_name, max_tokens, temperature)
+    async_send_message(system_prompt, messages, model_name, max_tokens, temperature)
         Sends a message to the Anthropic API and returns the generated response.
+    async_stream_message(system_prompt, messages, model_name, max_tokens, temperature)
+        Sends a message to the Anthropic API and returns a stream of the generated response.
     """
 
+    provider = "Anthropic"
+    supports_prompt_cache = True
+
     def __init__(self, api_key: str):
         self.api_key = api_key
-        self.models = [
-            Model(
-                name="claude-3-5-sonnet-latest",
-                output_max_tokens=8192,
-                price_input=3.0,
-                price_output=15.0,
-            ),
-            Model(
-                name="claude-3-opus-latest",
-                output_max_tokens=4096,
-                price_input=15.0,
-                price_output=75.0,
-            ),
-            Model(
-                name="claude-3-haiku-20240307",
-                output_max_tokens=4096,
-                price_input=0.25,
-                price_output=1.25,
-            ),
-        ]
-        self.client = Anthropic(api_key=self.api_key)
-        self.input_tokens = 0
-        self.output_tokens = 0
-        self.cache_create_tokens = 0
-        self.cache_read_tokens = 0
-        self.model = None
+        self.catalog = get_model_catalog()
+        self.models = self.catalog.get_models(self.provider)
+        # Retries are handled by the shared rate limiter
+        self.clients = LoopLocal(
+            lambda: AsyncAnthropic(api_key=self.api_key, max_retries=0)
+        )
 
     def get_models(self) -> List[str]:
-        return [model.name for model in self.models]
+        return self.catalog.get_model_names(self.provider)
 
     def get_output_max_tokens(self, model_name: str) -> int:
-        return self.models[self.get_models().index(model_name)].output_max_tokens
+        return self.catalog.get_model(self.provider, model_name).output_max_tokens
 
-    def get_input_tokens(self) -> int:
-        return self.input_tokens
-
-    def get_output_tokens(self) -> int:
-        return self.output_tokens
-
-    def get_cache_create_tokens(self) -> int:
-        return self.cache_create_tokens
-
-    def get_cache_read_tokens(self) -> int:
-        return self.cache_read_tokens
-
-    def get_full_price(self) -> float:
-        inputs = (
-            self.input_tokens
-            * self.models[self.get_models().index(self.model)].price_input
-            / 1_000_000.0
-        )
-        outputs = (
-            self.output_tokens
-            * self.models[self.get_models().index(self.model)].price_output
-            / 1_000_000.0
-        )
-        # Токены записи в кэш на 25% дороже базовых входных токенов
-        cache_create = (
-            self.cache_create_tokens
-            * self.models[self.get_models().index(self.model)].price_input
-            * 1.25
-            / 1_000_000.0
-        )
-        # Токены чтения из кэша на 90% дешевле базовых входных токенов
-        cache_read = (
-            self.cache_read_tokens
-            * self.models[self.get_models().index(self.model)].price_input
-            * 0.1
-            / 1_000_000.0
-        )
-
-        return inputs + outputs + cache_create + cache_read
-
-    def send_message(
+    def _create(
         self,
         system_prompt: str,
         messages: List[Dict[str, str]],
         model_name: str,
         max_tokens: int,
-        temperature: float = 0,
-    ) -> str:
-
-        self.model = model_name
-
+        temperature: float,
+        estimated_tokens: int,
+        **kwargs,
+    ):
+        """
+        Marks the cache breakpoints and sends the request through the rate limiter of the model.
+        """
         cashed_messages = []
         message_count = len(messages)
         used_cashed_control_breakpoints = 0
@@ -159,18 +100,117 @@ class AnthropicChatStrategy(ChatModelStrategy):
                 new_message["content"][0]["cache_control"] = {"type": "ephemeral"}
             cashed_messages.append(new_message)
 
-        response = self.client.beta.prompt_caching.messages.create(
-            model=model_name,
-            system=system_prompt,
-            messages=cashed_messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            top_p=1,
+        return get_rate_limiter(self.provider, model_name).async_call(
+            lambda: self.clients.get().beta.prompt_caching.messages.create(
+                model=model_name,
+                system=system_prompt,
+                messages=cashed_messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=1,
+                **kwargs,
+            ),
+            estimated_tokens=estimated_tokens,
+            count_tokens=(
+                None
+                if kwargs.get("stream")
+                else lambda response: self._usage(response.usage).prompt_tokens
+                + response.usage.output_tokens
+            ),
+        )
+
+    def _usage(self, usage, output_tokens: int = None) -> Usage:
+        """
+        Normalizes the usage reported by the API.
+        """
+        return Usage(
+            input_tokens=usage.input_tokens,
+            output_tokens=(
+                usage.output_tokens if output_tokens is None else output_tokens
+            ),
+            cache_create_tokens=usage.cache_creation_input_tokens or 0,
+            cache_read_tokens=usage.cache_read_input_tokens or 0,
         )
 
-        self.input_tokens = response.usage.input_tokens
-        self.output_tokens = response.usage.output_tokens
-        self.cache_create_tokens = response.usage.cache_creation_input_tokens
-        self.cache_read_tokens = response.usage.cache_read_input_tokens
+    async def async_send_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> ChatResponse:
+        started = time.monotonic()
+        estimated_tokens = estimate_prompt_tokens(system_prompt, messages)
+
+        response = await self._create(
+            system_prompt,
+            messages,
+            model_name,
+            max_tokens,
+            temperature,
+            estimated_tokens,
+        )
+
+        return self._build_response(
+            response.content[0].text,
+            self._usage(response.usage),
+            model_name,
+            started,
+            {"id": response.id, "finish_reason": response.stop_reason},
+            estimated_tokens,
+        )
 
-        return response.content[0].text
+    def async_stream_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> AsyncChatStream:
+        async def generate():
+            started = time.monotonic()
+            estimated_tokens = estimate_prompt_tokens(system_prompt, messages)
+            stream = await self._create(
+                system_prompt,
+                messages,
+                model_name,
+                max_tokens,
+                temperature,
+                estimated_tokens,
+                stream=True,
+            )
+
+            chunks = []
+            message = stop_reason = None
+            output_tokens = 0
+            async with stream:
+                async for event in stream:
+                    # The input usage comes first, the output usage with the last delta
+                    if event.type == "message_start":
+                        message = event.message
+                    elif (
+                        event.type == "content_block_delta"
+                        and event.delta.type == "text_delta"
+                    ):
+                        chunks.append(event.delta.text)
+                        yield chunks[-1]
+                    elif event.type == "message_delta":
+                        output_tokens = event.usage.output_tokens
+                        stop_reason = event.delta.stop_reason
+
+            usage = self._usage(message.usage, output_tokens)
+            get_rate_limiter(self.provider, model_name).record_usage(
+                estimated_tokens, usage.prompt_tokens + usage.output_tokens
+            )
+            yield self._build_response(
+                "".join(chunks),
+                usage,
+                model_name,
+                started,
+                {"id": message.id, "finish_reason": stop_reason},
+                estimated_tokens,
+            )
+
+        return AsyncChatStream(generate())
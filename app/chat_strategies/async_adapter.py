@@ -0,0 +1,144 @@
+"""
+Runs the async strategy API from synchronous code.
+
+All synchronous calls share one event loop running in a background thread, so the async clients, their
+connection pools and the hedged requests of every session live on a single loop instead of a thread each.
+"""
+
+from typing import AsyncIterable, Awaitable, Callable, Generic, Iterator, TypeVar
+import asyncio
+import threading
+import weakref
+
+T = TypeVar("T")
+
+_loop: asyncio.AbstractEventLoop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the background event loop of the sync adapter, starting it on first use.
+
+    Returns
+    -------
+    asyncio.AbstractEventLoop
+        The process-wide background event loop.
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="async-adapter", daemon=True
+                ).start()
+                _loop = loop
+    return _loop
+
+
+def run_sync(awaitable: Awaitable[T]) -> T:
+    """
+    Runs a coroutine on the background event loop and waits for its result.
+
+    Parameters
+    ----------
+    awaitable : Awaitable[T]
+        The coroutine to run.
+
+    Returns
+    -------
+    T
+        The result of the coroutine.
+
+    Raises
+    ------
+    RuntimeError
+        If called from the background event loop itself, which would deadlock.
+    """
+    loop = get_event_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("run_sync() cannot be called from the adapter event loop")
+
+    future = asyncio.run_coroutine_threadsafe(awaitable, loop)
+    try:
+        return future.result()
+    except BaseException:
+        # The caller gave up (e.g. the script was stopped): do not leave the request running
+        future.cancel()
+        raise
+
+
+def iterate_sync(iterable: AsyncIterable[T]) -> Iterator[T]:
+    """
+    Iterates over an async iterable from synchronous code, one item at a time.
+
+    Closing the returned generator closes the async iterator on the event loop.
+
+    Parameters
+    ----------
+    iterable : AsyncIterable[T]
+        The async iterable.
+
+    Yields
+    ------
+    T
+        The items of the iterable.
+    """
+    iterator = iterable.__aiter__()
+    try:
+        while True:
+            try:
+                item = run_sync(iterator.__anext__())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            run_sync(aclose())
+
+
+class LoopLocal(Generic[T]):
+    """
+    Lazily created objects bound to an event loop, such as async API clients.
+
+    Async clients keep connections tied to the loop they were first used on, so a strategy used both
+    through the sync adapter and from the caller's own loop needs one client per loop.
+
+    Parameters
+    ----------
+    factory : Callable[[], T]
+        Creates the object for a new event loop.
+
+    Methods
+    -------
+    get() -> T
+        Returns the object of the running event loop.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self.factory = factory
+        self.instances: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, T]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self.lock = threading.Lock()
+
+    def get(self) -> T:
+        """
+        Returns the object of the running event loop, creating it if needed.
+
+        Returns
+        -------
+        T
+            The object bound to the running loop.
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if loop not in self.instances:
+                self.instances[loop] = self.factory()
+            return self.instances[loop]
@@ -0,0 +1,594 @@
+"""
+Implements the AutoChatStrategy, a composite strategy that routes every request to a model chosen for it.
+
+Easy questions go to the small, cheap models and hard ones to the large models. Among the models of the tier
+whose context window fits the request, the cheapest and fastest is chosen from the catalog prices and the
+observed latencies and errors; a failed request falls back to the next one. A conversation keeps the model
+of its previous turn while the tier is unchanged and the model answers, so that its prompt cache is reused.
+The decision and its reasons are returned in the response metadata, so they can be logged.
+"""
+
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+
+from chat_strategies.chat_model_strategy import ChatModelStrategy
+from chat_strategies.chat_response import AsyncChatStream, ChatResponse
+from chat_strategies.latency_tracker import (
+    FIRST_CHUNK,
+    RESPONSE,
+    LatencyTracker,
+    get_latency_tracker,
+)
+from chat_strategies.model_catalog import get_model_catalog
+from chat_strategies.rate_limiter import estimate_prompt_tokens
+from chat_strategies.token_calibrator import get_token_calibrator
+from managers.file_manager import num_tokens_from_content
+
+SMALL_TIER = "small"
+LARGE_TIER = "large"
+
+# Tier -> candidate (strategy name, model name), in order of preference on equal scores
+DEFAULT_TIERS: Dict[str, List[Tuple[str, str]]] = {
+    SMALL_TIER: [
+        ("OpenAI", "gpt-4o-mini"),
+        ("Anthropic", "claude-3-haiku-20240307"),
+        ("Gemini", "gemini-1.5-flash-002"),
+        ("Deepseeker", "deepseek-chat"),
+        ("Simulated", "simulated-fast"),
+    ],
+    LARGE_TIER: [
+        ("OpenAI", "gpt-4o"),
+        ("Anthropic", "claude-3-5-sonnet-latest"),
+        ("Gemini", "gemini-1.5-pro-002"),
+        ("Simulated", "simulated-large"),
+    ],
+}
+
+# Policy -> (weight of the cost, weight of the median latency) in the score of a model
+POLICIES: Dict[str, Tuple[float, float]] = {
+    "balanced": (1.0, 1.0),
+    "cheapest": (1.0, 0.0),
+    "fastest": (0.0, 1.0),
+}
+
+# A question this long is routed to the large models
+HARD_QUESTION_TOKENS = 400
+# Words of the questions asking for reasoning, routed to the large models
+HARD_QUESTION_PATTERN = re.compile(
+    r"\b(refactor|architect|design|prove|proof|debug|optimi[sz]|algorithm|step by step|"
+    r"рефактор|архитектур|спроектир|докаж|доказ|отлад|оптимиз|алгоритм)",
+    re.IGNORECASE,
+)
+# Expected length of an answer, the max tokens being only a cap
+TYPICAL_OUTPUT_TOKENS = 1000
+# Latency percentile compared between the models
+ROUTING_PERCENTILE = 50
+# Number of conversations whose last route is remembered
+MAX_STICKY_ROUTES = 1024
+
+
+class RouteCandidate:
+    """
+    A model considered for a request, with the figures its score is computed from.
+
+    Parameters
+    ----------
+    strategy_name : str
+        Name of the strategy.
+    model_name : str
+        Name of the model.
+    cost : float
+        Expected price of the request in dollars.
+    latency : Optional[float]
+        Median latency in seconds, None until enough requests are observed.
+    error_rate : float
+        Share of failed requests.
+    score : float
+        Weighted score, the lowest is chosen.
+    """
+
+    __slots__ = (
+        "strategy_name",
+        "model_name",
+        "cost",
+        "latency",
+        "error_rate",
+        "score",
+    )
+
+    def __init__(
+        self,
+        strategy_name: str,
+        model_name: str,
+        cost: float,
+        latency: Optional[float],
+        error_rate: float,
+        score: float = 0.0,
+    ):
+        self.strategy_name = strategy_name
+        self.model_name = model_name
+        self.cost = cost
+        self.latency = latency
+        self.error_rate = error_rate
+        self.score = score
+
+    def describe(self) -> str:
+        latency = "n/a" if self.latency is None else f"{self.latency:.1f} s"
+        return (
+            f"{self.strategy_name} - {self.model_name}: score {self.score:.2f}, "
+            f"~{self.cost:.5f} $, p{ROUTING_PERCENTILE} {latency}, errors {self.error_rate:.0%}"
+        )
+
+
+class RouteDecision:
+    """
+    The routing decision of a request.
+
+    Parameters
+    ----------
+    tier : str
+        Tier the model was chosen from.
+    candidates : List[RouteCandidate]
+        The models able to answer, best first.
+    reasons : List[str]
+        Why the tier and the models were chosen.
+    key : str, optional
+        Hash of the conversation prefix and the policy, the route is remembered under it. Default is None.
+
+    Methods
+    -------
+    describe() -> str
+        Returns the decision and its reasons as text, for the log.
+    """
+
+    __slots__ = ("tier", "candidates", "reasons", "key")
+
+    def __init__(
+        self,
+        tier: str,
+        candidates: List[RouteCandidate],
+        reasons: List[str],
+        key: str = None,
+    ):
+        self.tier = tier
+        self.candidates = candidates
+        self.reasons = reasons
+        self.key = key
+
+    def describe(self) -> str:
+        """
+        Returns the decision and its reasons as text, for the log.
+
+        Returns
+        -------
+        str
+            The chosen tier, the reasons and the ranked candidates, one per line.
+        """
+        return "\n".join(
+            [f"{self.tier} tier: " + "; ".join(self.reasons)]
+            + [f"  {i}. {c.describe()}" for i, c in enumerate(self.candidates, 1)]
+        )
+
+
+class AutoChatStrategy(ChatModelStrategy):
+    """
+    A composite strategy routing every request to the model suited to its size and difficulty.
+
+    Parameters
+    ----------
+    strategies : Dict[str, ChatModelStrategy]
+        Dictionary mapping strategy names to ChatModelStrategy instances (None if unavailable).
+    tiers : Dict[str, List[Tuple[str, str]]], optional
+        Tier -> candidate (strategy name, model name). Default is DEFAULT_TIERS.
+    latency_tracker : LatencyTracker, optional
+        Latency statistics. Default is the process-wide tracker.
+
+    Attributes
+    ----------
+    tiers : Dict[str, List[Tuple[str, str]]]
+        Candidates of the tiers, restricted to the configured strategies.
+
+    Methods
+    -------
+    get_models()
+        Returns the names of the routing policies.
+    get_output_max_tokens(model_name)
+        Returns the largest maximum number of output tokens of the candidates.
+    route(system_prompt, messages, model_name, max_tokens, metric) -> RouteDecision
+        Chooses the models able to answer a request, best first.
+    async_send_message(system_prompt, messages, model_name, max_tokens, temperature)
+        Sends the message to the chosen model, falling back to the next ones on errors.
+    async_stream_message(system_prompt, messages, model_name, max_tokens, temperature)
+        Streams the answer of the chosen model, falling back to the next ones on errors before the first chunk.
+    estimate_price(model_name, input_tokens, output_tokens, cache_create_tokens, cache_read_tokens)
+        Computes the price of a request answered by the most expensive candidate.
+    """
+
+    # Conversation key -> (tier, strategy name, model name) of the last answered request.
+    # Shared by all instances, as the strategies are recreated on every rerun.
+    routes: "OrderedDict[str, Tuple[str, str, str]]" = OrderedDict()
+    routes_lock = threading.Lock()
+
+    def __init__(
+        self,
+        strategies: Dict[str, Optional[ChatModelStrategy]],
+        tiers: Dict[str, List[Tuple[str, str]]] = None,
+        latency_tracker: LatencyTracker = None,
+    ):
+        self.strategies = strategies
+        self.tiers = {
+            tier: [
+                (strategy_name, model_name)
+                for strategy_name, model_name in candidates
+                if strategies.get(strategy_name)
+                and model_name in strategies[strategy_name].get_models()
+            ]
+            for tier, candidates in (tiers or DEFAULT_TIERS).items()
+        }
+        self.latency_tracker = latency_tracker or get_latency_tracker()
+
+    def _candidates(self) -> List[Tuple[str, str]]:
+        return [candidate for tier in self.tiers.values() for candidate in tier]
+
+    def get_models(self) -> List[str]:
+        return list(POLICIES) if self._candidates() else []
+
+    def get_output_max_tokens(self, model_name: str) -> int:
+        # Larger requests are capped to the limit of the chosen model
+        return max(
+            self.strategies[strategy_name].get_output_max_tokens(member_model)
+            for strategy_name, member_model in self._candidates()
+        )
+
+    @property
+    def supports_prompt_cache(self) -> bool:
+        # Caching depends on the chosen model, assume none to stay on the safe side
+        return False
+
+    def estimate_price(
+        self,
+        model_name: str,
+        input_tokens: int,
+        output_tokens: int,
+        cache_create_tokens: int = 0,
+        cache_read_tokens: int = 0,
+    ) -> float:
+        # The route is not known before the request, the budgets hold whatever it is
+        return max(
+            self.strategies[strategy_name].estimate_price(
+                member_model,
+                input_tokens,
+                output_tokens,
+                cache_create_tokens,
+                cache_read_tokens,
+            )
+            for strategy_name, member_model in self._candidates()
+        )
+
+    def _fits(
+        self, strategy_name: str, model_name: str, prompt_tokens: int, max_tokens: int
+    ) -> bool:
+        """
+        Returns whether the prompt and the answer fit in the context window of a model.
+        """
+        strategy = self.strategies[strategy_name]
+        context_window = (
+            get_model_catalog().get_model(strategy.provider, model_name).context_window
+        )
+        if context_window is None:
+            return True
+        output_tokens = min(max_tokens, strategy.get_output_max_tokens(model_name))
+        prompt_tokens = get_token_calibrator().correct(
+            strategy.provider, model_name, prompt_tokens
+        )
+        return prompt_tokens + output_tokens <= context_window
+
+    def _hard_reasons(self, messages: List[Dict[str, str]]) -> List[str]:
+        """
+        Returns why the question of a request needs a large model, empty if it does not.
+        """
+        question = messages[-1]["content"] if messages else ""
+        reasons = []
+        question_tokens = num_tokens_from_content(question)
+        if question_tokens >= HARD_QUESTION_TOKENS:
+            reasons.append(f"long question ({question_tokens} tokens)")
+        match = HARD_QUESTION_PATTERN.search(question)
+        if match:
+            reasons.append(f'asks for reasoning ("{match.group(0)}")')
+        return reasons
+
+    def _route_key(
+        self, system_prompt: str, messages: List[Dict[str, str]], model_name: str
+    ) -> str:
+        """
+        Returns the key of the conversation of a request: its policy, system prompt and first message,
+        which holds the context.
+        """
+        data = json.dumps(
+            [model_name, system_prompt, messages[0] if messages else None],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _stick(self, decision: RouteDecision) -> None:
+        """
+        Moves the model of the previous turn first if the tier is unchanged and the model still fits.
+        """
+        with self.routes_lock:
+            previous = self.routes.get(decision.key)
+        if previous is None or previous[0] != decision.tier:
+            return
+        for i, candidate in enumerate(decision.candidates):
+            if (candidate.strategy_name, candidate.model_name) == previous[1:]:
+                if i:
+                    decision.candidates.insert(0, decision.candidates.pop(i))
+                decision.reasons.append(
+                    f"kept {candidate.strategy_name} - {candidate.model_name} "
+                    "of the previous turn for its prompt cache"
+                )
+                return
+
+    def _keep_route(self, decision: RouteDecision, candidate: RouteCandidate) -> None:
+        """
+        Remembers the model that answered, the next turn of the conversation sticks to it.
+        """
+        with self.routes_lock:
+            self.routes[decision.key] = (
+                decision.tier,
+                candidate.strategy_name,
+                candidate.model_name,
+            )
+            self.routes.move_to_end(decision.key)
+            while len(self.routes) > MAX_STICKY_ROUTES:
+                self.routes.popitem(last=False)
+
+    def route(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        metric: str = RESPONSE,
+    ) -> RouteDecision:
+        """
+        Chooses the models able to answer a request, best first.
+
+        The question picks the tier, the models of the tier too small for the prompt are skipped, and the
+        others are ranked by their expected cost and median latency, relative to the worst candidate and
+        weighted by the policy, plus their error rate. The model that answered the previous turn of the
+        conversation is kept first if it is of the same tier, whatever its rank.
+
+        Parameters
+        ----------
+        system_prompt : str
+            The system prompt.
+        messages : List[Dict[str, str]]
+            The messages of the request, the question last.
+        model_name : str
+            Name of the routing policy.
+        max_tokens : int
+            The maximum number of output tokens.
+        metric : str, optional
+            Latency the models are ranked on, FIRST_CHUNK for a streamed request. Default is RESPONSE.
+
+        Returns
+        -------
+        RouteDecision
+            The decision, its candidates are never empty.
+
+        Raises
+        ------
+        ValueError
+            If no model fits the request.
+        """
+        cost_weight, latency_weight = POLICIES[model_name]
+        prompt_tokens = estimate_prompt_tokens(system_prompt, messages)
+        reasons = self._hard_reasons(messages)
+        tier = LARGE_TIER if reasons and self.tiers.get(LARGE_TIER) else SMALL_TIER
+        if not reasons:
+            reasons.append("short question")
+
+        fitting = [
+            candidate
+            for candidate in self.tiers.get(tier, [])
+            if self._fits(*candidate, prompt_tokens, max_tokens)
+        ]
+        if not fitting:
+            # Large contexts go to the models with the largest windows, whatever the tier
+            fitting = [
+                candidate
+                for candidate in self._candidates()
+                if self._fits(*candidate, prompt_tokens, max_tokens)
+            ]
+            reasons.append(
+                f"prompt too large for the {tier} models, widened to the models with a large enough window"
+            )
+            tier = "any"
+        if not fitting:
+            raise ValueError(
+                f"No model fits a prompt of {prompt_tokens} tokens and {max_tokens} output tokens"
+            )
+
+        candidates = []
+        for strategy_name, member_model in fitting:
+            strategy = self.strategies[strategy_name]
+            output_tokens = min(
+                max_tokens,
+                TYPICAL_OUTPUT_TOKENS,
+                strategy.get_output_max_tokens(member_model),
+            )
+            candidates.append(
+                RouteCandidate(
+                    strategy_name,
+                    member_model,
+                    strategy.estimate_price(
+                        member_model,
+                        get_token_calibrator().correct(
+                            strategy.provider, member_model, prompt_tokens
+                        ),
+                        output_tokens,
+                    ),
+                    self.latency_tracker.percentile(
+                        strategy_name, member_model, ROUTING_PERCENTILE, metric=metric
+                    ),
+                    self.latency_tracker.error_rate(
+                        strategy_name, member_model, metric=metric
+                    ),
+                )
+            )
+
+        max_cost = max(candidate.cost for candidate in candidates)
+        max_latency = max(
+            (c.latency for c in candidates if c.latency is not None), default=0.0
+        )
+        for candidate in candidates:
+            cost = candidate.cost / max_cost if max_cost else 0.0
+            # Models without observed latencies rank in the middle, so they get tried
+            if candidate.latency is None:
+                latency = 0.5
+            else:
+                latency = candidate.latency / max_latency if max_latency else 0.0
+            candidate.score = (
+                cost_weight * cost + latency_weight * latency + candidate.error_rate
+            )
+        # sorted() is stable, the tier order breaks the ties
+        candidates = sorted(candidates, key=lambda candidate: candidate.score)
+        reasons.append(
+            f"{prompt_tokens} prompt tokens, policy {model_name}"
+            + (", time to first chunk" if metric == FIRST_CHUNK else "")
+        )
+        decision = RouteDecision(
+            tier,
+            candidates,
+            reasons,
+            self._route_key(system_prompt, messages, model_name),
+        )
+        self._stick(decision)
+        return decision
+
+    def _record(
+        self,
+        candidate: RouteCandidate,
+        started: float,
+        success: bool = True,
+        metric: str = RESPONSE,
+    ) -> None:
+        self.latency_tracker.record(
+            candidate.strategy_name,
+            candidate.model_name,
+            time.monotonic() - started,
+            success=success,
+            metric=metric,
+        )
+
+    def _annotate(
+        self, response: ChatResponse, model_name: str, decision: RouteDecision
+    ) -> ChatResponse:
+        return replace(
+            response,
+            metadata={
+                **response.metadata,
+                "policy": model_name,
+                "route": decision.describe(),
+            },
+        )
+
+    async def async_send_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> ChatResponse:
+        decision = self.route(system_prompt, messages, model_name, max_tokens)
+        last_error = None
+        for candidate in decision.candidates:
+            strategy = self.strategies[candidate.strategy_name]
+            started = time.monotonic()
+            try:
+                response = await strategy.async_send_message(
+                    system_prompt=system_prompt,
+                    messages=messages,
+                    model_name=candidate.model_name,
+                    max_tokens=min(
+                        max_tokens, strategy.get_output_max_tokens(candidate.model_name)
+                    ),
+                    temperature=temperature,
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                self._record(candidate, started, success=False)
+                decision.reasons.append(
+                    f"{candidate.strategy_name} - {candidate.model_name} failed: {error}"
+                )
+                last_error = error
+                continue
+            self._record(candidate, started)
+            self._keep_route(decision, candidate)
+            return self._annotate(response, model_name, decision)
+        raise last_error
+
+    def async_stream_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> AsyncChatStream:
+        async def generate():
+            decision = self.route(
+                system_prompt, messages, model_name, max_tokens, metric=FIRST_CHUNK
+            )
+            last_error = None
+            for candidate in decision.candidates:
+                strategy = self.strategies[candidate.strategy_name]
+                started = time.monotonic()
+                stream = strategy.async_stream_message(
+                    system_prompt=system_prompt,
+                    messages=messages,
+                    model_name=candidate.model_name,
+                    max_tokens=min(
+                        max_tokens, strategy.get_output_max_tokens(candidate.model_name)
+                    ),
+                    temperature=temperature,
+                )
+                result.source = stream.source or (strategy, candidate.model_name)
+                # Streams are timed to their first chunk, their duration would skew the response latencies
+                streamed = False
+                try:
+                    async for chunk in stream:
+                        if not streamed:
+                            streamed = True
+                            self._record(candidate, started, metric=FIRST_CHUNK)
+                        yield chunk
+                except asyncio.CancelledError:
+                    raise
+                except Exception as error:
+                    # A partial answer cannot be continued by another model
+                    if streamed:
+                        raise
+                    self._record(candidate, started, success=False, metric=FIRST_CHUNK)
+                    decision.reasons.append(
+                        f"{candidate.strategy_name} - {candidate.model_name} failed: {error}"
+                    )
+                    last_error = error
+                    continue
+                if not streamed:
+                    self._record(candidate, started, metric=FIRST_CHUNK)
+                self._keep_route(decision, candidate)
+                yield self._annotate(stream.response, model_name, decision)
+                return
+            raise last_error
+
+        result = AsyncChatStream(generate())
+        return result
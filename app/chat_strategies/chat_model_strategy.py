@@ -14,8 +14,20 @@ Guidelines for refactoring and extending this module:
 Following these guidelines will keep the module flexible, extensible, and aligned with the Strategy pattern.
 """
 
-from typing import List, Dict
+from typing import Any, Dict, List, Optional
 from abc import ABC, abstractmethod
+import threading
+import time
+
+from chat_strategies.async_adapter import iterate_sync, run_sync
+from chat_strategies.chat_response import (
+    AsyncChatStream,
+    ChatResponse,
+    ChatStream,
+    Usage,
+)
+from chat_strategies.model_catalog import get_model_catalog
+from chat_strategies.token_calibrator import get_token_calibrator
 
 
 class ChatModelStrategy(ABC):
@@ -25,22 +37,52 @@ class ChatModelStrategy(ABC):
     This class defines the common interface for all chat model strategies and enforces the implementation
     of essential methods for interacting with chat model APIs.
 
+    Strategies keep no per-request state: every request returns an immutable ChatResponse, so a single
+    instance can be shared by concurrent sessions. The token and price getters are compatibility shims
+    reading the last response of the calling thread.
+
+    The strategies are natively async: subclasses implement `async_send_message` (and `async_stream_message`
+    when the provider streams), and the synchronous methods run them on the shared background event loop.
+
+    Attributes
+    ----------
+    provider : str
+        Name of the provider in the model catalog, None if the strategy has no catalog models.
+    supports_prompt_cache : bool
+        Whether repeated prompt prefixes are billed as cache reads.
+    prompt_cache_min_tokens : int
+        Minimum number of tokens of a cached prompt prefix.
+
     Methods
     -------
     get_models()
         Returns a list of available models for a strategy.
     get_output_max_tokens(model_name)
         Returns the maximum number of output tokens for the specified model.
+    get_last_response()
+        Returns the last response received through the synchronous API by the calling thread.
     get_input_tokens()
         Returns the number of input tokens used in the last API request.
     get_output_tokens()
         Returns the number of output tokens generated in the last API response.
     get_full_price()
-        Calculates and returns the total price based on the input and output tokens.
+        Returns the price of the last API request.
     send_message(system_prompt, messages, model_name, max_tokens, temperature)
-        Sends a message to the chat model API and returns the generated response.
+        Sends a message to the chat model API and returns the response.
+    stream_message(system_prompt, messages, model_name, max_tokens, temperature)
+        Sends a message to the chat model API and returns a stream of the generated response.
+    async_send_message(system_prompt, messages, model_name, max_tokens, temperature)
+        Async version of send_message.
+    async_stream_message(system_prompt, messages, model_name, max_tokens, temperature)
+        Async version of stream_message.
+    estimate_price(model_name, input_tokens, output_tokens, cache_create_tokens, cache_read_tokens)
+        Computes the price of a request with the given token counts.
     """
 
+    provider: str = None
+    supports_prompt_cache: bool = False
+    prompt_cache_min_tokens: int = 1024
+
     @abstractmethod
     def get_models(self) -> List[str]:
         """
@@ -70,7 +112,84 @@ class ChatModelStrategy(ABC):
         """
         pass
 
-    @abstractmethod
+    def get_last_response(self) -> Optional[ChatResponse]:
+        """
+        Returns the last response received through the synchronous API by the calling thread.
+
+        Returns
+        -------
+        Optional[ChatResponse]
+            The last response, None if the thread has not sent any request.
+        """
+        local = self.__dict__.get("_local")
+        return getattr(local, "response", None)
+
+    def _remember(self, response: ChatResponse) -> ChatResponse:
+        """
+        Stores the response as the last response of the calling thread and returns it.
+        """
+        # dict.setdefault is atomic, so concurrent first requests share one thread-local store
+        self.__dict__.setdefault("_local", threading.local()).response = response
+        return response
+
+    def _build_response(
+        self,
+        text: str,
+        usage: Usage,
+        model_name: str,
+        started: float,
+        metadata: Dict[str, Any] = None,
+        local_prompt_tokens: int = None,
+    ) -> ChatResponse:
+        """
+        Builds the response of a request, pricing it with the model catalog.
+
+        The reported usage is also a sample for the token calibration of the model.
+
+        Parameters
+        ----------
+        text : str
+            The generated response.
+        usage : Usage
+            Token usage reported by the provider.
+        model_name : str
+            The name of the model.
+        started : float
+            time.monotonic() when the request started.
+        metadata : Dict[str, Any], optional
+            Provider-specific details. Default is None.
+        local_prompt_tokens : int, optional
+            Number of prompt tokens counted locally before sending. Default is None (not calibrated).
+
+        Returns
+        -------
+        ChatResponse
+            The response.
+        """
+        if local_prompt_tokens:
+            get_token_calibrator().record(
+                self.provider, model_name, local_prompt_tokens, usage.prompt_tokens
+            )
+        return ChatResponse(
+            text=text,
+            usage=usage,
+            cost=self.estimate_price(
+                model_name,
+                usage.input_tokens,
+                usage.output_tokens,
+                usage.cache_create_tokens,
+                usage.cache_read_tokens,
+            ),
+            latency=time.monotonic() - started,
+            provider=self.provider,
+            model=model_name,
+            metadata=metadata or {},
+        )
+
+    def _last_usage(self) -> Usage:
+        response = self.get_last_response()
+        return response.usage if response else Usage()
+
     def get_input_tokens(self) -> int:
         """
         Returns the number of input tokens used in the last API request.
@@ -80,9 +199,8 @@ class ChatModelStrategy(ABC):
         int
             The number of input tokens used in the last API request.
         """
-        pass
+        return self._last_usage().input_tokens
 
-    @abstractmethod
     def get_output_tokens(self) -> int:
         """
         Returns the number of output tokens generated in the last API response.
@@ -92,9 +210,8 @@ class ChatModelStrategy(ABC):
         int
             The number of output tokens generated in the last API response.
         """
-        pass
+        return self._last_usage().output_tokens
 
-    @abstractmethod
     def get_cache_create_tokens(self) -> int:
         """
         Returns the number of cashed input tokens used in the last API request.
@@ -104,9 +221,8 @@ class ChatModelStrategy(ABC):
         int
             The number of cashed input tokens generated in the last API response.
         """
-        pass
+        return self._last_usage().cache_create_tokens
 
-    @abstractmethod
     def get_cache_read_tokens(self) -> int:
         """
         Returns the number of used cashed tokens used in the last API request.
@@ -116,31 +232,120 @@ class ChatModelStrategy(ABC):
         int
             The number of used cashed tokens generated in the last API response.
         """
-        pass
+        return self._last_usage().cache_read_tokens
 
-    @abstractmethod
     def get_full_price(self) -> float:
         """
-        Calculates and returns the total price based on the input and output tokens.
+        Returns the price of the last API request.
 
         Returns
         -------
         float
             The total price based on the input and output tokens.
         """
-        pass
+        response = self.get_last_response()
+        return response.cost if response else 0.0
 
-    @abstractmethod
     def send_message(
         self,
         system_prompt: str,
         messages: List[Dict[str, str]],
         model_name: str,
         max_tokens: int,
-        temperature: float,
-    ) -> str:
+        temperature: float = 0,
+    ) -> ChatResponse:
+        """
+        Sends a message to the chat model API and returns the response.
+
+        Runs `async_send_message` on the shared background event loop.
+
+        Parameters
+        ----------
+        system_prompt : str
+            The system prompt to provide context for the conversation.
+        messages : List[Dict[str, str]]
+            A list of messages in the conversation, each represented as a dictionary.
+        model_name : str
+            The name of the model to use for generating the response.
+        max_tokens : int
+            The maximum number of tokens to generate in the response.
+        temperature : float, optional
+            The temperature value to control the randomness of the generated response. Default is 0.
+
+        Returns
+        -------
+        ChatResponse
+            The response from the chat model API, with its usage and cost.
+        """
+        return self._remember(
+            run_sync(
+                self.async_send_message(
+                    system_prompt=system_prompt,
+                    messages=messages,
+                    model_name=model_name,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                )
+            )
+        )
+
+    def stream_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> ChatStream:
+        """
+        Sends a message to the chat model API and returns a stream of the generated response.
+
+        Iterates `async_stream_message` on the shared background event loop.
+
+        Parameters
+        ----------
+        system_prompt : str
+            The system prompt to provide context for the conversation.
+        messages : List[Dict[str, str]]
+            A list of messages in the conversation, each represented as a dictionary.
+        model_name : str
+            The name of the model to use for generating the response.
+        max_tokens : int
+            The maximum number of tokens to generate in the response.
+        temperature : float, optional
+            The temperature value to control the randomness of the generated response. Default is 0.
+
+        Returns
+        -------
+        ChatStream
+            Iterator over the chunks of the response; the ChatResponse is available in its
+            `response` attribute once exhausted.
+        """
+        stream = self.async_stream_message(
+            system_prompt=system_prompt,
+            messages=messages,
+            model_name=model_name,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+
+        def generate():
+            yield from iterate_sync(stream)
+            return self._remember(stream.response)
+
+        return ChatStream(generate())
+
+    @abstractmethod
+    async def async_send_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> ChatResponse:
         """
-        Sends a message to the chat model API and returns the generated response.
+        Sends a message to the chat model API and returns the response, without blocking the event loop.
 
         Parameters
         ----------
@@ -152,12 +357,96 @@ class ChatModelStrategy(ABC):
             The name of the model to use for generating the response.
         max_tokens : int
             The maximum number of tokens to generate in the response.
-        temperature : float
-            The temperature value to control the randomness of the generated response.
+        temperature : float, optional
+            The temperature value to control the randomness of the generated response. Default is 0.
 
         Returns
         -------
-        str
-            The generated response from the chat model API.
+        ChatResponse
+            The response from the chat model API, with its usage and cost.
         """
         pass
+
+    def async_stream_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> AsyncChatStream:
+        """
+        Sends a message to the chat model API and returns an async stream of the generated response.
+
+        Strategies without native streaming yield the whole response at once.
+
+        Parameters
+        ----------
+        system_prompt : str
+            The system prompt to provide context for the conversation.
+        messages : List[Dict[str, str]]
+            A list of messages in the conversation, each represented as a dictionary.
+        model_name : str
+            The name of the model to use for generating the response.
+        max_tokens : int
+            The maximum number of tokens to generate in the response.
+        temperature : float, optional
+            The temperature value to control the randomness of the generated response. Default is 0.
+
+        Returns
+        -------
+        AsyncChatStream
+            Async iterator over the chunks of the response; the ChatResponse is available in its
+            `response` attribute once exhausted.
+        """
+
+        async def generate():
+            response = await self.async_send_message(
+                system_prompt=system_prompt,
+                messages=messages,
+                model_name=model_name,
+                max_tokens=max_tokens,
+                temperature=temperature,
+            )
+            yield response.text
+            yield response
+
+        return AsyncChatStream(generate())
+
+    def estimate_price(
+        self,
+        model_name: str,
+        input_tokens: int,
+        output_tokens: int,
+        cache_create_tokens: int = 0,
+        cache_read_tokens: int = 0,
+    ) -> float:
+        """
+        Computes the price of a request with the given token counts.
+
+        Parameters
+        ----------
+        model_name : str
+            The name of the model.
+        input_tokens : int
+            Number of uncached input tokens.
+        output_tokens : int
+            Number of output tokens.
+        cache_create_tokens : int, optional
+            Number of input tokens written to the cache. Default is 0.
+        cache_read_tokens : int, optional
+            Number of input tokens read from the cache. Default is 0.
+
+        Returns
+        -------
+        float
+            The price in dollars.
+        """
+        return get_model_catalog().get_price(
+            self.provider,
+            model_name,
+            input_tokens,
+            output_tokens,
+            cache_create_tokens,
+            cache_read_tokens,
+        )
@@ -0,0 +1,174 @@
+"""
+Defines the immutable results returned by the chat model strategies: the token usage, the response itself,
+and the ChatStream and AsyncChatStream wrappers of streamed responses.
+"""
+
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Generator,
+    Iterator,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
+
+
+@dataclass(frozen=True)
+class Usage:
+    """
+    Token usage of a request, normalized across providers.
+
+    Attributes
+    ----------
+    input_tokens : int
+        Number of uncached input tokens.
+    output_tokens : int
+        Number of output tokens, reasoning tokens included.
+    cache_create_tokens : int
+        Number of input tokens written to the prompt cache.
+    cache_read_tokens : int
+        Number of input tokens read from the prompt cache.
+    reasoning_tokens : int
+        Number of hidden reasoning tokens among the output tokens.
+    """
+
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_create_tokens: int = 0
+    cache_read_tokens: int = 0
+    reasoning_tokens: int = 0
+
+    @property
+    def prompt_tokens(self) -> int:
+        """
+        Total number of input tokens, cached or not.
+        """
+        return self.input_tokens + self.cache_create_tokens + self.cache_read_tokens
+
+
+@dataclass(frozen=True)
+class ChatResponse:
+    """
+    Immutable result of a chat request.
+
+    Attributes
+    ----------
+    text : str
+        The generated response.
+    usage : Usage
+        Token usage of the request.
+    cost : float
+        Price of the request in dollars.
+    latency : float
+        Duration of the request in seconds.
+    provider : str
+        Name of the provider that answered.
+    model : str
+        Name of the model that answered.
+    metadata : Mapping[str, Any]
+        Provider-specific details (response id, finish reason, ...), read-only.
+    """
+
+    text: str
+    usage: Usage
+    cost: float
+    latency: float
+    provider: str
+    model: str
+    metadata: Mapping[str, Any] = field(default_factory=dict)
+
+    def __post_init__(self):
+        object.__setattr__(self, "metadata", MappingProxyType(dict(self.metadata)))
+
+    def __str__(self) -> str:
+        return self.text
+
+
+class ChatStream:
+    """
+    Iterator over the chunks of a streamed response.
+
+    Wraps a generator that yields the text chunks and returns the final ChatResponse.
+    The response is available in the `response` attribute once the stream is exhausted.
+
+    Parameters
+    ----------
+    generator : Generator[str, None, ChatResponse]
+        Generator yielding the chunks and returning the response.
+
+    Attributes
+    ----------
+    response : ChatResponse
+        The final response, None until the stream is exhausted.
+
+    Methods
+    -------
+    close()
+        Stops the stream, closing the underlying request.
+    """
+
+    def __init__(self, generator: Generator[str, None, ChatResponse]):
+        self.generator = generator
+        self.response: Optional[ChatResponse] = None
+
+    def __iter__(self) -> Iterator[str]:
+        self.response = yield from self.generator
+
+    def close(self) -> None:
+        """
+        Stops the stream, closing the underlying request.
+        """
+        self.generator.close()
+
+
+class AsyncChatStream:
+    """
+    Async iterator over the chunks of a streamed response.
+
+    Async generators cannot return a value, so the wrapped generator yields the text chunks followed by
+    the final ChatResponse. The response is available in the `response` attribute once the stream is exhausted.
+
+    Parameters
+    ----------
+    generator : AsyncGenerator[Union[str, ChatResponse], None]
+        Async generator yielding the chunks, then the response.
+
+    Attributes
+    ----------
+    response : ChatResponse
+        The final response, None until the stream is exhausted.
+    source : Tuple[ChatModelStrategy, str]
+        The strategy and the model generating the chunks, set by the composite strategies once they
+        have chosen a model. None for the streams of a single model.
+
+    Methods
+    -------
+    aclose()
+        Stops the stream, closing the underlying request.
+    """
+
+    def __init__(self, generator: AsyncGenerator[Union[str, ChatResponse], None]):
+        self.generator = generator
+        self.response: Optional[ChatResponse] = None
+        self.source: Optional[Tuple[Any, str]] = None
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        try:
+            async for item in self.generator:
+                if isinstance(item, ChatResponse):
+                    self.response = item
+                else:
+                    yield item
+        finally:
+            await self.generator.aclose()
+
+    async def aclose(self) -> None:
+        """
+        Stops the stream, closing the underlying request.
+        """
+        await self.generator.aclose()
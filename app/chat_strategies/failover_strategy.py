@@ -0,0 +1,386 @@
+"""
+Implements the FailoverChatStrategy, a composite strategy that sends a request to an ordered chain of
+equivalent models from different providers.
+The primary model is asked first; if it fails, or takes longer than its observed latency percentile (time to
+the first chunk when streaming), a hedged request is sent to the next model of the chain, and the first answer
+wins; the slower requests
+are cancelled, and the estimated price of their prompts is added to the cost of the answer.
+"""
+
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import time
+
+from chat_strategies.chat_model_strategy import ChatModelStrategy
+from chat_strategies.chat_response import AsyncChatStream, ChatResponse
+from chat_strategies.latency_tracker import (
+    FIRST_CHUNK,
+    RESPONSE,
+    LatencyTracker,
+    get_latency_tracker,
+)
+from chat_strategies.rate_limiter import estimate_prompt_tokens
+
+# Chain name -> ordered list of (strategy name, model name)
+DEFAULT_CHAINS: Dict[str, List[Tuple[str, str]]] = {
+    "gpt-4o > claude-3-5-sonnet > gemini-1.5-pro": [
+        ("OpenAI", "gpt-4o"),
+        ("Anthropic", "claude-3-5-sonnet-latest"),
+        ("Gemini", "gemini-1.5-pro-002"),
+    ],
+    "gpt-4o-mini > claude-3-haiku > gemini-1.5-flash": [
+        ("OpenAI", "gpt-4o-mini"),
+        ("Anthropic", "claude-3-haiku-20240307"),
+        ("Gemini", "gemini-1.5-flash-002"),
+    ],
+    "deepseek-chat > gpt-4o-mini": [
+        ("Deepseeker", "deepseek-chat"),
+        ("OpenAI", "gpt-4o-mini"),
+    ],
+}
+
+
+class FailoverChatStrategy(ChatModelStrategy):
+    """
+    A composite strategy hedging requests across an ordered chain of equivalent models.
+
+    Parameters
+    ----------
+    strategies : Dict[str, ChatModelStrategy]
+        Dictionary mapping strategy names to ChatModelStrategy instances (None if unavailable).
+    chains : Dict[str, List[Tuple[str, str]]], optional
+        Chain name -> ordered list of (strategy name, model name). Default is DEFAULT_CHAINS.
+    hedge_percentile : float, optional
+        Latency percentile of a model after which the next model is asked as well. Default is 95.
+    default_hedge_delay : float, optional
+        Hedge delay in seconds used until enough latencies are observed. Default is 30.
+    latency_tracker : LatencyTracker, optional
+        Latency statistics. Default is the process-wide tracker.
+
+    Attributes
+    ----------
+    chains : Dict[str, List[Tuple[str, str]]]
+        Available chains, restricted to the configured strategies.
+        Chains with less than two available models are dropped.
+
+    Methods
+    -------
+    get_models()
+        Returns the names of the available chains.
+    get_output_max_tokens(model_name)
+        Returns the maximum number of output tokens supported by every model of the chain.
+    async_send_message(system_prompt, messages, model_name, max_tokens, temperature)
+        Sends the message through the chain and returns the first response, with the chain name
+        in its metadata and the provider and model that actually answered.
+    async_stream_message(system_prompt, messages, model_name, max_tokens, temperature)
+        Streams the answer of the first model of the chain to send a chunk, hedging and failing over
+        until then.
+    estimate_price(model_name, input_tokens, output_tokens, cache_create_tokens, cache_read_tokens)
+        Computes the price of a request answered by the primary model of the chain.
+    """
+
+    def __init__(
+        self,
+        strategies: Dict[str, Optional[ChatModelStrategy]],
+        chains: Dict[str, List[Tuple[str, str]]] = None,
+        hedge_percentile: float = 95,
+        default_hedge_delay: float = 30.0,
+        latency_tracker: LatencyTracker = None,
+    ):
+        self.strategies = strategies
+        self.chains = {}
+        for chain_name, chain in (chains or DEFAULT_CHAINS).items():
+            available = [
+                (strategy_name, model_name)
+                for strategy_name, model_name in chain
+                if strategies.get(strategy_name)
+                and model_name in strategies[strategy_name].get_models()
+            ]
+            # A chain needs at least two models to fail over
+            if len(available) > 1:
+                self.chains[chain_name] = available
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.latency_tracker = latency_tracker or get_latency_tracker()
+
+    def get_models(self) -> List[str]:
+        return list(self.chains)
+
+    def get_output_max_tokens(self, model_name: str) -> int:
+        return min(
+            self.strategies[strategy_name].get_output_max_tokens(member_model)
+            for strategy_name, member_model in self.chains[model_name]
+        )
+
+    @property
+    def supports_prompt_cache(self) -> bool:
+        # Caching depends on the chain member, assume none to stay on the safe side
+        return False
+
+    def estimate_price(
+        self,
+        model_name: str,
+        input_tokens: int,
+        output_tokens: int,
+        cache_create_tokens: int = 0,
+        cache_read_tokens: int = 0,
+    ) -> float:
+        strategy_name, member_model = self.chains[model_name][0]
+        return self.strategies[strategy_name].estimate_price(
+            member_model,
+            input_tokens,
+            output_tokens,
+            cache_create_tokens,
+            cache_read_tokens,
+        )
+
+    def _hedge_delay(
+        self, strategy_name: str, model_name: str, metric: str = RESPONSE
+    ) -> float:
+        """
+        Returns how long to wait for a model before hedging to the next one: for its response, or for
+        the first chunk of its stream.
+        """
+        latency = self.latency_tracker.percentile(
+            strategy_name, model_name, self.hedge_percentile, metric=metric
+        )
+        return self.default_hedge_delay if latency is None else latency
+
+    async def _call(
+        self,
+        strategy_name: str,
+        model_name: str,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+    ) -> ChatResponse:
+        """
+        Sends the message to one model of the chain and records its latency.
+        """
+        strategy = self.strategies[strategy_name]
+        started = time.monotonic()
+        try:
+            response = await strategy.async_send_message(
+                system_prompt=system_prompt,
+                messages=messages,
+                model_name=model_name,
+                max_tokens=max_tokens,
+                temperature=temperature,
+            )
+        except asyncio.CancelledError:
+            # A lost hedge says nothing about the health of the model
+            raise
+        except Exception:
+            self.latency_tracker.record(
+                strategy_name, model_name, time.monotonic() - started, success=False
+            )
+            raise
+        self.latency_tracker.record(
+            strategy_name, model_name, time.monotonic() - started
+        )
+        return response
+
+    def _hedge_cost(
+        self, cancelled: List[Tuple[str, str]], prompt_tokens: int
+    ) -> float:
+        """
+        Returns the estimated price of the cancelled requests, whose prompt the providers may have billed.
+        """
+        return sum(
+            self.strategies[strategy_name].estimate_price(
+                member_model, prompt_tokens, 0
+            )
+            for strategy_name, member_model in cancelled
+        )
+
+    def _finish(
+        self,
+        response: ChatResponse,
+        model_name: str,
+        cancelled: List[Tuple[str, str]],
+        prompt_tokens: int,
+    ) -> ChatResponse:
+        """
+        Adds the chain name and the estimated price of the cancelled hedges to the winning response.
+        """
+        metadata = {**response.metadata, "chain": model_name}
+        if not cancelled:
+            return replace(response, metadata=metadata)
+        hedge_cost = self._hedge_cost(cancelled, prompt_tokens)
+        metadata["cancelled_hedges"] = [
+            f"{strategy_name} - {member_model}"
+            for strategy_name, member_model in cancelled
+        ]
+        metadata["hedge_cost"] = hedge_cost
+        return replace(response, cost=response.cost + hedge_cost, metadata=metadata)
+
+    def _member_max_tokens(
+        self, strategy_name: str, member_model: str, max_tokens: int
+    ) -> int:
+        return min(
+            max_tokens,
+            self.strategies[strategy_name].get_output_max_tokens(member_model),
+        )
+
+    async def async_send_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> ChatResponse:
+        chain = list(self.chains[model_name])
+        pending: Dict[asyncio.Task, Tuple[str, str]] = {}
+        prompt_tokens = estimate_prompt_tokens(system_prompt, messages)
+        last_error = None
+
+        def hedge() -> None:
+            strategy_name, member_model = chain.pop(0)
+            task = asyncio.create_task(
+                self._call(
+                    strategy_name,
+                    member_model,
+                    system_prompt,
+                    messages,
+                    self._member_max_tokens(strategy_name, member_model, max_tokens),
+                    temperature,
+                )
+            )
+            pending[task] = (strategy_name, member_model)
+
+        hedge()
+        try:
+            while pending:
+                # Wait for the newest request up to its latency percentile before hedging
+                timeout = (
+                    self._hedge_delay(*pending[list(pending)[-1]]) if chain else None
+                )
+                done, _ = await asyncio.wait(
+                    list(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedge()
+                    continue
+
+                for task in done:
+                    del pending[task]
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        continue
+                    return self._finish(
+                        task.result(), model_name, list(pending.values()), prompt_tokens
+                    )
+
+                # Fail over to the next model right away
+                if chain:
+                    hedge()
+        finally:
+            # The slower requests are not needed anymore
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+    def async_stream_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> AsyncChatStream:
+        async def generate():
+            chain = list(self.chains[model_name])
+            # First chunk task -> (strategy name, model name, chunk iterator, stream, start time)
+            pending: Dict[
+                asyncio.Task, Tuple[str, str, Any, AsyncChatStream, float]
+            ] = {}
+            prompt_tokens = estimate_prompt_tokens(system_prompt, messages)
+            last_error = None
+
+            def hedge() -> None:
+                strategy_name, member_model = chain.pop(0)
+                stream = self.strategies[strategy_name].async_stream_message(
+                    system_prompt=system_prompt,
+                    messages=messages,
+                    model_name=member_model,
+                    max_tokens=self._member_max_tokens(
+                        strategy_name, member_model, max_tokens
+                    ),
+                    temperature=temperature,
+                )
+                chunks = stream.__aiter__()
+                task = asyncio.create_task(chunks.__anext__())
+                pending[task] = (
+                    strategy_name,
+                    member_model,
+                    chunks,
+                    stream,
+                    time.monotonic(),
+                )
+
+            hedge()
+            winner = None
+            try:
+                # The first model to send a chunk wins, the others are cancelled
+                while pending and winner is None:
+                    timeout = (
+                        self._hedge_delay(
+                            *pending[list(pending)[-1]][:2], metric=FIRST_CHUNK
+                        )
+                        if chain
+                        else None
+                    )
+                    done, _ = await asyncio.wait(
+                        list(pending),
+                        timeout=timeout,
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                    if not done:
+                        hedge()
+                        continue
+                    for task in done:
+                        member = pending.pop(task)
+                        error = task.exception()
+                        if error is None or isinstance(error, StopAsyncIteration):
+                            winner = (task, member)
+                            self.latency_tracker.record(
+                                *member[:2],
+                                time.monotonic() - member[4],
+                                metric=FIRST_CHUNK,
+                            )
+                            break
+                        self.latency_tracker.record(
+                            *member[:2],
+                            time.monotonic() - member[4],
+                            success=False,
+                            metric=FIRST_CHUNK,
+                        )
+                        last_error = error
+                    if winner is None and chain:
+                        hedge()
+            finally:
+                cancelled = [member[:2] for member in pending.values()]
+                for task in pending:
+                    task.cancel()
+
+            if winner is None:
+                raise last_error
+            task, (strategy_name, member_model, chunks, stream, _) = winner
+            result.source = stream.source or (
+                self.strategies[strategy_name],
+                member_model,
+            )
+            # A partial answer cannot be continued by another model, later errors are raised.
+            # The stream duration is not recorded, it would skew the response latencies.
+            if task.exception() is None:
+                yield task.result()
+                async for chunk in chunks:
+                    yield chunk
+            yield self._finish(stream.response, model_name, cancelled, prompt_tokens)
+
+        result = AsyncChatStream(generate())
+        return result
@@ -0,0 +1,303 @@
+"""
+Implements the context cache of the GeminiChatStrategy: the system prompt and the context block of a
+conversation are stored once per version as a Gemini cached content, and reused by the following requests
+while its TTL is refreshed.
+
+Gemini bills the cached tokens at a reduced rate, plus their storage per hour. The backend creating the
+cached contents is pluggable, `LocalCacheBackend` is an offline stand-in of the caching endpoint.
+"""
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import concurrent.futures
+import datetime
+import hashlib
+import itertools
+import json
+import threading
+import time
+
+import google.generativeai as genai
+
+from managers.file_manager import num_tokens_from_content
+
+# Lifetime of a cached content, refreshed at every use
+DEFAULT_CACHE_TTL = 600
+# A cached content expiring sooner is refreshed before use, so it cannot expire during the request
+EXPIRY_MARGIN = 30
+
+
+class CachedContext:
+    """
+    A cached content holding the system prompt and the context block of a conversation.
+
+    Parameters
+    ----------
+    handle : Any
+        The backend object or name of the cached content.
+    model_name : str
+        The model the content is cached for.
+    tokens : int
+        Number of cached tokens.
+    expires : float
+        time.time() when the cached content expires.
+    """
+
+    __slots__ = ("handle", "model_name", "tokens", "expires")
+
+    def __init__(self, handle: Any, model_name: str, tokens: int, expires: float):
+        self.handle = handle
+        self.model_name = model_name
+        self.tokens = tokens
+        self.expires = expires
+
+
+class GenaiCacheBackend:
+    """
+    Creates the cached contents with the Gemini caching API.
+
+    Methods
+    -------
+    create(model_name, system_prompt, contents, ttl) -> Tuple[Any, int]
+        Creates a cached content and returns its handle and number of tokens.
+    extend(handle, ttl) -> None
+        Sets the remaining lifetime of a cached content.
+    model(entry: CachedContext) -> Tuple[genai.GenerativeModel, List[Dict[str, Any]]]
+        Returns the model generating from a cached content and the history to prepend.
+    cached_tokens(usage_metadata, entry: CachedContext) -> int
+        Returns the number of prompt tokens read from the cache.
+    """
+
+    async def create(
+        self,
+        model_name: str,
+        system_prompt: str,
+        contents: List[Dict[str, Any]],
+        ttl: float,
+    ) -> Tuple[Any, int]:
+        # The SDK calls are blocking
+        cached_content = await asyncio.to_thread(
+            genai.caching.CachedContent.create,
+            model=f"models/{model_name}",
+            system_instruction=system_prompt or None,
+            contents=contents,
+            ttl=datetime.timedelta(seconds=ttl),
+        )
+        return cached_content, cached_content.usage_metadata.total_token_count
+
+    async def extend(self, handle: Any, ttl: float) -> None:
+        await asyncio.to_thread(handle.update, ttl=datetime.timedelta(seconds=ttl))
+
+    def model(
+        self, entry: CachedContext
+    ) -> Tuple[genai.GenerativeModel, List[Dict[str, Any]]]:
+        return (
+            genai.GenerativeModel.from_cached_content(cached_content=entry.handle),
+            [],
+        )
+
+    def cached_tokens(self, usage_metadata: Any, entry: CachedContext) -> int:
+        return getattr(usage_metadata, "cached_content_token_count", 0) or 0
+
+
+class LocalCacheBackend(GenaiCacheBackend):
+    """
+    Offline stand-in of the Gemini caching endpoint, for tests.
+
+    The cached contents are kept in memory and sent with every request, their tokens are reported as
+    read from the cache, as the caching API would.
+    """
+
+    def __init__(self):
+        self.contents: Dict[str, Tuple[str, List[Dict[str, Any]]]] = {}
+        self.counter = itertools.count(1)
+
+    async def create(
+        self,
+        model_name: str,
+        system_prompt: str,
+        contents: List[Dict[str, Any]],
+        ttl: float,
+    ) -> Tuple[Any, int]:
+        name = f"cachedContents/local-{next(self.counter)}"
+        self.contents[name] = (system_prompt, contents)
+        tokens = num_tokens_from_content(system_prompt) + sum(
+            num_tokens_from_content(part)
+            for content in contents
+            for part in content["parts"]
+        )
+        return name, tokens
+
+    async def extend(self, handle: Any, ttl: float) -> None:
+        pass
+
+    def model(
+        self, entry: CachedContext
+    ) -> Tuple[genai.GenerativeModel, List[Dict[str, Any]]]:
+        system_prompt, contents = self.contents[entry.handle]
+        return (
+            genai.GenerativeModel(
+                entry.model_name, system_instruction=system_prompt or None
+            ),
+            contents,
+        )
+
+    def cached_tokens(self, usage_metadata: Any, entry: CachedContext) -> int:
+        return entry.tokens
+
+
+class GeminiContextCache:
+    """
+    Class for the cached contents of the conversations, shared by the requests of all sessions.
+
+    A prefix requested again while its content is being created waits for that creation instead of
+    creating and paying for a second content.
+
+    Parameters
+    ----------
+    backend : GenaiCacheBackend, optional
+        The backend creating the cached contents. Default is the Gemini caching API.
+    ttl : float, optional
+        Lifetime of a cached content in seconds, refreshed at every use. Default is DEFAULT_CACHE_TTL.
+
+    Methods
+    -------
+    acquire(model_name, system_prompt, contents, call) -> Tuple[CachedContext, bool, float]
+        Returns the cached content of a prefix, created or refreshed as needed.
+    evict(model_name, system_prompt, contents) -> None
+        Forgets the cached content of a prefix, e.g. when the API no longer knows it.
+    """
+
+    def __init__(
+        self, backend: GenaiCacheBackend = None, ttl: float = DEFAULT_CACHE_TTL
+    ):
+        self.backend = backend or GenaiCacheBackend()
+        self.ttl = ttl
+        self.entries: Dict[str, CachedContext] = {}
+        # Creations in flight per prefix, resolved to the created content or None if it failed.
+        # Thread futures, as the sessions run their requests on different event loops.
+        self.pending: Dict[str, concurrent.futures.Future] = {}
+        self.lock = threading.Lock()
+
+    def _key(
+        self, model_name: str, system_prompt: str, contents: List[Dict[str, Any]]
+    ) -> str:
+        data = json.dumps([model_name, system_prompt, contents], ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    async def acquire(
+        self,
+        model_name: str,
+        system_prompt: str,
+        contents: List[Dict[str, Any]],
+        call: Callable[[Callable[[], Awaitable[Any]]], Awaitable[Any]],
+    ) -> Tuple[CachedContext, bool, float]:
+        """
+        Returns the cached content of a prefix, created or refreshed as needed.
+
+        Parameters
+        ----------
+        model_name : str
+            The model the content is cached for.
+        system_prompt : str
+            The system prompt.
+        contents : List[Dict[str, Any]]
+            The cached messages, as Gemini contents.
+        call : Callable[[Callable[[], Awaitable[Any]]], Awaitable[Any]]
+            Runs a backend call, e.g. through the rate limiter of the model.
+
+        Returns
+        -------
+        Tuple[CachedContext, bool, float]
+            The cached content, whether it was created, and the storage time in seconds billed by this call:
+            the TTL for a new content, the extension of the lifetime for a reused one.
+        """
+        key = self._key(model_name, system_prompt, contents)
+        while True:
+            now = time.time()
+            with self.lock:
+                # Expired contents are forgotten, the API deletes them
+                for stale_key in [
+                    k for k, e in self.entries.items() if e.expires <= now
+                ]:
+                    del self.entries[stale_key]
+                entry: Optional[CachedContext] = self.entries.get(key)
+                pending = self.pending.get(key) if entry is None else None
+                if entry is None and pending is None:
+                    creation = self.pending[key] = concurrent.futures.Future()
+                    break
+            if entry is not None:
+                break
+            # Shielded, so that a cancelled waiter does not cancel the creation awaited by the others
+            created_entry = await asyncio.shield(asyncio.wrap_future(pending))
+            if created_entry is not None:
+                return created_entry, False, 0.0
+            # The creation failed, this request creates the content in turn
+
+        if entry is None:
+            try:
+                handle, tokens = await call(
+                    lambda: self.backend.create(
+                        model_name, system_prompt, contents, self.ttl
+                    )
+                )
+                entry = CachedContext(
+                    handle, model_name, tokens, time.time() + self.ttl
+                )
+                with self.lock:
+                    self.entries[key] = entry
+            finally:
+                with self.lock:
+                    self.pending.pop(key, None)
+                creation.set_result(entry)
+            return entry, True, self.ttl
+
+        # The lifetime is extended at every use, billed for the added time only
+        if entry.expires - now < EXPIRY_MARGIN + self.ttl / 2:
+            await call(lambda: self.backend.extend(entry.handle, self.ttl))
+            extension = max(0.0, now + self.ttl - entry.expires)
+            entry.expires = now + self.ttl
+            return entry, False, extension
+        return entry, False, 0.0
+
+    def evict(
+        self, model_name: str, system_prompt: str, contents: List[Dict[str, Any]]
+    ) -> None:
+        """
+        Forgets the cached content of a prefix, e.g. when the API no longer knows it.
+
+        Parameters
+        ----------
+        model_name : str
+            The model the content is cached for.
+        system_prompt : str
+            The system prompt.
+        contents : List[Dict[str, Any]]
+            The cached messages, as Gemini contents.
+        """
+        with self.lock:
+            self.entries.pop(self._key(model_name, system_prompt, contents), None)
+
+
+_context_cache = None
+_context_cache_lock = threading.Lock()
+
+
+def get_gemini_context_cache() -> GeminiContextCache:
+    """
+    Returns the process-wide context cache, created on first use.
+
+    The strategies are recreated on every rerun, the cached contents are kept here so that the following
+    requests reuse them.
+
+    Returns
+    -------
+    GeminiContextCache
+        The context cache using the Gemini caching API, shared by all sessions.
+    """
+    global _context_cache  # pylint: disable=global-statement
+    if _context_cache is None:
+        with _context_cache_lock:
+            if _context_cache is None:
+                _context_cache = GeminiContextCache()
+    return _context_cache
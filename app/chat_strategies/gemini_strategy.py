@@ -3,10 +3,19 @@ Implements the GeminiChatStrategy, a concrete strategy for interacting with the
 This strategy adheres to the ChatModelStrategy interface and encapsulates Gemini-specific functionality.
 """
 
-from typing import List, Dict
+from typing import Any, Dict, List, Optional, Tuple
+import dataclasses
+import time
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from chat_strategies.chat_response import AsyncChatStream, ChatResponse, Usage
 from chat_strategies.chat_model_strategy import ChatModelStrategy
-from chat_strategies.model import Model
+from chat_strategies.gemini_cache import (
+    GeminiContextCache,
+    get_gemini_context_cache,
+)
+from chat_strategies.model_catalog import get_model_catalog
+from chat_strategies.rate_limiter import estimate_prompt_tokens, get_rate_limiter
 
 
 class GeminiChatStrategy(ChatModelStrategy):
@@ -17,6 +26,9 @@ class GeminiChatStrategy(ChatModelStrategy):
     ----------
     api_key : str
         The API key for accessing the Google Gemini API.
+    context_cache : GeminiContextCache, optional
+        The cache of the system prompt and context of the conversations. Default is the process-wide
+        cache using the Gemini caching API.
 
     Attributes
     ----------
@@ -24,14 +36,10 @@ class GeminiChatStrategy(ChatModelStrategy):
         The API key for accessing the Google Gemini API.
     models : List[Model]
         A list of available Gemini models.
-    client : genai.GenerativeModel
-        The Gemini client instance for making API requests.
-    input_tokens : int
-        The number of input tokens used in the last API request.
-    output_tokens : int
-        The number of output tokens generated in the last API response.
-    model : str
-        The name of the model used in the last API request.
+    catalog : ModelCatalog
+        The process-wide model catalog with the models, limits and prices.
+    context_cache : GeminiContextCache
+        The cache of the system prompt and context of the conversations.
 
     Methods
     -------
@@ -39,16 +47,17 @@ class GeminiChatStrategy(ChatModelStrategy):
         Returns a list of available model names.
     get_output_max_tokens(model_name)
         Returns the maximum number of output tokens for the specified model.
-    get_input_tokens()
-        Returns the number of input tokens used in the last API request.
-    get_output_tokens()
-        Returns the number of output tokens generated in the last API response.
-    get_full_price()
-        Calculates and returns the total price based on the input and output tokens.
-    send_message(system_prompt, messages, model_name, max_tokens, temperature)
+    async_send_message(system_prompt, messages, model_name, max_tokens, temperature)
         Sends a message to the Gemini API and returns the generated response.
+    async_stream_message(system_prompt, messages, model_name, max_tokens, temperature)
+        Sends a message to the Gemini API and returns a stream of the generated response.
     """
 
+    provider = "Gemini"
+    supports_prompt_cache = True
+    # Minimum size of a Gemini 1.5 cached content
+    prompt_cache_min_tokens = 32768
+
     # Gemini 1.5 Pro - models/gemini-1.5-pro
     # Price (input)
     # $1.25 / 1 million tokens (for prompts up to 128K tokens)
@@ -75,91 +84,253 @@ class GeminiChatStrategy(ChatModelStrategy):
     # Context caching (storage)
     # $1.00 / 1 million tokens per hour
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, context_cache: GeminiContextCache = None):
         self.api_key = api_key
         genai.configure(api_key=self.api_key)
-        self.models = [
-            Model(
-                name="gemini-1.5-pro-002",
-                output_max_tokens=8192,
-                price_input=1.25,
-                price_output=5.0,
-            ),
-            Model(
-                name="gemini-1.5-flash-002",
-                output_max_tokens=8192,
-                price_input=0.075,
-                price_output=0.3,
-            ),
-        ]
-
-        self.client = None
-        self.input_tokens = 0
-        self.output_tokens = 0
-        self.cache_create_tokens = 0
-        self.cache_read_tokens = 0
-        self.model = None
+        self.catalog = get_model_catalog()
+        self.models = self.catalog.get_models(self.provider)
+        self.context_cache = context_cache or get_gemini_context_cache()
 
     def get_models(self) -> List[str]:
-        return [model.name for model in self.models]
+        return self.catalog.get_model_names(self.provider)
 
     def get_output_max_tokens(self, model_name: str) -> int:
-        return self.models[self.get_models().index(model_name)].output_max_tokens
+        return self.catalog.get_model(self.provider, model_name).output_max_tokens
 
-    def get_input_tokens(self) -> int:
-        return self.input_tokens
+    def _contents(self, messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Converts the messages to Gemini contents.
+        """
+        return [
+            {
+                "role": "model" if message["role"] == "assistant" else "user",
+                "parts": [message["content"]],
+            }
+            for message in messages
+        ]
 
-    def get_output_tokens(self) -> int:
-        return self.output_tokens
+    def _cached_prefix(self, system_prompt: str, messages: List[Dict[str, str]]) -> int:
+        """
+        Returns the number of leading messages read from the context cache, 0 if the prefix is not cached.
 
-    def get_cache_create_tokens(self) -> int:
-        return self.cache_create_tokens
+        The first exchange of a conversation holds the context, it is cached with the system prompt
+        once it reaches the minimum size of a cached content.
+        """
+        if (
+            len(messages) < 3
+            or messages[0]["role"] != "user"
+            or messages[1]["role"] != "assistant"
+        ):
+            return 0
+        prefix_tokens = estimate_prompt_tokens(system_prompt, messages[:2])
+        return 2 if prefix_tokens >= self.prompt_cache_min_tokens else 0
 
-    def get_cache_read_tokens(self) -> int:
-        return self.cache_read_tokens
+    async def _send_chat(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float,
+        estimated_tokens: int,
+        stream: bool = False,
+        retry: bool = True,
+    ) -> Tuple[Any, Optional[Dict[str, Any]]]:
+        """
+        Sends the chat through the rate limiter of the model, with the context read from the context cache
+        when it is large enough.
+
+        A cached content unknown to the API is created again and the chat sent once more, if `retry`.
+
+        Returns
+        -------
+        Tuple[Any, Optional[Dict[str, Any]]]
+            The API response, and the cached content used with whether it was created and the billed
+            storage time, None if the request was not cached.
+        """
+        rate_limiter = get_rate_limiter(self.provider, model_name)
+        contents = self._contents(messages)
+        prefix = self._cached_prefix(system_prompt, messages)
+        cache = None
+        if prefix:
+            entry, created, storage_seconds = await self.context_cache.acquire(
+                model_name,
+                system_prompt,
+                contents[:prefix],
+                lambda call: rate_limiter.async_call(
+                    call, estimated_tokens=estimated_tokens
+                ),
+            )
+            client, history = self.context_cache.backend.model(entry)
+            history = history + contents[prefix:-1]
+            cache = {
+                "entry": entry,
+                "created": created,
+                "storage_seconds": storage_seconds,
+            }
+        else:
+            client = genai.GenerativeModel(
+                model_name, system_instruction=system_prompt or None
+            )
+            history = contents[:-1]
 
-    def get_full_price(self) -> float:
-        inputs = (
-            self.input_tokens
-            * self.models[self.get_models().index(self.model)].price_input
-            / 1_000_000.0
+        async def send_chat():
+            chat = client.start_chat(history=history)
+            return await chat.send_message_async(
+                contents[-1]["parts"],
+                generation_config=genai.types.GenerationConfig(
+                    max_output_tokens=max_tokens, temperature=temperature
+                ),
+                stream=stream,
+            )
+
+        try:
+            response = await rate_limiter.async_call(
+                send_chat, estimated_tokens=estimated_tokens
+            )
+        except google_exceptions.NotFound:
+            if not cache or not retry:
+                raise
+            # The cached content was deleted or expired early, it is created again
+            self.context_cache.evict(model_name, system_prompt, contents[:prefix])
+            return await self._send_chat(
+                system_prompt,
+                messages,
+                model_name,
+                max_tokens,
+                temperature,
+                estimated_tokens,
+                stream,
+                retry=False,
+            )
+        return response, cache
+
+    def _usage(self, usage_metadata, cache: Optional[Dict[str, Any]] = None) -> Usage:
+        """
+        Normalizes the usage reported by the API.
+
+        The prompt token count includes the tokens read from the cached content. The creation of a
+        cached content is reported as cache creation tokens.
+        """
+        cached_tokens = 0
+        cache_create_tokens = 0
+        if cache:
+            entry = cache["entry"]
+            cached_tokens = self.context_cache.backend.cached_tokens(
+                usage_metadata, entry
+            )
+            if cache["created"]:
+                cache_create_tokens = entry.tokens
+        return Usage(
+            input_tokens=usage_metadata.prompt_token_count - cached_tokens,
+            output_tokens=usage_metadata.candidates_token_count,
+            cache_create_tokens=cache_create_tokens,
+            cache_read_tokens=cached_tokens,
         )
-        outputs = (
-            self.output_tokens
-            * self.models[self.get_models().index(self.model)].price_output
-            / 1_000_000.0
+
+    def _finish_response(
+        self,
+        text: str,
+        usage_metadata,
+        model_name: str,
+        started: float,
+        estimated_tokens: int,
+        cache: Optional[Dict[str, Any]],
+    ) -> ChatResponse:
+        """
+        Builds the response, with the storage of the cached content billed by the request.
+        """
+        # A created content is counted twice in the usage, once created and once read
+        response = self._build_response(
+            text,
+            self._usage(usage_metadata, cache),
+            model_name,
+            started,
+            local_prompt_tokens=(
+                None if cache and cache["created"] else estimated_tokens
+            ),
+        )
+        if not cache:
+            return response
+
+        entry = cache["entry"]
+        storage_cost = self.catalog.get_storage_price(
+            self.provider, model_name, entry.tokens, cache["storage_seconds"]
+        )
+        return dataclasses.replace(
+            response,
+            cost=response.cost + storage_cost,
+            metadata={
+                "cached_content": getattr(entry.handle, "name", entry.handle),
+                "cache_expires_in": round(entry.expires - time.time()),
+                "cache_storage_cost": storage_cost,
+            },
         )
-        return inputs + outputs
 
-    def send_message(
+    async def async_send_message(
         self,
         system_prompt: str,
         messages: List[Dict[str, str]],
         model_name: str,
         max_tokens: int,
         temperature: float = 0,
-    ) -> str:
-        self.model = model_name
-        self.client = genai.GenerativeModel(model_name)
+    ) -> ChatResponse:
+        started = time.monotonic()
+        estimated_tokens = estimate_prompt_tokens(system_prompt, messages)
 
-        chat = self.client.start_chat(history=[])
+        response, cache = await self._send_chat(
+            system_prompt,
+            messages,
+            model_name,
+            max_tokens,
+            temperature,
+            estimated_tokens,
+        )
 
-        # Add system prompt
-        chat.send_message(system_prompt)
+        return self._finish_response(
+            response.text,
+            response.usage_metadata,
+            model_name,
+            started,
+            estimated_tokens,
+            cache,
+        )
 
-        # Add previous messages
-        for message in messages:
-            chat.send_message(message["content"])
+    def async_stream_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> AsyncChatStream:
+        async def generate():
+            started = time.monotonic()
+            estimated_tokens = estimate_prompt_tokens(system_prompt, messages)
+            response, cache = await self._send_chat(
+                system_prompt,
+                messages,
+                model_name,
+                max_tokens,
+                temperature,
+                estimated_tokens,
+                stream=True,
+            )
 
-        # Send the last user message and get the response
-        response = chat.send_message(
-            messages[-1]["content"],
-            generation_config=genai.types.GenerationConfig(
-                max_output_tokens=max_tokens, temperature=temperature
-            ),
-        )
+            chunks = []
+            async for chunk in response:
+                if chunk.parts:
+                    chunks.append(chunk.text)
+                    yield chunks[-1]
 
-        self.input_tokens = response.usage_metadata.prompt_token_count
-        self.output_tokens = response.usage_metadata.candidates_token_count
+            # The usage of a streamed response is complete once it is exhausted
+            yield self._finish_response(
+                "".join(chunks),
+                response.usage_metadata,
+                model_name,
+                started,
+                estimated_tokens,
+                cache,
+            )
 
-        return response.text
+        return AsyncChatStream(generate())
@@ -0,0 +1,260 @@
+"""
+Implements the GenerationJob, which streams a response in the background on the shared event loop so the
+Streamlit script stays responsive and the generation can be stopped.
+Stopping cancels the upstream stream, which closes the HTTP connection and ends the billed generation,
+and keeps the partial output with an estimate of its usage.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import threading
+import time
+
+from chat_strategies.async_adapter import get_event_loop
+from chat_strategies.chat_model_strategy import ChatModelStrategy
+from chat_strategies.chat_response import ChatResponse, Usage
+from chat_strategies.rate_limiter import estimate_prompt_tokens
+from chat_strategies.token_calibrator import get_token_calibrator
+from managers.file_manager import num_tokens_from_content
+
+
+class GenerationJob:
+    """
+    A streamed chat request running in the background.
+
+    Parameters
+    ----------
+    strategy : ChatModelStrategy
+        The strategy the request is sent with.
+    strategy_name : str
+        Name of the strategy, kept for logging.
+    system_prompt : str
+        The system prompt.
+    messages : List[Dict[str, str]]
+        The messages of the request, context included.
+    model_name : str
+        The name of the model.
+    max_tokens : int
+        The maximum number of output tokens.
+    temperature : float, optional
+        The temperature of the generation. Default is 0.
+    cached_prefix : bool, optional
+        Whether the prompt before the last message was sent before, and is read from the prompt cache
+        rather than written to it. Only used to estimate the usage of a stopped generation. Default is False.
+
+    Attributes
+    ----------
+    response : ChatResponse
+        The final response, with estimated usage if the generation was stopped. None until finished.
+    error : Exception
+        The error that ended the generation, if any.
+    stopped : bool
+        Whether the generation was stopped before completion.
+
+    Methods
+    -------
+    start()
+        Starts the generation on the background event loop.
+    stop()
+        Stops the generation and waits for the partial response.
+    done() -> bool
+        Returns whether the generation is finished.
+    wait(timeout) -> bool
+        Waits for the generation to finish.
+    get_text() -> str
+        Returns the text generated so far.
+    """
+
+    def __init__(
+        self,
+        strategy: ChatModelStrategy,
+        strategy_name: str,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+        cached_prefix: bool = False,
+    ):
+        self.strategy = strategy
+        self.strategy_name = strategy_name
+        self.system_prompt = system_prompt
+        self.messages = messages
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.cached_prefix = cached_prefix
+        self.stream = None
+        self.chunks: List[str] = []
+        self.response: Optional[ChatResponse] = None
+        self.error: Optional[Exception] = None
+        self.stopped = False
+        self.started = None
+        self.loop = None
+        self.task = None
+        self.finished = threading.Event()
+
+    def start(self) -> None:
+        """
+        Starts the generation on the background event loop.
+        """
+        self.started = time.monotonic()
+        self.loop = get_event_loop()
+        self.loop.call_soon_threadsafe(self._start_task)
+
+    def stop(self) -> None:
+        """
+        Stops the generation and waits for the partial response.
+        """
+        if self.loop is None or self.finished.is_set():
+            return
+        self.stopped = True
+        # Runs after _start_task, the loop handles the callbacks in order
+        self.loop.call_soon_threadsafe(lambda: self.task.cancel())
+        self.finished.wait()
+
+    def done(self) -> bool:
+        """
+        Returns whether the generation is finished.
+
+        Returns
+        -------
+        bool
+            True once the response or the error is available.
+        """
+        return self.finished.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Waits for the generation to finish.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum time to wait in seconds. Default is None (no limit).
+
+        Returns
+        -------
+        bool
+            Whether the generation is finished.
+        """
+        return self.finished.wait(timeout)
+
+    def get_text(self) -> str:
+        """
+        Returns the text generated so far.
+
+        Returns
+        -------
+        str
+            The generated text.
+        """
+        # list() copies the chunks atomically, the loop thread may be appending
+        return "".join(list(self.chunks))
+
+    def _start_task(self) -> None:
+        self.task = self.loop.create_task(self._run())
+        self.task.add_done_callback(self._on_task_done)
+
+    def _on_task_done(self, task: asyncio.Task) -> None:
+        # A task cancelled before its first step never enters _run
+        if task.cancelled() and not self.finished.is_set():
+            self.response = self._partial_response()
+            self.finished.set()
+
+    async def _run(self) -> None:
+        self.stream = stream = self.strategy.async_stream_message(
+            system_prompt=self.system_prompt,
+            messages=self.messages,
+            model_name=self.model_name,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+        )
+        try:
+            async for chunk in stream:
+                self.chunks.append(chunk)
+            self.response = stream.response
+        except asyncio.CancelledError:
+            # Leaving the stream closed the upstream connection
+            self.response = self._partial_response()
+        except Exception as e:  # pylint: disable=broad-except
+            self.error = e
+        finally:
+            self.finished.set()
+
+    def _source(self) -> Tuple[ChatModelStrategy, str]:
+        """
+        Returns the strategy and the model that streamed, the member chosen by a composite strategy.
+        """
+        if self.stream is not None and self.stream.source is not None:
+            return self.stream.source
+        return self.strategy, self.model_name
+
+    def _partial_usage(
+        self, strategy: ChatModelStrategy, model_name: str, text: str
+    ) -> Usage:
+        """
+        Estimates the usage of a stopped generation, the prompt prefix being read from or written to the
+        prompt cache as in CostEstimator.estimate.
+        """
+        # The prompt is billed once the provider has started generating
+        if not self.chunks:
+            return Usage()
+        prefix_tokens = estimate_prompt_tokens(self.system_prompt, self.messages[:-1])
+        new_tokens = (
+            num_tokens_from_content(self.messages[-1]["content"])
+            if self.messages
+            else 0
+        )
+
+        # The calibration corrects the whole prompt, split back proportionally
+        local_tokens = prefix_tokens + new_tokens
+        calibrated_tokens = get_token_calibrator().correct(
+            strategy.provider, model_name, local_tokens
+        )
+        if calibrated_tokens != local_tokens:
+            new_tokens = round(new_tokens * calibrated_tokens / local_tokens)
+            prefix_tokens = calibrated_tokens - new_tokens
+
+        output_tokens = num_tokens_from_content(text)
+        if (
+            not strategy.supports_prompt_cache
+            or prefix_tokens < strategy.prompt_cache_min_tokens
+        ):
+            return Usage(
+                input_tokens=prefix_tokens + new_tokens, output_tokens=output_tokens
+            )
+        if self.cached_prefix:
+            return Usage(
+                input_tokens=new_tokens,
+                output_tokens=output_tokens,
+                cache_read_tokens=prefix_tokens,
+            )
+        return Usage(
+            input_tokens=new_tokens,
+            output_tokens=output_tokens,
+            cache_create_tokens=prefix_tokens,
+        )
+
+    def _partial_response(self) -> ChatResponse:
+        """
+        Builds the response of a stopped generation, estimating its usage with the local tokenizer.
+        """
+        text = self.get_text()
+        strategy, model_name = self._source()
+        usage = self._partial_usage(strategy, model_name, text)
+        return ChatResponse(
+            text=text,
+            usage=usage,
+            cost=strategy.estimate_price(
+                model_name,
+                usage.input_tokens,
+                usage.output_tokens,
+                usage.cache_create_tokens,
+                usage.cache_read_tokens,
+            ),
+            latency=time.monotonic() - self.started,
+            provider=strategy.provider,
+            model=model_name,
+            metadata={"stopped": True, "estimated_usage": True},
+        )
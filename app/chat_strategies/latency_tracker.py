@@ -0,0 +1,150 @@
+"""
+Keeps process-wide latency and error statistics of the provider models, used to decide when to hedge
+or fail over a request.
+"""
+
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+import threading
+
+# Metrics: the duration of a complete response, and the time to the first chunk of a streamed one.
+# They are kept apart, a streamed response lasting as long as a complete one.
+RESPONSE = "response"
+FIRST_CHUNK = "first_chunk"
+
+
+class LatencyTracker:
+    """
+    Collects the latencies and outcomes of the latest requests of each provider model, per metric.
+
+    Parameters
+    ----------
+    window : int, optional
+        Number of latest requests kept per model. Default is 100.
+
+    Methods
+    -------
+    record(provider: str, model_name: str, latency: float, success: bool = True, metric: str = RESPONSE) -> None
+        Records the outcome of a request.
+    percentile(provider, model_name, percent, min_samples=5, metric=RESPONSE) -> Optional[float]
+        Returns the latency percentile of successful requests, or None without enough samples.
+    error_rate(provider: str, model_name: str, metric: str = RESPONSE) -> float
+        Returns the share of failed requests in the window.
+    """
+
+    def __init__(self, window: int = 100):
+        self.window = window
+        self.latencies: Dict[Tuple[str, str, str], Deque[float]] = {}
+        self.outcomes: Dict[Tuple[str, str, str], Deque[bool]] = {}
+        self.lock = threading.Lock()
+
+    def record(
+        self,
+        provider: str,
+        model_name: str,
+        latency: float,
+        success: bool = True,
+        metric: str = RESPONSE,
+    ) -> None:
+        """
+        Records the outcome of a request.
+
+        Parameters
+        ----------
+        provider : str
+            Name of the provider.
+        model_name : str
+            Name of the model.
+        latency : float
+            Request duration in seconds.
+        success : bool, optional
+            Whether the request succeeded. Default is True.
+        metric : str, optional
+            What the latency measures, RESPONSE or FIRST_CHUNK. Default is RESPONSE.
+        """
+        key = (provider, model_name, metric)
+        with self.lock:
+            if success:
+                self.latencies.setdefault(key, deque(maxlen=self.window)).append(
+                    latency
+                )
+            self.outcomes.setdefault(key, deque(maxlen=self.window)).append(success)
+
+    def percentile(
+        self,
+        provider: str,
+        model_name: str,
+        percent: float,
+        min_samples: int = 5,
+        metric: str = RESPONSE,
+    ) -> Optional[float]:
+        """
+        Returns the latency percentile of successful requests.
+
+        Parameters
+        ----------
+        provider : str
+            Name of the provider.
+        model_name : str
+            Name of the model.
+        percent : float
+            Percentile, from 0 to 100.
+        min_samples : int, optional
+            Minimum number of samples required. Default is 5.
+        metric : str, optional
+            What the latency measures, RESPONSE or FIRST_CHUNK. Default is RESPONSE.
+
+        Returns
+        -------
+        Optional[float]
+            The latency percentile in seconds, or None if there are not enough samples.
+        """
+        with self.lock:
+            latencies = sorted(self.latencies.get((provider, model_name, metric), ()))
+        if len(latencies) < min_samples:
+            return None
+        index = min(
+            len(latencies) - 1, int(round(percent / 100 * (len(latencies) - 1)))
+        )
+        return latencies[index]
+
+    def error_rate(
+        self, provider: str, model_name: str, metric: str = RESPONSE
+    ) -> float:
+        """
+        Returns the share of failed requests in the window.
+
+        Parameters
+        ----------
+        provider : str
+            Name of the provider.
+        model_name : str
+            Name of the model.
+        metric : str, optional
+            The requests counted, RESPONSE or FIRST_CHUNK. Default is RESPONSE.
+
+        Returns
+        -------
+        float
+            Share of failed requests, 0 if there were no requests.
+        """
+        with self.lock:
+            outcomes = self.outcomes.get((provider, model_name, metric), ())
+            if not outcomes:
+                return 0.0
+            return outcomes.count(False) / len(outcomes)
+
+
+_latency_tracker = LatencyTracker()
+
+
+def get_latency_tracker() -> LatencyTracker:
+    """
+    Returns the process-wide latency tracker.
+
+    Returns
+    -------
+    LatencyTracker
+        The tracker shared by all sessions.
+    """
+    return _latency_tracker
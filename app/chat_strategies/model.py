@@ -1,6 +1,6 @@
 """
 Defines the Model class, which represents a chat model with its associated properties such as name, output_max_tokens,
-price_input, and price_output.
+price_input, price_output, context_window and price_cache_storage.
 This class is used by the chat model strategies to store and access model-specific information.
 """
 
@@ -19,6 +19,10 @@ class Model:
         The price per input token for the model.
     price_output : float
         The price per output token for the model.
+    context_window : int, optional
+        The maximum number of input and output tokens of a request. Default is None (unknown).
+    price_cache_storage : float, optional
+        The price per cached token and hour, for the providers billing the cache storage. Default is 0.
 
     Attributes
     ----------
@@ -30,12 +34,34 @@ class Model:
         The price per input token for the model.
     price_output : float
         The price per output token for the model.
+    context_window : int
+        The maximum number of input and output tokens of a request.
+    price_cache_storage : float
+        The price per cached token and hour.
     """
 
+    # Compact records: the catalog keeps one instance per model for the whole process
+    __slots__ = (
+        "name",
+        "output_max_tokens",
+        "price_input",
+        "price_output",
+        "context_window",
+        "price_cache_storage",
+    )
+
     def __init__(
-        self, name: str, output_max_tokens: int, price_input: float, price_output: float
+        self,
+        name: str,
+        output_max_tokens: int,
+        price_input: float,
+        price_output: float,
+        context_window: int = None,
+        price_cache_storage: float = 0.0,
     ):
         self.name = name
         self.output_max_tokens = output_max_tokens
         self.price_input = price_input
         self.price_output = price_output
+        self.context_window = context_window
+        self.price_cache_storage = price_cache_storage
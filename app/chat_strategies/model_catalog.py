@@ -0,0 +1,281 @@
+"""
+Defines the ModelCatalog, the single source of the models offered by every provider, their limits and prices,
+and the per-provider prompt cache pricing rules.
+The catalog is loaded from a JSON data file once per process, so prices can be updated without a release.
+"""
+
+from typing import Any, Dict, List, Tuple
+import json
+import os
+import threading
+
+from chat_strategies.model import Model
+
+DEFAULT_CATALOG_FILE = os.path.join(os.path.dirname(__file__), "models.json")
+
+
+class CachePricing:
+    """
+    Prompt cache pricing rules of a provider, as multipliers of the model input price.
+
+    Parameters
+    ----------
+    cache_write : float, optional
+        Price multiplier of the tokens written to the cache. Default is 1.
+    cache_read : float, optional
+        Price multiplier of the tokens read from the cache. Default is 1.
+    """
+
+    __slots__ = ("cache_write", "cache_read")
+
+    def __init__(self, cache_write: float = 1.0, cache_read: float = 1.0):
+        self.cache_write = cache_write
+        self.cache_read = cache_read
+
+
+class ModelCatalog:
+    """
+    Catalog of the models of every provider with constant time lookups.
+
+    Parameters
+    ----------
+    providers : Dict[str, Dict[str, Any]]
+        Provider name -> {"cache_pricing": {...}, "models": [{...}, ...]}, as in the catalog data file.
+
+    Methods
+    -------
+    from_file(filename: str) -> ModelCatalog
+        Loads a catalog from a JSON data file.
+    add_provider(provider: str, data: Dict[str, Any]) -> None
+        Adds a provider to the catalog, e.g. a configured OpenAI-compatible server.
+    get_models(provider: str) -> List[Model]
+        Returns the models of a provider, in catalog order.
+    get_model_names(provider: str) -> List[str]
+        Returns the model names of a provider, in catalog order.
+    get_model(provider: str, model_name: str) -> Model
+        Returns a model of a provider.
+    get_cache_pricing(provider: str) -> CachePricing
+        Returns the prompt cache pricing rules of a provider.
+    get_price(provider, model_name, input_tokens, output_tokens, cache_create_tokens, cache_read_tokens) -> float
+        Computes the price of a request in dollars.
+    get_storage_price(provider: str, model_name: str, tokens: int, seconds: float) -> float
+        Computes the price of keeping tokens in the cache of a model, in dollars.
+    """
+
+    def __init__(self, providers: Dict[str, Dict[str, Any]]):
+        self.models: Dict[str, List[Model]] = {}
+        self.model_names: Dict[str, Tuple[str, ...]] = {}
+        self.index: Dict[Tuple[str, str], Model] = {}
+        self.cache_pricing: Dict[str, CachePricing] = {}
+        self.lock = threading.Lock()
+        for provider, data in providers.items():
+            self.add_provider(provider, data)
+
+    def add_provider(self, provider: str, data: Dict[str, Any]) -> None:
+        """
+        Adds a provider to the catalog, replacing its models if it is already known.
+
+        The lookups are not locked: the new models are indexed before they are listed, and the removed
+        ones are unindexed last, so a concurrent lookup never misses a listed model.
+
+        Parameters
+        ----------
+        provider : str
+            Name of the provider.
+        data : Dict[str, Any]
+            {"cache_pricing": {...}, "models": [{...}, ...]}, as in the catalog data file.
+        """
+        models = [Model(**model) for model in data.get("models", [])]
+        model_names = tuple(model.name for model in models)
+        with self.lock:
+            for model in models:
+                self.index[(provider, model.name)] = model
+            self.cache_pricing[provider] = CachePricing(**data.get("cache_pricing", {}))
+            removed = set(self.model_names.get(provider, ())) - set(model_names)
+            self.models[provider] = models
+            self.model_names[provider] = model_names
+            for model_name in removed:
+                del self.index[(provider, model_name)]
+
+    @classmethod
+    def from_file(cls, filename: str = DEFAULT_CATALOG_FILE) -> "ModelCatalog":
+        """
+        Loads a catalog from a JSON data file.
+
+        Parameters
+        ----------
+        filename : str, optional
+            Path to the data file. Default is DEFAULT_CATALOG_FILE.
+
+        Returns
+        -------
+        ModelCatalog
+            The loaded catalog.
+        """
+        with open(filename, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["providers"])
+
+    def get_models(self, provider: str) -> List[Model]:
+        """
+        Returns the models of a provider, in catalog order.
+
+        Parameters
+        ----------
+        provider : str
+            Name of the provider.
+
+        Returns
+        -------
+        List[Model]
+            The models of the provider, empty if the provider is unknown.
+        """
+        return list(self.models.get(provider, []))
+
+    def get_model_names(self, provider: str) -> List[str]:
+        """
+        Returns the model names of a provider, in catalog order.
+
+        Parameters
+        ----------
+        provider : str
+            Name of the provider.
+
+        Returns
+        -------
+        List[str]
+            The model names of the provider, empty if the provider is unknown.
+        """
+        return list(self.model_names.get(provider, ()))
+
+    def get_model(self, provider: str, model_name: str) -> Model:
+        """
+        Returns a model of a provider.
+
+        Parameters
+        ----------
+        provider : str
+            Name of the provider.
+        model_name : str
+            Name of the model.
+
+        Returns
+        -------
+        Model
+            The model.
+
+        Raises
+        ------
+        KeyError
+            If the model is not in the catalog.
+        """
+        return self.index[(provider, model_name)]
+
+    def get_cache_pricing(self, provider: str) -> CachePricing:
+        """
+        Returns the prompt cache pricing rules of a provider.
+
+        Parameters
+        ----------
+        provider : str
+            Name of the provider.
+
+        Returns
+        -------
+        CachePricing
+            The pricing rules, neutral multipliers if the provider is unknown.
+        """
+        return self.cache_pricing.get(provider) or CachePricing()
+
+    def get_price(
+        self,
+        provider: str,
+        model_name: str,
+        input_tokens: int,
+        output_tokens: int,
+        cache_create_tokens: int = 0,
+        cache_read_tokens: int = 0,
+    ) -> float:
+        """
+        Computes the price of a request in dollars.
+
+        Parameters
+        ----------
+        provider : str
+            Name of the provider.
+        model_name : str
+            Name of the model.
+        input_tokens : int
+            Number of uncached input tokens.
+        output_tokens : int
+            Number of output tokens.
+        cache_create_tokens : int, optional
+            Number of input tokens written to the cache. Default is 0.
+        cache_read_tokens : int, optional
+            Number of input tokens read from the cache. Default is 0.
+
+        Returns
+        -------
+        float
+            The price of the request.
+        """
+        model = self.index[(provider, model_name)]
+        cache_pricing = self.get_cache_pricing(provider)
+        return (
+            (
+                input_tokens
+                + cache_create_tokens * cache_pricing.cache_write
+                + cache_read_tokens * cache_pricing.cache_read
+            )
+            * model.price_input
+            + output_tokens * model.price_output
+        ) / 1_000_000.0
+
+    def get_storage_price(
+        self, provider: str, model_name: str, tokens: int, seconds: float
+    ) -> float:
+        """
+        Computes the price of keeping tokens in the cache of a model, in dollars.
+
+        Parameters
+        ----------
+        provider : str
+            Name of the provider.
+        model_name : str
+            Name of the model.
+        tokens : int
+            Number of cached tokens.
+        seconds : float
+            Storage duration.
+
+        Returns
+        -------
+        float
+            The price of the storage, 0 for the providers that do not bill it.
+        """
+        model = self.index[(provider, model_name)]
+        return tokens * model.price_cache_storage * seconds / 3600 / 1_000_000.0
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_model_catalog() -> ModelCatalog:
+    """
+    Returns the process-wide model catalog, loading it on first use.
+
+    The data file is DEFAULT_CATALOG_FILE, or the file set in the MODEL_CATALOG_FILE environment variable.
+
+    Returns
+    -------
+    ModelCatalog
+        The catalog shared by all strategies.
+    """
+    global _catalog  # pylint: disable=global-statement
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = ModelCatalog.from_file(
+                    os.environ.get("MODEL_CATALOG_FILE", DEFAULT_CATALOG_FILE)
+                )
+    return _catalog
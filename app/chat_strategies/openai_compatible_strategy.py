@@ -0,0 +1,345 @@
+"""
+Implements the OpenAICompatibleChatStrategy, a configurable strategy for the servers implementing the OpenAI
+chat completions API: hosted providers such as Deepseeker, and local inference servers (vLLM, llama.cpp,
+Ollama) for low-latency drafts at no cost.
+
+The providers are described in a JSON file with the same models, prices and cache pricing as the model
+catalog, plus the base URL, the rate limits and the mapping of the usage fields reported by the server.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import os
+import threading
+import time
+from openai import AsyncOpenAI
+from chat_strategies.async_adapter import LoopLocal
+from chat_strategies.chat_response import AsyncChatStream, ChatResponse, Usage
+from chat_strategies.model_catalog import get_model_catalog
+from chat_strategies.chat_model_strategy import ChatModelStrategy
+from chat_strategies.rate_limiter import (
+    configure_rate_limits,
+    estimate_prompt_tokens,
+    get_rate_limiter,
+)
+
+# Usage field -> attribute path in the usage reported by the server, None if it is not reported.
+# The prompt tokens include the cached ones.
+DEFAULT_USAGE_FIELDS: Dict[str, Optional[str]] = {
+    "prompt_tokens": "prompt_tokens",
+    "output_tokens": "completion_tokens",
+    "cache_create_tokens": None,
+    "cache_read_tokens": None,
+}
+
+# Local servers usually ignore the API key, but the client requires one
+PLACEHOLDER_API_KEY = "not-needed"
+
+
+def _usage_field(usage: Any, path: Optional[str]) -> int:
+    """
+    Returns a usage field by its dotted attribute path, 0 if it is missing.
+    """
+    if not path:
+        return 0
+    value = usage
+    for name in path.split("."):
+        value = getattr(value, name, None)
+        if value is None:
+            return 0
+    return int(value)
+
+
+class OpenAICompatibleChatStrategy(ChatModelStrategy):
+    """
+    A configurable strategy for the servers implementing the OpenAI chat completions API.
+
+    The models and prices of the provider are read from the model catalog.
+
+    Parameters
+    ----------
+    provider : str
+        Name of the provider in the model catalog.
+    base_url : str
+        Base URL of the API, e.g. "http://localhost:8000/v1".
+    api_key : str, optional
+        The API key, a placeholder if the server needs none. Default is None.
+    usage_fields : Dict[str, Optional[str]], optional
+        Overrides of DEFAULT_USAGE_FIELDS for the server. Default is None.
+    supports_prompt_cache : bool, optional
+        Whether the server bills repeated prompt prefixes as cache reads. Default is False.
+    stream_usage : bool, optional
+        Whether to request the usage at the end of the streams, some servers reject the option.
+        Default is True.
+
+    Attributes
+    ----------
+    api_key : str
+        The API key.
+    base_url : str
+        Base URL of the API.
+    models : List[Model]
+        A list of available models of the provider.
+    catalog : ModelCatalog
+        The process-wide model catalog with the models, limits and prices.
+    clients : LoopLocal[AsyncOpenAI]
+        The client instances for making API requests, one per event loop.
+
+    Methods
+    -------
+    get_models()
+        Returns a list of available model names.
+    get_output_max_tokens(model_name)
+        Returns the maximum number of output tokens for the specified model.
+    async_send_message(system_prompt, messages, model_name, max_tokens, temperature)
+        Sends a message to the API and returns the generated response.
+    async_stream_message(system_prompt, messages, model_name, max_tokens, temperature)
+        Sends a message to the API and returns a stream of the generated response.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        base_url: str,
+        api_key: str = None,
+        usage_fields: Dict[str, Optional[str]] = None,
+        supports_prompt_cache: bool = False,
+        stream_usage: bool = True,
+    ):
+        self.provider = provider
+        self.base_url = base_url
+        self.api_key = api_key or PLACEHOLDER_API_KEY
+        self.usage_fields = {**DEFAULT_USAGE_FIELDS, **(usage_fields or {})}
+        self.supports_prompt_cache = supports_prompt_cache
+        self.stream_usage = stream_usage
+        self.catalog = get_model_catalog()
+        self.models = self.catalog.get_models(self.provider)
+        # Retries are handled by the shared rate limiter
+        self.clients = LoopLocal(
+            lambda: AsyncOpenAI(
+                api_key=self.api_key, base_url=self.base_url, max_retries=0
+            )
+        )
+
+    def get_models(self) -> List[str]:
+        return self.catalog.get_model_names(self.provider)
+
+    def get_output_max_tokens(self, model_name: str) -> int:
+        return self.catalog.get_model(self.provider, model_name).output_max_tokens
+
+    def _usage(self, usage) -> Usage:
+        """
+        Normalizes the usage reported by the API with the usage field mapping.
+        """
+        cache_create_tokens = _usage_field(
+            usage, self.usage_fields["cache_create_tokens"]
+        )
+        cache_read_tokens = _usage_field(usage, self.usage_fields["cache_read_tokens"])
+        prompt_tokens = _usage_field(usage, self.usage_fields["prompt_tokens"])
+        return Usage(
+            input_tokens=prompt_tokens - cache_create_tokens - cache_read_tokens,
+            output_tokens=_usage_field(usage, self.usage_fields["output_tokens"]),
+            cache_create_tokens=cache_create_tokens,
+            cache_read_tokens=cache_read_tokens,
+        )
+
+    def _create(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float,
+        estimated_tokens: int,
+        **kwargs,
+    ):
+        """
+        Sends the request through the rate limiter of the model.
+        """
+        full_messages = [{"role": "system", "content": f"{system_prompt}"}]
+        full_messages.extend(messages)
+
+        return get_rate_limiter(self.provider, model_name).async_call(
+            lambda: self.clients.get().chat.completions.create(
+                model=model_name,
+                messages=full_messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=1,
+                frequency_penalty=0,
+                presence_penalty=0,
+                **kwargs,
+            ),
+            estimated_tokens=estimated_tokens,
+            count_tokens=(
+                None
+                if kwargs.get("stream")
+                else lambda response: (
+                    response.usage.total_tokens if response.usage else 0
+                )
+            ),
+        )
+
+    async def async_send_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> ChatResponse:
+        started = time.monotonic()
+        estimated_tokens = estimate_prompt_tokens(system_prompt, messages)
+
+        response = await self._create(
+            system_prompt,
+            messages,
+            model_name,
+            max_tokens,
+            temperature,
+            estimated_tokens,
+        )
+
+        return self._build_response(
+            response.choices[0].message.content,
+            self._usage(response.usage) if response.usage else Usage(),
+            model_name,
+            started,
+            {"id": response.id, "finish_reason": response.choices[0].finish_reason},
+            estimated_tokens,
+        )
+
+    def async_stream_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> AsyncChatStream:
+        async def generate():
+            started = time.monotonic()
+            estimated_tokens = estimate_prompt_tokens(system_prompt, messages)
+            stream = await self._create(
+                system_prompt,
+                messages,
+                model_name,
+                max_tokens,
+                temperature,
+                estimated_tokens,
+                stream=True,
+                **(
+                    {"stream_options": {"include_usage": True}}
+                    if self.stream_usage
+                    else {}
+                ),
+            )
+
+            chunks = []
+            usage = response_id = finish_reason = None
+            async with stream:
+                async for chunk in stream:
+                    response_id = chunk.id
+                    # The last chunk carries the usage and no choices
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if chunk.choices:
+                        finish_reason = chunk.choices[0].finish_reason or finish_reason
+                        if chunk.choices[0].delta.content:
+                            chunks.append(chunk.choices[0].delta.content)
+                            yield chunks[-1]
+
+            if usage is not None:
+                get_rate_limiter(self.provider, model_name).record_usage(
+                    estimated_tokens, usage.total_tokens
+                )
+            yield self._build_response(
+                "".join(chunks),
+                self._usage(usage) if usage is not None else Usage(),
+                model_name,
+                started,
+                {"id": response_id, "finish_reason": finish_reason},
+                estimated_tokens,
+            )
+
+        return AsyncChatStream(generate())
+
+
+def load_openai_compatible_strategies(
+    filename: str,
+) -> Dict[str, OpenAICompatibleChatStrategy]:
+    """
+    Creates the strategies of the OpenAI-compatible providers described in a JSON file.
+
+    The file has the layout of the model catalog, every provider having in addition:
+    "base_url", an optional "api_key_env" (name of the environment variable holding the key),
+    "usage_fields", "supports_prompt_cache", "stream_usage" and "limits" (requests and tokens per minute).
+    The providers are added to the model catalog and their rate limits are configured.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the JSON file.
+
+    Returns
+    -------
+    Dict[str, OpenAICompatibleChatStrategy]
+        The strategies by provider name, in file order.
+    """
+    with open(filename, "r", encoding="utf-8") as f:
+        providers = json.load(f)["providers"]
+
+    strategies = {}
+    for provider, config in providers.items():
+        get_model_catalog().add_provider(
+            provider,
+            {key: config[key] for key in ("cache_pricing", "models") if key in config},
+        )
+        if config.get("limits"):
+            configure_rate_limits(provider, **config["limits"])
+        strategies[provider] = OpenAICompatibleChatStrategy(
+            provider,
+            base_url=config["base_url"],
+            api_key=(
+                os.environ.get(config["api_key_env"])
+                if config.get("api_key_env")
+                else None
+            ),
+            usage_fields=config.get("usage_fields"),
+            supports_prompt_cache=config.get("supports_prompt_cache", False),
+            stream_usage=config.get("stream_usage", True),
+        )
+    return strategies
+
+
+# Path -> modification time of the loaded file and its strategies
+_loaded: Dict[str, Tuple[float, Dict[str, OpenAICompatibleChatStrategy]]] = {}
+_loaded_lock = threading.Lock()
+
+
+def get_openai_compatible_strategies(
+    filename: str,
+) -> Dict[str, OpenAICompatibleChatStrategy]:
+    """
+    Returns the process-wide strategies of the OpenAI-compatible providers described in a JSON file.
+
+    The file is loaded on first use and loaded again only when it is modified, so that the reruns neither
+    re-read it nor reset the rate limits of its providers.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the JSON file, see `load_openai_compatible_strategies`.
+
+    Returns
+    -------
+    Dict[str, OpenAICompatibleChatStrategy]
+        The strategies by provider name, in file order.
+    """
+    path = os.path.abspath(filename)
+    mtime = os.path.getmtime(path)
+    with _loaded_lock:
+        loaded = _loaded.get(path)
+        if loaded is None or loaded[0] != mtime:
+            loaded = _loaded[path] = (mtime, load_openai_compatible_strategies(path))
+        return loaded[1]
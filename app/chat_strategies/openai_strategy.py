@@ -4,9 +4,13 @@ This strategy adheres to the ChatModelStrategy interface and encapsulates OpenAI
 """
 
 from typing import List, Dict
-from openai import OpenAI
-from chat_strategies.model import Model
+import time
+from openai import AsyncOpenAI
+from chat_strategies.async_adapter import LoopLocal
+from chat_strategies.chat_response import AsyncChatStream, ChatResponse, Usage
+from chat_strategies.model_catalog import get_model_catalog
 from chat_strategies.chat_model_strategy import ChatModelStrategy
+from chat_strategies.rate_limiter import estimate_prompt_tokens, get_rate_limiter
 
 
 # https://platform.openai.com/docs/models
@@ -26,14 +30,10 @@ class OpenAIChatStrategy(ChatModelStrategy):
         The API key for accessing the OpenAI API.
     models : List[Model]
         A list of available OpenAI models.
-    client : OpenAI
-        The OpenAI client instance for making API requests.
-    input_tokens : int
-        The number of input tokens used in the last API request.
-    output_tokens : int
-        The number of output tokens generated in the last API response.
-    model : str
-        The name of the model used in the last API request.
+    catalog : ModelCatalog
+        The process-wide model catalog with the models, limits and prices.
+    clients : LoopLocal[AsyncOpenAI]
+        The OpenAI client instances for making API requests, one per event loop.
 
     Methods
     -------
@@ -41,142 +41,157 @@ class OpenAIChatStrategy(ChatModelStrategy):
         Returns a list of available model names.
     get_output_max_tokens(model_name)
         Returns the maximum number of output tokens for the specified model.
-    get_input_tokens()
-        Returns the number of input tokens used in the last API request.
-    get_output_tokens()
-        Returns the number of output tokens generated in the last API response.
-    get_full_price()
-        Calculates and returns the total price based on the input and output tokens.
-    send_message(system_prompt, messages, model_name, max_tokens, temperature)
+    async_send_message(system_prompt, messages, model_name, max_tokens, temperature)
         Sends a message to the OpenAI API and returns the generated response.
+    async_stream_message(system_prompt, messages, model_name, max_tokens, temperature)
+        Sends a message to the OpenAI API and returns a stream of the generated response.
     """
 
+    provider = "OpenAI"
+    supports_prompt_cache = True
+
     def __init__(self, api_key: str):
         self.api_key = api_key
-        self.models = [
-            Model(
-                name="gpt-4o",
-                output_max_tokens=16_384,
-                price_input=2.5,
-                price_output=10.0,
-            ),
-            Model(
-                name="gpt-4o-mini",
-                output_max_tokens=16_384,
-                price_input=0.15,
-                price_output=0.6,
-            ),
-            Model(
-                name="gpt-4-turbo",
-                output_max_tokens=4096,
-                price_input=10.0,
-                price_output=30.0,
-            ),
-            Model(
-                name="gpt-3.5-turbo",
-                output_max_tokens=4096,
-                price_input=0.5,
-                price_output=1.5,
-            ),
-            Model(
-                name="gpt-4",
-                output_max_tokens=4096,
-                price_input=30.0,
-                price_output=60.0,
-            ),
-            Model(
-                name="o1-preview",
-                output_max_tokens=32_768,
-                price_input=15.0,
-                price_output=60.0,
-            ),
-            Model(
-                name="o1-mini",
-                output_max_tokens=65_536,
-                price_input=3.0,
-                price_output=12.0,
-            ),
-        ]
-        self.client = OpenAI(api_key=self.api_key)
-        self.input_tokens = 0
-        self.output_tokens = 0
-        self.cache_create_tokens = 0
-        self.cache_read_tokens = 0
-        self.reasoning_tokens = 0
-        self.model = None
+        self.catalog = get_model_catalog()
+        self.models = self.catalog.get_models(self.provider)
+        # Retries are handled by the shared rate limiter
+        self.clients = LoopLocal(
+            lambda: AsyncOpenAI(api_key=self.api_key, max_retries=0)
+        )
 
     def get_models(self) -> List[str]:
-        return [model.name for model in self.models]
+        return self.catalog.get_model_names(self.provider)
 
     def get_output_max_tokens(self, model_name: str) -> int:
-        return self.models[self.get_models().index(model_name)].output_max_tokens
-
-    def get_input_tokens(self) -> int:
-        return self.input_tokens
-
-    def get_output_tokens(self) -> int:
-        return self.output_tokens
-
-    def get_cache_create_tokens(self) -> int:
-        return self.cache_create_tokens
-
-    def get_cache_read_tokens(self) -> int:
-        return self.cache_read_tokens
-
-    def get_full_price(self) -> float:
-        inputs = (
-            self.input_tokens
-            * self.models[self.get_models().index(self.model)].price_input
-            / 1_000_000.0
-        )
-        outputs = (
-            self.output_tokens
-            * self.models[self.get_models().index(self.model)].price_output
-            / 1_000_000.0
-        )
-        # Токены записи в кэш стоят столько же как входные токены
-        cache_create = (
-            self.cache_create_tokens
-            * self.models[self.get_models().index(self.model)].price_input
-            / 1_000_000.0
-        )
-        # Токены чтения из кэша на 50% дешевле базовых входных токенов
-        cache_read = (
-            self.cache_read_tokens
-            * self.models[self.get_models().index(self.model)].price_input
-            * 0.5
-            / 1_000_000.0
+        return self.catalog.get_model(self.provider, model_name).output_max_tokens
+
+    def _usage(self, usage) -> Usage:
+        """
+        Normalizes the usage reported by the API.
+        """
+        prompt_details = usage.prompt_tokens_details
+        completion_details = usage.completion_tokens_details
+        cache_read_tokens = (prompt_details.cached_tokens or 0) if prompt_details else 0
+        return Usage(
+            input_tokens=usage.prompt_tokens - cache_read_tokens,
+            output_tokens=usage.completion_tokens,
+            cache_read_tokens=cache_read_tokens,
+            reasoning_tokens=(
+                (completion_details.reasoning_tokens or 0) if completion_details else 0
+            ),
         )
 
-        return inputs + outputs + cache_create + cache_read
-
-    def send_message(
+    def _create(
         self,
         system_prompt: str,
         messages: List[Dict[str, str]],
         model_name: str,
         max_tokens: int,
-        temperature: float = 0,
-    ) -> str:
-
-        self.model = model_name
-
+        temperature: float,
+        estimated_tokens: int,
+        **kwargs,
+    ):
+        """
+        Sends the request through the rate limiter of the model.
+        """
         full_messages = [{"role": "system", "content": f"{system_prompt}"}]
         full_messages.extend(messages)
 
-        response = self.client.chat.completions.create(
-            model=model_name,
-            messages=full_messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            top_p=1,
-            frequency_penalty=0,
-            presence_penalty=0,
+        return get_rate_limiter(self.provider, model_name).async_call(
+            lambda: self.clients.get().chat.completions.create(
+                model=model_name,
+                messages=full_messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=1,
+                frequency_penalty=0,
+                presence_penalty=0,
+                **kwargs,
+            ),
+            estimated_tokens=estimated_tokens,
+            count_tokens=(
+                None
+                if kwargs.get("stream")
+                else lambda response: response.usage.total_tokens
+            ),
         )
 
-        self.output_tokens = response.usage.completion_tokens
-        self.cache_create_tokens = 0
-        self.cache_read_tokens = response.usage.prompt_tokens_details.cached_tokens
-        self.input_tokens = response.usage.prompt_tokens - self.cache_read_tokens
+    async def async_send_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> ChatResponse:
+        started = time.monotonic()
+        estimated_tokens = estimate_prompt_tokens(system_prompt, messages)
+
+        response = await self._create(
+            system_prompt,
+            messages,
+            model_name,
+            max_tokens,
+            temperature,
+            estimated_tokens,
+        )
+
+        return self._build_response(
+            response.choices[0].message.content,
+            self._usage(response.usage),
+            model_name,
+            started,
+            {"id": response.id, "finish_reason": response.choices[0].finish_reason},
+            estimated_tokens,
+        )
 
-        return response.choices[0].message.content
+    def async_stream_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> AsyncChatStream:
+        async def generate():
+            started = time.monotonic()
+            estimated_tokens = estimate_prompt_tokens(system_prompt, messages)
+            stream = await self._create(
+                system_prompt,
+                messages,
+                model_name,
+                max_tokens,
+                temperature,
+                estimated_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+
+            chunks = []
+            usage = response_id = finish_reason = None
+            async with stream:
+                async for chunk in stream:
+                    response_id = chunk.id
+                    # The last chunk carries the usage and no choices
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if chunk.choices:
+                        finish_reason = chunk.choices[0].finish_reason or finish_reason
+                        if chunk.choices[0].delta.content:
+                            chunks.append(chunk.choices[0].delta.content)
+                            yield chunks[-1]
+
+            if usage is not None:
+                get_rate_limiter(self.provider, model_name).record_usage(
+                    estimated_tokens, usage.total_tokens
+                )
+            yield self._build_response(
+                "".join(chunks),
+                self._usage(usage) if usage is not None else Usage(),
+                model_name,
+                started,
+                {"id": response_id, "finish_reason": finish_reason},
+                estimated_tokens,
+            )
+
+        return AsyncChatStream(generate())
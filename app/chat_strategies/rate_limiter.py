@@ -0,0 +1,654 @@
+"""
+Implements client-side rate limiting for the chat model strategies.
+
+Every provider call goes through a RateLimiter shared per provider/model. The limiter paces requests with
+token buckets for requests-per-minute and tokens-per-minute budgets, retries transient failures with
+exponential backoff and jitter (honoring `Retry-After`), and fails fast through a per-provider circuit
+breaker while the provider is down.
+"""
+
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+from email.utils import parsedate_to_datetime
+import asyncio
+import datetime
+import random
+import threading
+import time
+
+import anthropic
+import openai
+
+from managers.file_manager import num_tokens_from_content
+
+T = TypeVar("T")
+
+# Conservative defaults (lowest paid tiers), overridable per provider with environment variables.
+# Requests per minute / tokens per minute.
+DEFAULT_LIMITS: Dict[str, Dict[str, float]] = {
+    "OpenAI": {"requests_per_minute": 500, "tokens_per_minute": 30_000},
+    "Anthropic": {"requests_per_minute": 50, "tokens_per_minute": 40_000},
+    "Gemini": {"requests_per_minute": 360, "tokens_per_minute": 4_000_000},
+    "Deepseeker": {"requests_per_minute": 600, "tokens_per_minute": 1_000_000},
+    "Simulated": {"requests_per_minute": 10_000, "tokens_per_minute": 10_000_000},
+}
+FALLBACK_LIMITS: Dict[str, float] = {
+    "requests_per_minute": 60,
+    "tokens_per_minute": 100_000,
+}
+
+CONNECTION_ERRORS = (
+    openai.APIConnectionError,
+    anthropic.APIConnectionError,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class ProviderUnavailableError(RuntimeError):
+    """
+    Raised when a provider request could not be completed by the rate limiter.
+    """
+
+
+class CircuitOpenError(ProviderUnavailableError):
+    """
+    Raised when the circuit breaker of a provider is open and requests fail fast.
+    """
+
+
+class RetriesExhaustedError(ProviderUnavailableError):
+    """
+    Raised when a request keeps failing with transient errors after all retries.
+    """
+
+
+def estimate_prompt_tokens(system_prompt: str, messages: List[Dict[str, str]]) -> int:
+    """
+    Estimates the number of prompt tokens of a request before it is sent.
+
+    Parameters
+    ----------
+    system_prompt : str
+        The system prompt of the request.
+    messages : List[Dict[str, str]]
+        The messages of the request.
+
+    Returns
+    -------
+    int
+        Estimated number of input tokens.
+    """
+    return num_tokens_from_content(system_prompt) + sum(
+        num_tokens_from_content(message["content"]) for message in messages
+    )
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled continuously at a constant rate.
+
+    Reservations may drive the bucket into debt: the caller is told how long to wait instead of being
+    rejected, so concurrent callers are spaced evenly and the sustained rate stays at the refill rate.
+
+    Parameters
+    ----------
+    rate_per_minute : float
+        Refill rate of the bucket.
+    capacity : float
+        Maximum number of tokens the bucket can hold (the allowed burst).
+
+    Methods
+    -------
+    reserve(amount: float) -> float
+        Takes `amount` tokens from the bucket and returns the number of seconds to wait before using them.
+    adjust(amount: float) -> None
+        Adds (or removes, if negative) tokens after the real cost of a request is known.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes `amount` tokens from the bucket.
+
+        Parameters
+        ----------
+        amount : float
+            Number of tokens to take.
+
+        Returns
+        -------
+        float
+            Number of seconds the caller has to wait before the reservation becomes valid.
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, amount: float) -> None:
+        """
+        Corrects the bucket once the real cost of a request is known.
+
+        Parameters
+        ----------
+        amount : float
+            Number of tokens to give back (positive) or take additionally (negative).
+        """
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class CircuitBreaker:
+    """
+    A per-provider circuit breaker.
+
+    After `failure_threshold` consecutive failures the circuit opens and requests fail fast. Once
+    `recovery_timeout` seconds have passed, a single trial request is let through (half-open state):
+    its success closes the circuit, its failure opens it again.
+
+    Parameters
+    ----------
+    name : str
+        Name of the protected provider.
+    failure_threshold : int, optional
+        Number of consecutive failures that opens the circuit. Default is 5.
+    recovery_timeout : float, optional
+        Seconds to keep the circuit open before a trial request. Default is 30.
+
+    Methods
+    -------
+    before_call() -> None
+        Raises CircuitOpenError if the request must not be sent.
+    record_success() -> None
+        Records a successful request.
+    record_failure() -> None
+        Records a failed request.
+    release() -> None
+        Releases the trial slot of a request that ended without an outcome, e.g. cancelled.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """
+        Checks whether a request may be sent.
+
+        Raises
+        ------
+        CircuitOpenError
+            If the circuit is open or a trial request is already in flight.
+        """
+        with self.lock:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.recovery_timeout - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(
+                        f"{self.name} is unavailable, retry in {remaining:.0f} s"
+                    )
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self.trial_in_flight:
+                    raise CircuitOpenError(f"{self.name} is recovering, retry later")
+                self.trial_in_flight = True
+
+    def record_success(self) -> None:
+        """
+        Records a successful request and closes the circuit.
+        """
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def release(self) -> None:
+        """
+        Releases the trial slot of a request that ended without an outcome, e.g. cancelled.
+
+        The state is left as is: a cancelled request says nothing about the health of the provider.
+        """
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """
+        Records a failed request and opens the circuit if needed.
+        """
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    """
+    Extracts the HTTP status code from an SDK exception, if any.
+    """
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        # google.api_core exceptions keep the HTTP status in `code`
+        status = getattr(exc, "code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """
+    Reads the `Retry-After` delay (in seconds) from the response attached to an SDK exception.
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(
+        0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+    )
+
+
+class RateLimiter:
+    """
+    Paces, retries and guards the requests to one provider model.
+
+    Parameters
+    ----------
+    name : str
+        Name of the limited provider model, used in error messages.
+    requests_per_minute : float
+        Requests-per-minute budget.
+    tokens_per_minute : float
+        Tokens-per-minute budget.
+    circuit_breaker : CircuitBreaker
+        Circuit breaker of the provider.
+    headroom : float, optional
+        Fraction of the budgets actually used, to stay just under the provider limits. Default is 0.9.
+    max_retries : int, optional
+        Maximum number of retries of a transient failure. Default is 5.
+    base_delay : float, optional
+        Initial backoff delay in seconds. Default is 1.
+    max_delay : float, optional
+        Maximum backoff delay in seconds. Default is 60.
+
+    Methods
+    -------
+    acquire(estimated_tokens: int, requests: int = 1) -> float
+        Reserves budget for a request and returns the number of seconds to wait before sending it.
+    call(func, estimated_tokens=0, count_tokens=None, requests=1)
+        Calls `func` within the budgets, retrying transient failures.
+    async_call(func, estimated_tokens=0, count_tokens=None, requests=1)
+        Awaits `func()` within the budgets, retrying transient failures.
+    record_usage(estimated_tokens, used_tokens)
+        Corrects the token budget once the real usage of a request is known.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        circuit_breaker: CircuitBreaker,
+        headroom: float = 0.9,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.name = name
+        # A full minute of budget, as the provider buckets hold: a large prompt on an idle limiter goes out at once
+        self.requests = TokenBucket(
+            requests_per_minute * headroom,
+            max(1.0, requests_per_minute * headroom),
+        )
+        self.tokens = TokenBucket(
+            tokens_per_minute * headroom, tokens_per_minute * headroom
+        )
+        self.circuit_breaker = circuit_breaker
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, estimated_tokens: int, requests: int = 1) -> float:
+        """
+        Reserves budget for a request.
+
+        Parameters
+        ----------
+        estimated_tokens : int
+            Pre-flight estimate of the tokens the request will consume.
+        requests : int, optional
+            Number of API requests made by the call. Default is 1.
+
+        Returns
+        -------
+        float
+            Number of seconds to wait before sending the request.
+        """
+        wait = max(
+            self.requests.reserve(requests), self.tokens.reserve(estimated_tokens)
+        )
+        with self.lock:
+            return max(wait, self.blocked_until - time.monotonic())
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float:
+        """
+        Computes the delay before the next retry and blocks the other callers on `Retry-After`.
+        """
+        retry_after = _retry_after(exc)
+        if retry_after is not None:
+            with self.lock:
+                self.blocked_until = max(
+                    self.blocked_until, time.monotonic() + retry_after
+                )
+            return retry_after
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _classify(self, exc: BaseException) -> Tuple[bool, bool]:
+        """
+        Classifies an exception.
+
+        Returns
+        -------
+        Tuple[bool, bool]
+            Whether the request should be retried and whether the failure counts against the provider health.
+        """
+        status = _status_code(exc)
+        if status == 429:
+            return True, False
+        if status is not None and status >= 500:
+            return True, True
+        if isinstance(exc, CONNECTION_ERRORS):
+            return True, True
+        return False, False
+
+    def _on_error(self, attempt: int, exc: Exception) -> float:
+        """
+        Records a failed attempt and returns the delay before the next one.
+
+        Raises
+        ------
+        Exception
+            The original exception if it is not retryable.
+        RetriesExhaustedError
+            If it was the last attempt.
+        """
+        retryable, is_failure = self._classify(exc)
+        if is_failure:
+            self.circuit_breaker.record_failure()
+        else:
+            # The provider answered, so it is up
+            self.circuit_breaker.record_success()
+        if not retryable:
+            raise exc
+        if attempt == self.max_retries:
+            raise RetriesExhaustedError(
+                f"{self.name} request failed after {attempt + 1} attempts: {exc}"
+            ) from exc
+        return self._backoff(attempt, exc)
+
+    def record_usage(self, estimated_tokens: int, used_tokens: int) -> None:
+        """
+        Corrects the token budget once the real usage of a request is known.
+
+        Parameters
+        ----------
+        estimated_tokens : int
+            Pre-flight estimate reserved for the request.
+        used_tokens : int
+            Number of tokens actually consumed.
+        """
+        self.tokens.adjust(estimated_tokens - used_tokens)
+
+    def call(
+        self,
+        func: Callable[[], T],
+        estimated_tokens: int = 0,
+        count_tokens: Optional[Callable[[T], int]] = None,
+        requests: int = 1,
+    ) -> T:
+        """
+        Calls `func` within the budgets, retrying transient failures.
+
+        Parameters
+        ----------
+        func : Callable[[], T]
+            The provider call.
+        estimated_tokens : int, optional
+            Pre-flight estimate of the tokens the call will consume. Default is 0.
+        count_tokens : Callable[[T], int], optional
+            Returns the real number of tokens consumed, read from the result. Default is None.
+        requests : int, optional
+            Number of API requests made by the call. Default is 1.
+
+        Returns
+        -------
+        T
+            The result of `func`.
+
+        Raises
+        ------
+        CircuitOpenError
+            If the provider is considered down.
+        RetriesExhaustedError
+            If the call kept failing with transient errors.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.circuit_breaker.before_call()
+            try:
+                time.sleep(self.acquire(estimated_tokens, requests))
+                result = func()
+            except Exception as exc:  # pylint: disable=broad-except
+                # No response, no tokens used: the next attempt reserves them again
+                self.tokens.adjust(estimated_tokens)
+                delay = self._on_error(attempt, exc)
+            except BaseException:
+                # Interrupted, e.g. KeyboardInterrupt: the trial slot must not stay taken, nor its reservation
+                self.tokens.adjust(estimated_tokens)
+                self.circuit_breaker.release()
+                raise
+            else:
+                self.circuit_breaker.record_success()
+                if count_tokens is not None:
+                    self.record_usage(estimated_tokens, count_tokens(result))
+                return result
+            time.sleep(delay)
+
+        raise AssertionError("unreachable")
+
+    async def async_call(
+        self,
+        func: Callable[[], Awaitable[T]],
+        estimated_tokens: int = 0,
+        count_tokens: Optional[Callable[[T], int]] = None,
+        requests: int = 1,
+    ) -> T:
+        """
+        Awaits `func()` within the budgets, retrying transient failures.
+
+        Same as `call`, but the waits do not block the event loop.
+
+        Parameters
+        ----------
+        func : Callable[[], Awaitable[T]]
+            The provider call, returning a new coroutine on every attempt.
+        estimated_tokens : int, optional
+            Pre-flight estimate of the tokens the call will consume. Default is 0.
+        count_tokens : Callable[[T], int], optional
+            Returns the real number of tokens consumed, read from the result. Default is None.
+        requests : int, optional
+            Number of API requests made by the call. Default is 1.
+
+        Returns
+        -------
+        T
+            The result of `func()`.
+
+        Raises
+        ------
+        CircuitOpenError
+            If the provider is considered down.
+        RetriesExhaustedError
+            If the call kept failing with transient errors.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.circuit_breaker.before_call()
+            try:
+                await asyncio.sleep(self.acquire(estimated_tokens, requests))
+                result = await func()
+            except Exception as exc:  # pylint: disable=broad-except
+                # No response, no tokens used: the next attempt reserves them again
+                self.tokens.adjust(estimated_tokens)
+                delay = self._on_error(attempt, exc)
+            except BaseException:
+                # Cancelled, e.g. a lost hedge or Stop: the trial slot must not stay taken, nor its reservation
+                self.tokens.adjust(estimated_tokens)
+                self.circuit_breaker.release()
+                raise
+            else:
+                self.circuit_breaker.record_success()
+                if count_tokens is not None:
+                    self.record_usage(estimated_tokens, count_tokens(result))
+                return result
+            await asyncio.sleep(delay)
+
+        raise AssertionError("unreachable")
+
+
+_registry_lock = threading.Lock()
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+_limits: Dict[str, Dict[str, Any]] = {
+    provider: dict(limits) for provider, limits in DEFAULT_LIMITS.items()
+}
+
+
+def configure_rate_limits(provider: str, **limits: Any) -> None:
+    """
+    Overrides the limits of a provider. Limiters created afterwards use the new values.
+
+    Setting the current values again keeps the limiters and their budgets, so it is safe on every rerun.
+
+    Parameters
+    ----------
+    provider : str
+        Name of the provider, e.g. "OpenAI".
+    **limits : Any
+        Keyword arguments of RateLimiter, e.g. requests_per_minute=1000.
+    """
+    with _registry_lock:
+        current = _limits.get(provider, FALLBACK_LIMITS)
+        updated = {**current, **limits}
+        if provider in _limits and updated == current:
+            return
+        _limits[provider] = updated
+        for key in [key for key in _limiters if key[0] == provider]:
+            del _limiters[key]
+
+
+def configure_rate_limits_from_env(environ: Mapping[str, str]) -> None:
+    """
+    Overrides the limits of the built-in providers from environment variables.
+
+    The variables are named after the provider, e.g. OPENAI_REQUESTS_PER_MINUTE and OPENAI_TOKENS_PER_MINUTE,
+    to match the usage tier of the account. Empty or missing variables keep the default limits.
+
+    Parameters
+    ----------
+    environ : Mapping[str, str]
+        The environment variables, e.g. os.environ.
+    """
+    for provider in DEFAULT_LIMITS:
+        limits = {}
+        for limit in ("requests_per_minute", "tokens_per_minute"):
+            value = environ.get(f"{provider}_{limit}".upper(), "")
+            if value:
+                limits[limit] = float(value)
+        if limits:
+            configure_rate_limits(provider, **limits)
+
+
+def get_rate_limiter(provider: str, model_name: str) -> RateLimiter:
+    """
+    Returns the process-wide rate limiter of a provider model.
+
+    Parameters
+    ----------
+    provider : str
+        Name of the provider, e.g. "OpenAI".
+    model_name : str
+        Name of the model.
+
+    Returns
+    -------
+    RateLimiter
+        The limiter shared by all sessions using this model.
+    """
+    key = (provider, model_name)
+    with _registry_lock:
+        if key not in _limiters:
+            if provider not in _circuit_breakers:
+                _circuit_breakers[provider] = CircuitBreaker(provider)
+            _limiters[key] = RateLimiter(
+                name=f"{provider} - {model_name}",
+                circuit_breaker=_circuit_breakers[provider],
+                **_limits.get(provider, FALLBACK_LIMITS),
+            )
+        return _limiters[key]
@@ -0,0 +1,257 @@
+"""
+Implements the SimulatedChatStrategy, a concrete strategy that simulates a chat model provider offline.
+It reproduces the timing (time to first token, tokens per second, jitter), the failures, the usage reporting
+and the prompt caching of a real provider, so the app can be benchmarked and load-tested without API keys.
+"""
+
+from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import random
+import threading
+import time
+
+from chat_strategies.chat_model_strategy import ChatModelStrategy
+from chat_strategies.chat_response import AsyncChatStream, ChatResponse, Usage
+from chat_strategies.model_catalog import get_model_catalog
+from chat_strategies.rate_limiter import estimate_prompt_tokens, get_rate_limiter
+from managers.file_manager import num_tokens_from_content
+
+WORDS = (
+    "the model returns a simulated answer with code context tokens and some "
+    "explanation about files functions classes tests latency cache stream"
+).split()
+
+
+class SimulatedAPIError(Exception):
+    """
+    A simulated provider error, shaped like the SDK errors (status code and response headers).
+
+    Parameters
+    ----------
+    status_code : int
+        HTTP status code of the simulated failure.
+    retry_after : float, optional
+        Value of the `Retry-After` header. Default is None.
+    """
+
+    class _Response:
+        def __init__(self, headers: Dict[str, str]):
+            self.headers = headers
+
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"Simulated provider error {status_code}")
+        self.status_code = status_code
+        headers = {} if retry_after is None else {"retry-after": str(retry_after)}
+        self.response = self._Response(headers)
+
+
+class SimulatedChatStrategy(ChatModelStrategy):
+    """
+    A concrete strategy simulating a chat model provider.
+
+    Every request is seeded from `seed` and the request contents, so the same conversation always produces
+    the same answer, timings and failures.
+
+    Parameters
+    ----------
+    ttft : float, optional
+        Mean time to first token in seconds. Default is 0.5.
+    tokens_per_second : float, optional
+        Mean generation speed. Default is 50.
+    jitter : float, optional
+        Relative random variation of the timings, from 0 to 1. Default is 0.2.
+    error_rate : float, optional
+        Probability of a request to fail with a 429 or 5xx error. Default is 0.
+    response_tokens : int, optional
+        Length of the generated answers, capped by max_tokens. Default is 200.
+    cache_min_tokens : int, optional
+        Minimum prompt prefix length that gets cached, 0 disables prompt caching. Default is 1024.
+    cache_ttl : float, optional
+        Lifetime of a cached prefix in seconds. Default is 300.
+    seed : int, optional
+        Seed of the simulation. Default is 0.
+
+    Attributes
+    ----------
+    models : List[Model]
+        A list of available simulated models.
+    catalog : ModelCatalog
+        The process-wide model catalog with the models, limits and prices.
+
+    Methods
+    -------
+    get_models()
+        Returns a list of available model names.
+    get_output_max_tokens(model_name)
+        Returns the maximum number of output tokens for the specified model.
+    async_send_message(system_prompt, messages, model_name, max_tokens, temperature)
+        Simulates a request and returns the generated response.
+    async_stream_message(system_prompt, messages, model_name, max_tokens, temperature)
+        Simulates a streaming request and returns a stream of the generated response.
+    """
+
+    provider = "Simulated"
+    supports_prompt_cache = True
+
+    # Prompt prefixes cached by the simulated provider: prefix hash -> expiration time.
+    # Shared by all instances, as the strategies are recreated on every rerun.
+    cache: Dict[str, float] = {}
+    cache_lock = threading.Lock()
+
+    def __init__(
+        self,
+        ttft: float = 0.5,
+        tokens_per_second: float = 50.0,
+        jitter: float = 0.2,
+        error_rate: float = 0.0,
+        response_tokens: int = 200,
+        cache_min_tokens: int = 1024,
+        cache_ttl: float = 300.0,
+        seed: int = 0,
+    ):
+        self.catalog = get_model_catalog()
+        self.models = self.catalog.get_models(self.provider)
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.response_tokens = response_tokens
+        self.cache_min_tokens = cache_min_tokens
+        self.cache_ttl = cache_ttl
+        self.seed = seed
+
+    def get_models(self) -> List[str]:
+        return self.catalog.get_model_names(self.provider)
+
+    def get_output_max_tokens(self, model_name: str) -> int:
+        return self.catalog.get_model(self.provider, model_name).output_max_tokens
+
+    def _vary(self, rng: random.Random, value: float) -> float:
+        """
+        Applies the jitter to a timing value.
+        """
+        return max(0.0, value * (1 + rng.uniform(-self.jitter, self.jitter)))
+
+    def _simulate_cache(
+        self, system_prompt: str, messages: List[Dict[str, str]]
+    ) -> Usage:
+        """
+        Looks up and stores the prompt prefixes in the simulated cache and returns the input usage.
+        """
+        prefix_hash = hashlib.sha256(system_prompt.encode("utf-8"))
+        prefix_tokens = num_tokens_from_content(system_prompt)
+        # Every prefix ending on a message is a cache breakpoint, except the whole prompt
+        breakpoints = []
+        for message in messages:
+            breakpoints.append((prefix_hash.hexdigest(), prefix_tokens))
+            prefix_hash.update(
+                f"\0{message['role']}\0{message['content']}".encode("utf-8")
+            )
+            prefix_tokens += num_tokens_from_content(message["content"])
+        total_tokens = prefix_tokens
+
+        cached_tokens = 0
+        now = time.monotonic()
+        with self.cache_lock:
+            for key, tokens in breakpoints:
+                if tokens >= self.cache_min_tokens > 0 and self.cache.get(key, 0) > now:
+                    cached_tokens = tokens
+            cacheable = [
+                (key, tokens)
+                for key, tokens in breakpoints
+                if tokens >= self.cache_min_tokens > 0
+            ]
+            for key, _ in cacheable:
+                self.cache[key] = now + self.cache_ttl
+        written_tokens = max([tokens for _, tokens in cacheable], default=0)
+
+        cache_create_tokens = max(0, written_tokens - cached_tokens)
+        return Usage(
+            input_tokens=total_tokens - cached_tokens - cache_create_tokens,
+            cache_create_tokens=cache_create_tokens,
+            cache_read_tokens=cached_tokens,
+        )
+
+    async def async_send_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> ChatResponse:
+        stream = self.async_stream_message(
+            system_prompt=system_prompt,
+            messages=messages,
+            model_name=model_name,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        async for _ in stream:
+            pass
+        return stream.response
+
+    def async_stream_message(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+        temperature: float = 0,
+    ) -> AsyncChatStream:
+        return AsyncChatStream(
+            self._generate(system_prompt, messages, model_name, max_tokens)
+        )
+
+    async def _generate(
+        self,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        model_name: str,
+        max_tokens: int,
+    ):
+        """
+        Simulates the request, yielding the chunks of the response and then the ChatResponse.
+        """
+        started = time.monotonic()
+        request_key = hashlib.sha256(
+            repr((self.seed, model_name, system_prompt, messages)).encode("utf-8")
+        ).hexdigest()
+        rng = random.Random(request_key)
+
+        async def first_token() -> None:
+            # Failures happen before the first token, like rate limits and overloads
+            await asyncio.sleep(self._vary(rng, self.ttft))
+            if rng.random() < self.error_rate:
+                status_code = rng.choice([429, 500, 503])
+                raise SimulatedAPIError(
+                    status_code, retry_after=1.0 if status_code == 429 else None
+                )
+
+        estimated_tokens = estimate_prompt_tokens(system_prompt, messages)
+        await get_rate_limiter(self.provider, model_name).async_call(
+            first_token, estimated_tokens=estimated_tokens
+        )
+        input_usage = self._simulate_cache(system_prompt, messages)
+
+        chunks = []
+        for i in range(min(max_tokens, self.response_tokens)):
+            if i > 0:
+                await asyncio.sleep(self._vary(rng, 1.0 / self.tokens_per_second))
+            chunks.append(("" if i == 0 else " ") + rng.choice(WORDS))
+            yield chunks[-1]
+
+        yield self._build_response(
+            "".join(chunks),
+            Usage(
+                input_tokens=input_usage.input_tokens,
+                output_tokens=len(chunks),
+                cache_create_tokens=input_usage.cache_create_tokens,
+                cache_read_tokens=input_usage.cache_read_tokens,
+            ),
+            model_name,
+            started,
+            {"simulated": True},
+            estimated_tokens,
+        )
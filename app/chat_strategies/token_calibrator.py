@@ -0,0 +1,210 @@
+"""
+Learns per model how the local token count (the GPT-3.5 tokenizer of `num_tokens_from_content`) maps to the
+prompt tokens billed by the provider, from the usage reported with every response.
+
+The correction is a linear fit (billed = slope * local + overhead) over exponentially decayed samples, so it
+follows tokenizer changes, and is persisted across restarts.
+"""
+
+from typing import Dict
+import atexit
+import json
+import os
+import threading
+import time
+
+DEFAULT_CALIBRATION_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "data",
+    "token_calibration.json",
+)
+
+# Minimum seconds between two writes of the calibration file, the last samples are written at exit
+SAVE_INTERVAL = 30.0
+
+# Weight kept by the previous samples at every new one, about the last 50 responses count
+DECAY = 0.98
+# Corrections are applied once a model has this many samples
+MIN_SAMPLES = 3
+# Below this relative spread of the local counts, the overhead cannot be fitted and only the ratio is used
+MIN_SPREAD = 0.2
+
+
+class TokenCalibrator:
+    """
+    Class for correcting the local token counts with the usage reported by the providers.
+
+    Parameters
+    ----------
+    path : str, optional
+        Path of the JSON file the calibration is persisted to, None to keep it in memory only.
+        Default is None.
+
+    Methods
+    -------
+    record(provider: str, model_name: str, local_tokens: int, reported_tokens: int) -> None
+        Adds a sample to the calibration of a model.
+    correct(provider: str, model_name: str, local_tokens: int) -> int
+        Returns the local token count corrected for a model.
+    summary() -> Dict[str, Dict[str, float]]
+        Returns the calibration of every model.
+    flush() -> None
+        Writes the samples not persisted yet.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.lock = threading.Lock()
+        # Per "provider/model": decayed sample count and sums of x, y, x², xy (x local, y reported),
+        # and the undecayed "count" of samples
+        self.sums: Dict[str, Dict[str, float]] = {}
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.sums = json.load(f)
+            except (OSError, ValueError):
+                # A corrupted file only costs the calibration, it is rebuilt from the next responses
+                self.sums = {}
+
+    def record(
+        self, provider: str, model_name: str, local_tokens: int, reported_tokens: int
+    ) -> None:
+        """
+        Adds a sample to the calibration of a model.
+
+        Parameters
+        ----------
+        provider : str
+            Name of the provider.
+        model_name : str
+            Name of the model.
+        local_tokens : int
+            Number of prompt tokens counted locally before sending.
+        reported_tokens : int
+            Number of prompt tokens reported by the provider, cached or not.
+        """
+        if not provider or local_tokens <= 0 or reported_tokens <= 0:
+            return
+        with self.lock:
+            sums = self.sums.setdefault(
+                f"{provider}/{model_name}",
+                {"n": 0.0, "x": 0.0, "y": 0.0, "xx": 0.0, "xy": 0.0},
+            )
+            for key in ("n", "x", "y", "xx", "xy"):
+                sums[key] *= DECAY
+            sums["n"] += 1
+            # Undecayed, the decayed count stays below MIN_SAMPLES after MIN_SAMPLES samples
+            sums["count"] = sums.get("count", 0) + 1
+            sums["x"] += local_tokens
+            sums["y"] += reported_tokens
+            sums["xx"] += local_tokens * local_tokens
+            sums["xy"] += local_tokens * reported_tokens
+            self.dirty = True
+            if time.monotonic() - self.saved_at >= SAVE_INTERVAL:
+                self._save()
+
+    def flush(self) -> None:
+        """
+        Writes the samples not persisted yet.
+        """
+        with self.lock:
+            if self.dirty:
+                self._save()
+
+    def _save(self) -> None:
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Write then rename, so that a crash never leaves a truncated file
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.sums, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _fit(self, sums: Dict[str, float]) -> Dict[str, float]:
+        """
+        Returns the slope and the overhead fitted on the samples of a model.
+        """
+        n = sums["n"]
+        mean_x, mean_y = sums["x"] / n, sums["y"] / n
+        variance = sums["xx"] / n - mean_x * mean_x
+        if variance > (MIN_SPREAD * mean_x) ** 2:
+            slope = (sums["xy"] / n - mean_x * mean_y) / variance
+            overhead = mean_y - slope * mean_x
+            if slope > 0:
+                return {"slope": slope, "overhead": overhead}
+        return {"slope": sums["y"] / sums["x"], "overhead": 0.0}
+
+    def correct(self, provider: str, model_name: str, local_tokens: int) -> int:
+        """
+        Returns the local token count corrected for a model.
+
+        Parameters
+        ----------
+        provider : str
+            Name of the provider.
+        model_name : str
+            Name of the model.
+        local_tokens : int
+            Number of tokens counted locally.
+
+        Returns
+        -------
+        int
+            The expected number of billed tokens, the local count if the model is not calibrated yet.
+        """
+        with self.lock:
+            sums = self.sums.get(f"{provider}/{model_name}")
+            if (
+                not local_tokens
+                or not sums
+                or sums.get("count", sums["n"]) < MIN_SAMPLES
+            ):
+                return local_tokens
+            fit = self._fit(sums)
+        return max(0, round(fit["slope"] * local_tokens + fit["overhead"]))
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the calibration of every model.
+
+        Returns
+        -------
+        Dict[str, Dict[str, float]]
+            Per "provider/model": the decayed number of samples, the slope and the per-request overhead.
+        """
+        with self.lock:
+            return {
+                key: {"samples": sums["n"], **self._fit(sums)}
+                for key, sums in self.sums.items()
+            }
+
+
+_calibrator = None
+_calibrator_lock = threading.Lock()
+
+
+def get_token_calibrator() -> TokenCalibrator:
+    """
+    Returns the process-wide token calibrator, loading it on first use.
+
+    The data file is DEFAULT_CALIBRATION_FILE, or the file set in the TOKEN_CALIBRATION_FILE environment variable.
+
+    Returns
+    -------
+    TokenCalibrator
+        The calibrator shared by all sessions.
+    """
+    global _calibrator  # pylint: disable=global-statement
+    if _calibrator is None:
+        with _calibrator_lock:
+            if _calibrator is None:
+                _calibrator = TokenCalibrator(
+                    os.environ.get("TOKEN_CALIBRATION_FILE", DEFAULT_CALIBRATION_FILE)
+                )
+                atexit.register(_calibrator.flush)
+    return _calibrator
@@ -3,12 +3,30 @@ Implements the chat tab in the Streamlit app, handling user input, displaying ch
 and interacting with the selected chat strategy.
 """
 
-from typing import Dict
+from contextlib import nullcontext
+from typing import Any, Dict
 import streamlit as st
 import json
+import os
 from chat_strategies.chat_model_strategy import ChatModelStrategy
+from chat_strategies.generation_job import GenerationJob
+from chat_strategies.rate_limiter import ProviderUnavailableError
 from managers.chat_history_manager import ChatHistoryManager
+from managers.context_manager import ContextManager
+from managers.conversation_tree import ConversationTree
+from managers.cost_estimator import CostEstimate, CostEstimator
 from managers.log_manager import LogManager
+from managers.memory_manager import (
+    SpillLostError,
+    restore_content,
+    restore_conversation,
+)
+from managers.request_profiler import RequestProfiler
+
+# Number of recent messages rendered, and loaded at once with "Load older messages"
+CHAT_WINDOW = 20
+# Shown with the contents spilled to disk that could not be loaded back
+SPILL_LOST_HINT = "Reload the context files or clear the chat history."
 
 
 class ChatTab:
@@ -30,6 +48,10 @@ class ChatTab:
         Instance of the LogManager class for logging.
     chat_history_manager : ChatHistoryManager
         Instance of the ChatHistoryManager class for managing chat history.
+    context_manager : ContextManager
+        Instance of the ContextManager class for building the context messages.
+    cost_estimator : CostEstimator
+        Instance of the CostEstimator class for estimating the cost before sending.
 
     Methods
     -------
@@ -46,6 +68,8 @@ class ChatTab:
         max_tokens: int,
         log_manager: LogManager,
         chat_history_manager: ChatHistoryManager,
+        context_manager: ContextManager,
+        cost_estimator: CostEstimator,
     ):
         self.strategies = strategies
         self.current_strategy = current_strategy
@@ -55,16 +79,171 @@ class ChatTab:
         self.max_tokens = max_tokens
         self.log_manager = log_manager
         self.chat_history_manager = chat_history_manager
+        self.context_manager = context_manager
+        self.cost_estimator = cost_estimator
+        # Request profiles are saved next to the log
+        self.request_profiler = RequestProfiler(
+            os.path.dirname(log_manager.log_file_path)
+        )
+
+    def _estimate(self, user_message: str) -> CostEstimate:
+        """
+        Estimates the cost of sending the user message with the current settings.
+        """
+        return self.cost_estimator.estimate(
+            strategy=self.strategies[self.current_strategy],
+            model_name=self.current_model,
+            system_prompt=self.settings["system_prompt"],
+            context=st.session_state.get("context", []),
+            messages=st.session_state.messages,
+            user_message=user_message,
+            max_tokens=self.max_tokens,
+            # A started conversation sends the context frozen at its start, plus the diffs in the history
+            context_messages=(
+                st.session_state.get("context_messages")
+                if st.session_state.messages
+                else None
+            ),
+        )
+
+    def _check_budget(self, estimate: CostEstimate) -> str:
+        """
+        Checks the estimate against the request and session budgets.
+
+        Returns
+        -------
+        str
+            Description of the exceeded budget, empty if the request fits.
+        """
+        request_budget = self.settings.get("request_budget", 0.0)
+        session_budget = self.settings.get("session_budget", 0.0)
+        total_cost = st.session_state.get("total_cost", 0.0)
+        if request_budget and estimate.max_cost > request_budget:
+            return (
+                f"This request may cost up to {estimate.max_cost:.4f} $, "
+                f"over the request budget of {request_budget} $."
+            )
+        if session_budget and total_cost + estimate.max_cost > session_budget:
+            return (
+                f"This request may bring the session cost to "
+                f"{total_cost + estimate.max_cost:.4f} $, "
+                f"over the session budget of {session_budget} $."
+            )
+        return ""
+
+    def _start_prewarm(self) -> None:
+        """
+        Starts a minimal request writing the system prompt and the context to the provider prompt cache.
+
+        Skipped for a started conversation, whose context message is kept as is, for the providers
+        without prompt caching, for a prefix too short to be cached and over budget.
+        """
+        # A previous pre-warm is paid for as well
+        self._collect_prewarm(wait=True)
+        strategy = self.strategies.get(self.current_strategy)
+        if (
+            not self.settings.get("prewarm_cache")
+            or not strategy
+            or not strategy.supports_prompt_cache
+            or st.session_state.messages
+            or "generation" in st.session_state
+        ):
+            return
+        if not self._restore_spilled():
+            return
+        context = st.session_state.get("context", [])
+        messages = self.context_manager.build_prewarm_messages(context)
+        estimate = self.cost_estimator.estimate(
+            strategy=strategy,
+            model_name=self.current_model,
+            system_prompt=self.settings["system_prompt"],
+            context=context,
+            messages=[],
+            user_message=messages[-1]["content"] if messages else "",
+            max_tokens=1,
+        )
+        if not estimate.cache_create_tokens:
+            return
+        budget_warning = self._check_budget(estimate)
+        if budget_warning:
+            self.log_manager.add_log(f"Prompt cache pre-warm skipped: {budget_warning}")
+            return
+
+        job = GenerationJob(
+            strategy=strategy,
+            strategy_name=self.current_strategy,
+            system_prompt=self.settings["system_prompt"],
+            messages=messages,
+            model_name=self.current_model,
+            max_tokens=1,
+            temperature=self.temperature,
+        )
+        job.start()
+        st.session_state["prewarm"] = job
+
+    def _collect_prewarm(self, wait: bool = False) -> None:
+        """
+        Records the cost of the finished pre-warm request.
+
+        Parameters
+        ----------
+        wait : bool, optional
+            Whether to wait for a running pre-warm, so that the next request reads the cache
+            instead of writing it again. Default is False.
+        """
+        job = st.session_state.get("prewarm")
+        if not job:
+            return
+        if wait and not job.done():
+            with st.spinner("Pre-warming the prompt cache..."):
+                job.wait()
+        if not job.done():
+            return
+        st.session_state.pop("prewarm")
+
+        if job.error:
+            self.log_manager.add_log(
+                f"Prompt cache pre-warm failed: {job.strategy_name} - {job.model_name}: {job.error}"
+            )
+            return
+        usage = job.response.usage
+        st.session_state["total_cost"] = (
+            st.session_state.get("total_cost", 0.0) + job.response.cost
+        )
+        self.log_manager.add_log(
+            f"Prompt cache pre-warm: {job.strategy_name} - {job.model_name}"
+        )
+        self.log_manager.add_log(
+            f"Cache_create_tokens: {usage.cache_create_tokens}, Cache_read_tokens: {usage.cache_read_tokens}"
+        )
+        self.log_manager.add_log(
+            f" Price: {job.response.cost} $ (~{job.response.cost*100:,.3} Rub)"
+        )
+        self.log_manager.add_log("=" * 40)
+
+    def _render_context_update(self, message: Dict[str, str]) -> None:
+        """
+        Displays a context update message, collapsed.
+        """
+        with st.expander("Context update"):
+            st.code(message["content"], language="diff")
 
     def render(self) -> None:
         """
         Renders the chat tab in the Streamlit app.
         """
         if st.button("Clear chat history"):
-            # Clear chat history and logs
+            # Stop the running generation, its answer would land in the cleared chat
+            if "generation" in st.session_state:
+                st.session_state.pop("generation").stop()
+            if "request_profile" in st.session_state:
+                st.session_state.pop("request_profile").finish()
+            # Clear chat history, its branches and logs
             st.session_state["messages"] = []
+            st.session_state.pop("conversation_tree", None)
             st.session_state["logs"] = []
             st.session_state["total_cost"] = 0.0
+            st.session_state["chat_window"] = CHAT_WINDOW
 
         if st.button("Save chat"):
             # Save chat history to a file
@@ -73,97 +252,316 @@ class ChatTab:
             )
             st.success(f"Chat saved to file: {filepath}")
 
+        st.checkbox(
+            "Profile requests",
+            key="profile_requests",
+            help="""
+            Profiles the next requests with cProfile and tracemalloc, from the context build to the logging,
+            and saves the reports next to the log. Slows the requests down.""",
+        )
+
         if "messages" not in st.session_state:
             st.session_state["messages"] = []
+        if "spill_error" in st.session_state:
+            st.error(st.session_state.pop("spill_error"))
+
+        if st.session_state.pop("prewarm_pending", False):
+            self._start_prewarm()
+        self._collect_prewarm()
+
+        tree = st.session_state.setdefault("conversation_tree", ConversationTree())
+        tree.sync(
+            st.session_state.messages,
+            st.session_state.get("context_messages"),
+            st.session_state.get("context_snapshot"),
+        )
+        generating = "generation" in st.session_state
+        if len(tree.branches) > 1:
+            branch_names = tree.branch_names()
+            branch = st.selectbox(
+                "Branch",
+                branch_names,
+                index=branch_names.index(tree.current),
+                format_func=tree.describe,
+                disabled=generating,
+            )
+            if branch != tree.current:
+                self._load_branch(tree.switch(branch))
+                st.rerun()
+
+        # Display only the recent messages, so the rerun time does not grow with the conversation
+        window = st.session_state.setdefault("chat_window", CHAT_WINDOW)
+        hidden = max(0, len(st.session_state.messages) - window)
+        if hidden and st.button(
+            f"Load older messages ({hidden} hidden)", key="load_older_messages"
+        ):
+            st.session_state["chat_window"] = window + CHAT_WINDOW
+            hidden = max(0, hidden - CHAT_WINDOW)
 
         # Display chat messages
-        for msg in st.session_state.messages:
-            st.chat_message(msg["role"]).write(msg["content"])
+        for index, msg in enumerate(st.session_state.messages[hidden:], start=hidden):
+            if msg.get("context_update"):
+                if msg["role"] == "user":
+                    self._render_context_update(msg)
+                continue
+            with st.chat_message(msg["role"]):
+                st.write(msg["content"])
+                if msg["role"] == "user" and st.button(
+                    "Fork here",
+                    key=f"fork_{index}",
+                    disabled=generating,
+                    help="Starts a new branch with the messages before this one, to ask something else",
+                ):
+                    self._load_branch(tree.fork(index))
+                    st.rerun()
 
-        if prompt := st.chat_input():
+        if self.current_strategy:
+            # Cost of the fixed part of the next request: prompt, context and history
+            estimate = self._estimate("")
+            st.caption(
+                f"Next request: ~{estimate.prompt_tokens} prompt tokens "
+                f"({estimate.cache_read_tokens} cached), "
+                f"~{estimate.prompt_cost:.4f} $ + up to "
+                f"{estimate.max_cost - estimate.prompt_cost:.4f} $ for the output"
+            )
+
+        job = st.session_state.get("generation")
+        prompt = st.chat_input(disabled=job is not None)
+        confirmed = False
+        if not prompt and "pending_prompt" in st.session_state:
+            # An over-budget request is waiting for confirmation
+            st.warning(st.session_state["pending_prompt_warning"])
+            col_send, col_cancel = st.columns(2)
+            if col_send.button("Send anyway"):
+                prompt = st.session_state.pop("pending_prompt")
+                confirmed = True
+            elif col_cancel.button("Cancel"):
+                st.session_state.pop("pending_prompt")
+                st.rerun()
+
+        if prompt:
             if not self.current_strategy:
                 st.info("Please add your API key to continue. [OpenAI or Anthropic]")
                 st.stop()
 
-            # Add user message to chat history
-            st.session_state.messages.append({"role": "user", "content": f"{prompt}"})
-            st.chat_message("user").write(prompt)
-
-            context_str = ""
-            if "context" in st.session_state:
-                # Build context string from session state
-                for item in st.session_state["context"]:
-                    context_str += "LOCAL FILEPATH: " + item["path"] + "\n"
-                    context_str += "CONTENTS:\n" + item["content"] + "\n\n"
-
-            messages_with_context = []
-
-            if len(context_str) > 0:
-                # Add context to messages
-                messages_with_context.extend(
-                    [
-                        {"role": "user", "content": f"Context:\n\n{context_str}"},
-                        {"role": "assistant", "content": "Ok, I got it!"},
-                    ]
+            if not confirmed:
+                budget_warning = self._check_budget(self._estimate(prompt))
+                if budget_warning and self.settings.get("budget_action") == "block":
+                    st.error(budget_warning)
+                    st.stop()
+                if budget_warning:
+                    st.session_state["pending_prompt"] = prompt
+                    st.session_state["pending_prompt_warning"] = budget_warning
+                    st.rerun()
+
+            # The context is sent whole, a part lost from disk would go missing silently
+            if not self._restore_spilled():
+                st.stop()
+
+            profile = None
+            if st.session_state.get("profile_requests"):
+                profile = self.request_profiler.start(
+                    f"{self.current_strategy} - {self.current_model}"
                 )
+                st.session_state["request_profile"] = profile
+            with profile.capture() if profile else nullcontext():
+                job = self._start_generation(prompt)
 
-            # Add chat history to messages with context
-            messages_with_context.extend(st.session_state.messages.copy())
+        if job:
+            # A Stop click interrupts the rerun, the profile is resumed on the next one
+            profile = st.session_state.get("request_profile")
+            try:
+                with profile.capture() if profile else nullcontext():
+                    self._render_generation(job)
+            finally:
+                if profile and job.done():
+                    st.session_state.pop("request_profile", None)
+                    report_path = self.request_profiler.save(profile)
+                    self.log_manager.add_log(f"Request profile: {report_path}")
 
-            # Send message to chat model and get response
-            msg = self.strategies[self.current_strategy].send_message(
-                system_prompt=self.settings["system_prompt"],
-                messages=messages_with_context,
-                model_name=self.current_model,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
+    def _restore_spilled(self) -> bool:
+        """
+        Loads back the context and the conversation parts spilled to disk over the memory cap.
+        Returns False, with an error displayed, if a part was lost.
+        """
+        try:
+            for item in st.session_state.get("context", []):
+                restore_content(item)
+            restore_conversation(
+                [],
+                st.session_state.get("context_messages"),
+                st.session_state.get("context_snapshot"),
             )
+        except SpillLostError as error:
+            st.error(f"{error}. {SPILL_LOST_HINT}")
+            return False
+        return True
 
-            # Add assistant response to chat history
-            st.session_state.messages.append({"role": "assistant", "content": msg})
-            with st.chat_message("assistant"):
-                st.write(msg)
-
-            # Get token counts and price from the chat strategy
-            input_tokens = self.strategies[self.current_strategy].get_input_tokens()
-            output_tokens = self.strategies[self.current_strategy].get_output_tokens()
-            cache_create_tokens = self.strategies[
-                self.current_strategy
-            ].get_cache_create_tokens()
-            cache_read_tokens = self.strategies[
-                self.current_strategy
-            ].get_cache_read_tokens()
-            total_price = self.strategies[self.current_strategy].get_full_price()
-
-            # Update total cost in session state
-            if "total_cost" not in st.session_state:
-                st.session_state["total_cost"] = total_price
+    def _load_branch(self, branch: Dict[str, Any]) -> None:
+        """
+        Makes a branch of the conversation tree the displayed and continued conversation.
+        """
+        try:
+            restore_conversation(
+                branch["messages"],
+                branch["context_messages"],
+                branch["context_snapshot"],
+            )
+        except SpillLostError as error:
+            # Displayed after the rerun that shows the branch
+            st.session_state["spill_error"] = f"{error}. {SPILL_LOST_HINT}"
+        st.session_state["messages"] = branch["messages"]
+        for key in ("context_messages", "context_snapshot"):
+            if branch[key] is None:
+                st.session_state.pop(key, None)
             else:
-                st.session_state["total_cost"] += total_price
-
-            # Display token counts and price
-            st.write(
-                [
-                    f"Input_tokens: {input_tokens},Output_tokens: {output_tokens}",
-                    f"Cache_create_tokens: {cache_create_tokens}, Cache_read_tokens: {cache_read_tokens}",
-                    f"Price: {total_price} $ (~{total_price*100:.2f} Rub)",
-                ]
+                st.session_state[key] = branch[key]
+        st.session_state["chat_window"] = CHAT_WINDOW
+
+    def _start_generation(self, prompt: str) -> GenerationJob:
+        """
+        Builds the context, adds the user message to the history and starts the generation.
+        """
+        self._collect_prewarm(wait=True)
+        context = st.session_state.get("context", [])
+        # The prompt prefix of a started conversation is read from the prompt cache
+        cached_prefix = bool(st.session_state.messages)
+        if not st.session_state.messages or "context_messages" not in st.session_state:
+            # New conversation: the context message is built once and then kept as is,
+            # so that the prompt prefix stays cached
+            st.session_state["context_messages"] = (
+                self.context_manager.build_context_messages(context)
             )
-            # Log chat information
-            self.log_manager.add_log(f"{self.current_strategy} - {self.current_model}")
-            self.log_manager.add_log(
-                f"Input_tokens: {input_tokens},Output_tokens: {output_tokens}"
+            st.session_state["context_snapshot"] = self.context_manager.snapshot(
+                context
             )
+        else:
+            # Changed files are appended to the history as diffs
+            context_update = self.context_manager.build_context_update(
+                st.session_state["context_snapshot"], context
+            )
+            if context_update:
+                st.session_state.messages.extend(context_update)
+                st.session_state["context_snapshot"] = self.context_manager.snapshot(
+                    context
+                )
+                self._render_context_update(context_update[0])
+
+        # Add user message to chat history
+        st.session_state.messages.append({"role": "user", "content": f"{prompt}"})
+        st.chat_message("user").write(prompt)
+
+        # Add chat history to messages with context
+        messages_with_context = st.session_state[
+            "context_messages"
+        ] + self.context_manager.clean_messages(st.session_state.messages)
+
+        # Generate the response in the background, the script only polls it
+        job = GenerationJob(
+            strategy=self.strategies[self.current_strategy],
+            strategy_name=self.current_strategy,
+            system_prompt=self.settings["system_prompt"],
+            messages=messages_with_context,
+            model_name=self.current_model,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            cached_prefix=cached_prefix,
+        )
+        job.start()
+        st.session_state["generation"] = job
+        return job
+
+    def _render_generation(self, job: GenerationJob) -> None:
+        """
+        Displays the response while it is generated and records it once finished.
+
+        Clicking Stop reruns the script, which interrupts the polling and cancels the job on the next run.
+        """
+        with st.chat_message("assistant"):
+            placeholder = st.empty()
+            stop_placeholder = st.empty()
+            if stop_placeholder.button("Stop", key="stop_generation"):
+                job.stop()
+            while not job.wait(0.1):
+                placeholder.markdown(job.get_text() + "▌")
+            stop_placeholder.empty()
+        st.session_state.pop("generation", None)
+
+        if isinstance(job.error, ProviderUnavailableError):
             self.log_manager.add_log(
-                f"Cache_create_tokens: {cache_create_tokens}, Cache_read_tokens: {cache_read_tokens}"
+                f"{job.strategy_name} - {job.model_name}: {job.error}"
             )
+            # Drop the unanswered message so the history stays consistent
+            st.session_state.messages.pop()
+            placeholder.empty()
+            st.error(f"{job.error}. Please try again later or choose another model.")
+            st.stop()
+        if job.error:
+            st.session_state.messages.pop()
+            raise job.error
+
+        response = job.response
+        msg = response.text
+
+        # Add assistant response to chat history
+        st.session_state.messages.append({"role": "assistant", "content": msg})
+        placeholder.write(msg)
+        if job.stopped:
+            st.caption("Generation stopped, the usage is estimated.")
+
+        # Get token counts and price from the response
+        input_tokens = response.usage.input_tokens
+        output_tokens = response.usage.output_tokens
+        cache_create_tokens = response.usage.cache_create_tokens
+        cache_read_tokens = response.usage.cache_read_tokens
+        total_price = response.cost
+
+        # Update total cost in session state
+        if "total_cost" not in st.session_state:
+            st.session_state["total_cost"] = total_price
+        else:
+            st.session_state["total_cost"] += total_price
+
+        # Display token counts and price
+        st.write(
+            [
+                f"Input_tokens: {input_tokens},Output_tokens: {output_tokens}",
+                f"Cache_create_tokens: {cache_create_tokens}, Cache_read_tokens: {cache_read_tokens}",
+                f"Price: {total_price} $ (~{total_price*100:.2f} Rub)",
+            ]
+        )
+        # Log chat information
+        self.log_manager.add_log(f"{job.strategy_name} - {job.model_name}")
+        if response.provider and (response.provider, response.model) != (
+            job.strategy_name,
+            job.model_name,
+        ):
             self.log_manager.add_log(
-                f" Price: {total_price} $ (~{total_price*100:,.3} Rub)"
+                f"Answered by: {response.provider} - {response.model}"
             )
-            self.log_manager.add_log("=" * 40)
-            self.log_manager.add_log(messages_with_context)
+        if response.metadata.get("hedge_cost"):
             self.log_manager.add_log(
-                json.dumps(st.session_state.messages, indent=2, ensure_ascii=False)
+                f"Cancelled hedges: {', '.join(response.metadata['cancelled_hedges'])}, "
+                f"estimated cost {response.metadata['hedge_cost']} $ (included in the price)"
             )
-            self.log_manager.add_log("=" * 40)
-            self.log_manager.add_log(msg)
+        if response.metadata.get("route"):
+            self.log_manager.add_log(f"Route: {response.metadata['route']}")
+        if job.stopped:
+            self.log_manager.add_log("Stopped by the user, estimated usage")
+        self.log_manager.add_log(f"Latency: {response.latency:.2f} s")
+        self.log_manager.add_log(
+            f"Input_tokens: {input_tokens},Output_tokens: {output_tokens}"
+        )
+        self.log_manager.add_log(
+            f"Cache_create_tokens: {cache_create_tokens}, Cache_read_tokens: {cache_read_tokens}"
+        )
+        self.log_manager.add_log(
+            f" Price: {total_price} $ (~{total_price*100:,.3} Rub)"
+        )
+        self.log_manager.add_log("=" * 40)
+        self.log_manager.add_log(job.messages)
+        self.log_manager.add_log(
+            json.dumps(st.session_state.messages, indent=2, ensure_ascii=False)
+        )
+        self.log_manager.add_log("=" * 40)
+        self.log_manager.add_log(msg)
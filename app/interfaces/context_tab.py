@@ -4,7 +4,11 @@ Implements the context tab in the Streamlit app, managing context files and disp
 
 import streamlit as st
 import pandas as pd
-from managers.file_manager import FileManager
+from managers.context_minifier import ContextMinifier
+from managers.file_manager import FileManager, num_tokens_from_content
+from managers.import_graph import ImportGraph
+from managers.memory_manager import discard_spilled
+from managers.settings_manager import SettingsManager
 
 
 class ContextTab:
@@ -14,34 +18,62 @@ class ContextTab:
     ----------
     file_manager : FileManager
         Instance of the FileManager class for managing files.
+    settings_manager : SettingsManager
+        Instance of the SettingsManager class, providing the context sources of the settings.
 
     Methods
     -------
     update_context()
-        Updates the context by reading files based on the settings.
+        Updates the context by reading and minifying files based on the settings.
     display_files_info()
         Displays information about the context files.
+    select_by_imports()
+        Enables the entry files chosen by the user and the local files they import.
     render()
         Renders the context tab in the Streamlit app.
     """
 
-    def __init__(self, file_manager: FileManager):
+    def __init__(self, file_manager: FileManager, settings_manager: SettingsManager):
         self.settings = st.session_state["settings"]
         self.file_manager = file_manager
+        self.settings_manager = settings_manager
 
     def update_context(self) -> None:
         """
-        Updates the context by reading files based on the settings.
+        Updates the context by reading and minifying files based on the settings.
         """
-        files = self.file_manager.read_files(
-            folder_path=self.settings["folder_path"],
+        files = self.file_manager.read_sources(
+            sources=self.settings_manager.context_sources(self.settings),
             target_extensions=self.settings["target_extensions"],
             always_include=self.settings["always_include"],
             excluded_dirs=self.settings["excluded_dirs"],
         )
 
+        # Imports are parsed from the original contents, only for the changed files
+        st.session_state.setdefault("import_graph", ImportGraph()).update(files)
+
+        minifier = ContextMinifier(
+            self.settings.get("context_minify", "none"),
+            expand=self.settings.get("outline_expand", "").split(","),
+        )
+        for item in files:
+            item["original_tokens"] = item["tokens"]
+            if minifier.level != "none":
+                item["header"] = minifier.header(item["path"])
+                item["content"] = minifier.minify(item["path"], item["content"])
+                item["tokens"] = num_tokens_from_content(item["content"])
+                # The lines of a truncated file are those of the whole file
+                if not item.get("truncated"):
+                    item["lines"] = (
+                        (item["content"].count("\n") + 1) if item["content"] else 0
+                    )
+
+        # The previous files may have contents spilled to disk
+        discard_spilled(st.session_state.get("full_context", []))
         st.session_state["full_context"] = files
         st.session_state["context"] = st.session_state["full_context"]
+        # The chat tab pre-warms the prompt cache with the new context, if enabled
+        st.session_state["prewarm_pending"] = True
 
         if "update_context_key" not in st.session_state:
             st.session_state["update_context_key"] = 0
@@ -56,14 +88,65 @@ class ContextTab:
             "Total files:",
             sum([1 for _ in st.session_state["context"]]),
         )
+        total_tokens = sum([x["tokens"] for x in st.session_state["context"]])
+        original_tokens = sum(
+            [x.get("original_tokens", x["tokens"]) for x in st.session_state["context"]]
+        )
         st.write(
             "Total tokens:",
-            sum([x["tokens"] for x in st.session_state["context"]]),
+            total_tokens,
         )
+        if original_tokens != total_tokens:
+            st.write(
+                "Tokens before minification:",
+                original_tokens,
+                f"(-{100 * (1 - total_tokens / original_tokens):.1f}%)",
+            )
         st.write(
             "Total lines:",
             sum([x["lines"] for x in st.session_state["context"]]),
         )
+        truncated = sum(1 for x in st.session_state["context"] if x.get("truncated"))
+        if truncated:
+            st.write(
+                "Truncated files:",
+                truncated,
+                "(only their head and tail are sent)",
+            )
+
+    def select_by_imports(self) -> None:
+        """
+        Enables the entry files chosen by the user and the local files they import.
+        """
+        graph = st.session_state.get("import_graph")
+        python_paths = [
+            item["path"]
+            for item in st.session_state["full_context"]
+            if item["path"].endswith(".py")
+        ]
+        if not graph or not python_paths:
+            st.info("Update the context with Python files to select them by imports.")
+            return
+
+        entries = st.multiselect(
+            "Entry files",
+            python_paths,
+            key="import_entries",
+            help="The context is these files and the local files they import, transitively",
+        )
+        depth = st.number_input(
+            "Import depth",
+            min_value=0,
+            value=2,
+            key="import_depth",
+            help="Number of import levels followed, 0 for no limit",
+        )
+        if st.button("Select imported files", disabled=not entries):
+            selected = set(graph.closure(entries, depth))
+            for item in st.session_state["full_context"]:
+                item["Enable"] = item["path"] in selected
+            # A new editor key shows the new selection instead of the edited one
+            st.session_state["update_context_key"] += 1
 
     def render(self) -> None:
         """
@@ -84,6 +167,9 @@ class ContextTab:
                 item["Enable"] = False
 
         if "context" in st.session_state:
+            with st.expander("Select by imports", expanded=False):
+                self.select_by_imports()
+
             update_context_key = (
                 st.session_state["update_context_key"]
                 if st.session_state["update_context_key"]
@@ -97,13 +183,17 @@ class ContextTab:
                         {
                             "Path": item["path"],
                             "Tokens": item["tokens"],
+                            "Original tokens": item.get(
+                                "original_tokens", item["tokens"]
+                            ),
                             "Lines": item["lines"],
+                            "Truncated": item.get("truncated", False),
                             "Enable": item.get("Enable", True),
                         }
                         for item in st.session_state["full_context"]
                     ]
                 ),
-                disabled=["Path", "Tokens", "Lines"],
+                disabled=["Path", "Tokens", "Original tokens", "Lines", "Truncated"],
                 key=update_context_key,
             )
             # Filter context based on enabled files
@@ -111,6 +201,7 @@ class ContextTab:
                 st.session_state["files_list"]["Enable"]
             ]["Path"].tolist()
 
+            # Files spilled to disk over the memory cap are loaded back by the next request
             st.session_state["context"] = [
                 item
                 for item in st.session_state["full_context"]
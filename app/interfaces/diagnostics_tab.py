@@ -0,0 +1,166 @@
+"""
+Implements the diagnostics tab in the Streamlit app, displaying the memory held by the sessions,
+the token calibration of the models and the rerun profiles.
+"""
+
+import json
+import streamlit as st
+import pandas as pd
+
+from chat_strategies.token_calibrator import get_token_calibrator
+from managers.memory_manager import MemoryManager, format_size
+from managers.profiler import RerunProfiler
+
+# Number of rerun profiles kept in the session
+MAX_PROFILES = 50
+
+
+class DiagnosticsTab:
+    """Class representing the diagnostics tab in the Streamlit app.
+
+    Parameters
+    ----------
+    profiler : RerunProfiler
+        Profiler of the current rerun.
+    memory_manager : MemoryManager
+        Instance of the MemoryManager class accounting for the session memory.
+    session_id : str
+        Id of the current session.
+
+    Methods
+    -------
+    save_profile()
+        Stores the profile of the current rerun in the session.
+    render_memory()
+        Displays the memory held by the current session and by all the sessions.
+    render_calibration()
+        Displays the token calibration of the models.
+    render_profiles()
+        Displays the rerun profiles.
+    render()
+        Renders the diagnostics tab in the Streamlit app.
+    """
+
+    def __init__(
+        self, profiler: RerunProfiler, memory_manager: MemoryManager, session_id: str
+    ):
+        self.profiler = profiler
+        self.memory_manager = memory_manager
+        self.session_id = session_id
+
+    def save_profile(self) -> None:
+        """
+        Stores the profile of the current rerun in the session.
+        """
+        profiles = st.session_state.setdefault("profiles", [])
+        profiles.append(self.profiler.report())
+        del profiles[:-MAX_PROFILES]
+
+    def render_memory(self) -> None:
+        """
+        Displays the memory held by the current session and by all the sessions.
+        """
+        st.subheader("Memory")
+        # Measuring walks the whole session state, only done on demand
+        if not st.checkbox("Measure the memory of the sessions", key="measure_memory"):
+            return
+        keys = self.memory_manager.account(self.session_id, st.session_state)
+        sessions = self.memory_manager.sessions()
+        session_total = sessions[self.session_id]["total"]
+        global_total = sum(session["total"] for session in sessions.values())
+
+        st.write(
+            f"This session: ~{format_size(session_total)}"
+            + (
+                f" (cap {format_size(self.memory_manager.session_cap)})"
+                if self.memory_manager.session_cap
+                else ""
+            )
+        )
+        st.write(
+            f"All sessions ({len(sessions)}): ~{format_size(global_total)}"
+            + (
+                f" (cap {format_size(self.memory_manager.global_cap)})"
+                if self.memory_manager.global_cap
+                else ""
+            )
+        )
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {"Key": key, "Size": format_size(size), "Bytes": size}
+                    for key, size in keys.items()
+                ]
+            ),
+            hide_index=True,
+        )
+
+    def render_calibration(self) -> None:
+        """
+        Displays the token calibration of the models.
+        """
+        st.subheader("Token calibration")
+        summary = get_token_calibrator().summary()
+        if not summary:
+            st.info("No response received yet, the local token counts are used as is.")
+            return
+        st.caption("Billed prompt tokens ≈ slope × local tokens + overhead")
+        st.dataframe(
+            pd.DataFrame.from_dict(summary, orient="index").round(
+                {"samples": 1, "slope": 3, "overhead": 0}
+            )
+        )
+
+    def render_profiles(self) -> None:
+        """
+        Displays the rerun profiles.
+        """
+        st.subheader("Rerun profiles")
+        if not self.profiler.enabled:
+            st.info("Set PROFILE_RERUNS=1 to profile the reruns.")
+            return
+
+        profiles = st.session_state.get("profiles", [])
+        if not profiles:
+            st.info("No rerun profiled yet, interact with the app to record one.")
+            return
+
+        last = profiles[-1]
+        st.write(f"Previous rerun: {last['total_ms']:.1f} ms")
+        st.dataframe(pd.DataFrame.from_dict(last["sections"], orient="index"))
+
+        # Average of every section over the kept reruns
+        totals = {}
+        for profile in profiles:
+            for name, stats in profile["sections"].items():
+                total = totals.setdefault(
+                    name, {"reruns": 0, "calls": 0, "time_ms": 0.0, "alloc_kb": 0.0}
+                )
+                total["reruns"] += 1
+                total["calls"] += stats["calls"]
+                total["time_ms"] += stats["time_ms"]
+                total["alloc_kb"] += stats["alloc_kb"]
+        averages = pd.DataFrame.from_dict(totals, orient="index")
+        averages[["calls", "time_ms", "alloc_kb"]] = averages[
+            ["calls", "time_ms", "alloc_kb"]
+        ].div(averages["reruns"], axis=0)
+        st.write(
+            f"Average over {len(profiles)} reruns: "
+            f"{sum(p['total_ms'] for p in profiles) / len(profiles):.1f} ms"
+        )
+        st.dataframe(averages.sort_values("time_ms", ascending=False))
+
+        st.download_button(
+            label="Export profiles (JSON)",
+            data=json.dumps(profiles, indent=2),
+            file_name="rerun_profiles.json",
+            mime="application/json",
+        )
+
+    def render(self) -> None:
+        """
+        Renders the diagnostics tab in the Streamlit app.
+        """
+        self.render_memory()
+        self.render_calibration()
+        self.render_profiles()
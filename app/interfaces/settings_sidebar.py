@@ -5,10 +5,13 @@ as well as select the desired chat model and its parameters.
 
 from typing import Dict, Tuple
 import streamlit as st
+import pandas as pd
 import json
 import os
 
 from chat_strategies.chat_model_strategy import ChatModelStrategy
+from managers.context_minifier import MINIFY_LEVELS
+from managers.file_manager import FILTER_KEYS
 from managers.settings_manager import SettingsManager
 
 DIVIDER = ": "
@@ -85,10 +88,21 @@ class SettingsSidebar:
             # Save settings to the selected file
             new_settings = {
                 "folder_path": st.session_state.settings["folder_path"],
+                "context_sources": st.session_state.settings.get("context_sources", []),
                 "target_extensions": st.session_state.settings["target_extensions"],
                 "always_include": st.session_state.settings["always_include"],
                 "excluded_dirs": st.session_state.settings["excluded_dirs"],
+                "context_minify": st.session_state.settings.get(
+                    "context_minify", "none"
+                ),
+                "outline_expand": st.session_state.settings.get("outline_expand", ""),
+                "prewarm_cache": st.session_state.settings.get("prewarm_cache", False),
                 "system_prompt": st.session_state.settings["system_prompt"],
+                "request_budget": st.session_state.settings.get("request_budget", 0.0),
+                "session_budget": st.session_state.settings.get("session_budget", 0.0),
+                "budget_action": st.session_state.settings.get(
+                    "budget_action", "confirm"
+                ),
             }
             self.settings_manager.save_settings(
                 new_settings, filename=f"settings/{selected_file}"
@@ -141,12 +155,36 @@ class SettingsSidebar:
         st.sidebar.write("---")
 
         # Display and update settings fields
-        st.session_state.settings["folder_path"] = st.sidebar.text_input(
-            "Folder path",
-            st.session_state.settings.get("folder_path", ""),
-            key=f"folder_path_{unique_key}",
-            help="Enter the directory path",
-        )
+        sources = st.sidebar.data_editor(
+            pd.DataFrame(
+                self.settings_manager.context_sources(st.session_state.settings),
+                columns=["path", *FILTER_KEYS],
+            ).fillna(""),
+            num_rows="dynamic",
+            hide_index=True,
+            key=f"context_sources_{unique_key}",
+            column_config={
+                "path": st.column_config.TextColumn(
+                    "Context sources",
+                    help="Directory or .zip/.tar.gz archive, scanned in parallel",
+                ),
+                "target_extensions": "Extensions",
+                "always_include": "Always include",
+                "excluded_dirs": "Excluded",
+            },
+        ).to_dict("records")
+        # Empty filters fall back to the common ones below, new rows hold None
+        sources = [
+            {
+                key: value if isinstance(value, str) else ""
+                for key, value in source.items()
+            }
+            for source in sources
+            if isinstance(source["path"], str) and source["path"]
+        ]
+        st.session_state.settings["context_sources"] = sources
+        # Kept for the settings files read by older versions
+        st.session_state.settings["folder_path"] = sources[0]["path"] if sources else ""
         st.session_state.settings["target_extensions"] = st.sidebar.text_input(
             "Target extensions",
             st.session_state.settings.get("target_extensions", ""),
@@ -165,6 +203,38 @@ class SettingsSidebar:
             key=f"excluded_dirs_{unique_key}",
             help="Enter directories separated by commas",
         )
+        st.session_state.settings["context_minify"] = st.sidebar.selectbox(
+            "Context minification",
+            MINIFY_LEVELS,
+            index=MINIFY_LEVELS.index(
+                st.session_state.settings.get("context_minify", "none")
+            ),
+            key=f"context_minify_{unique_key}",
+            help="""
+            none: files are sent verbatim.
+            whitespace: trailing whitespace, blank lines and license headers are removed.
+            comments: comments and docstrings are removed as well.
+            outline: Python files are reduced to their signatures, docstring first lines and constants.
+            Applied on the next context update.""",
+        )
+        if st.session_state.settings["context_minify"] == "outline":
+            st.session_state.settings["outline_expand"] = st.sidebar.text_input(
+                "Expanded symbols",
+                st.session_state.settings.get("outline_expand", ""),
+                key=f"outline_expand_{unique_key}",
+                help="""
+                Functions and classes sent with their full source, separated by commas,
+                e.g., read_files, FileManager.read_sources, managers/file_manager.py:FileManager""",
+            )
+        st.session_state.settings["prewarm_cache"] = st.sidebar.checkbox(
+            "Pre-warm prompt cache",
+            st.session_state.settings.get("prewarm_cache", False),
+            key=f"prewarm_cache_{unique_key}",
+            help="""
+            After a context update, sends a minimal request with the system prompt and the context
+            in the background, so that the first question reads them from the provider prompt cache.
+            Only for the providers with prompt caching, the cache write is billed.""",
+        )
         st.session_state.settings["system_prompt"] = st.sidebar.text_area(
             "System prompt",
             st.session_state.settings.get("system_prompt", ""),
@@ -208,4 +278,37 @@ class SettingsSidebar:
             This helps limit the length of the output.""",
         )
 
+        # -----------------------------------------------
+        st.sidebar.write("---")
+
+        # Budgets, 0 means no limit
+        st.session_state.settings["request_budget"] = st.sidebar.number_input(
+            "Request budget, $",
+            min_value=0.0,
+            value=float(st.session_state.settings.get("request_budget", 0.0)),
+            step=0.1,
+            format="%.3f",
+            key=f"request_budget_{unique_key}",
+            help="Maximum estimated cost of a single request, 0 for no limit",
+        )
+        st.session_state.settings["session_budget"] = st.sidebar.number_input(
+            "Session budget, $",
+            min_value=0.0,
+            value=float(st.session_state.settings.get("session_budget", 0.0)),
+            step=1.0,
+            key=f"session_budget_{unique_key}",
+            help="Maximum total cost of the chat session, 0 for no limit",
+        )
+        budget_actions = ["confirm", "block"]
+        st.session_state.settings["budget_action"] = st.sidebar.radio(
+            "Over budget",
+            budget_actions,
+            index=budget_actions.index(
+                st.session_state.settings.get("budget_action", "confirm")
+            ),
+            key=f"budget_action_{unique_key}",
+            horizontal=True,
+            help="Ask for confirmation or block requests exceeding a budget",
+        )
+
         return current_strategy, current_model, temperature, max_tokens
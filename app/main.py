@@ -3,22 +3,37 @@ Main entry point for the Streamlit application.
 Initializes the necessary managers and runs the StreamlitInterface.
 """
 
+from typing import Dict
 import os
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from dotenv import load_dotenv, find_dotenv
 
 from interfaces.settings_sidebar import SettingsSidebar
 from interfaces.log_tab import LogTab
 from interfaces.context_tab import ContextTab
 from interfaces.chat_tab import ChatTab
+from interfaces.diagnostics_tab import DiagnosticsTab
 from managers.log_manager import LogManager
 from managers.file_manager import FileManager
 from managers.settings_manager import SettingsManager
 from managers.chat_history_manager import ChatHistoryManager
+from managers.context_manager import ContextManager
+from managers.cost_estimator import CostEstimator
+from managers.memory_manager import MemoryManager
+from managers.profiler import RerunProfiler
+from chat_strategies.chat_model_strategy import ChatModelStrategy
 from chat_strategies.openai_strategy import OpenAIChatStrategy
+from chat_strategies.openai_compatible_strategy import (
+    get_openai_compatible_strategies,
+)
 from chat_strategies.anthropic_strategy import AnthropicChatStrategy
 from chat_strategies.gemini_strategy import GeminiChatStrategy
 from chat_strategies.deepseeker_strategy import DeepseekerChatStrategy
+from chat_strategies.failover_strategy import FailoverChatStrategy
+from chat_strategies.auto_strategy import AutoChatStrategy
+from chat_strategies.simulated_strategy import SimulatedChatStrategy
+from chat_strategies.rate_limiter import configure_rate_limits_from_env
 
 
 class StreamlitInterface:
@@ -35,10 +50,24 @@ class StreamlitInterface:
         Instance of the FileManager class for managing files.
     chat_history_manager : ChatHistoryManager
         Instance of the ChatHistoryManager class for managing chat history.
+    context_manager : ContextManager
+        Instance of the ContextManager class for building the context messages.
+    cost_estimator : CostEstimator
+        Instance of the CostEstimator class for estimating request costs.
     openai_api_key : str, optional
         OpenAI API key. Default is None.
     anthropic_api_key : str, optional
         Anthropic API key. Default is None.
+    google_api_key : str, optional
+        Google API key. Default is None.
+    simulated_provider : bool, optional
+        Whether to offer the offline simulated provider. Default is False.
+    profiler : RerunProfiler, optional
+        Profiler of the rerun, shown in the diagnostics tab when enabled. Default is a disabled profiler.
+    memory_manager : MemoryManager, optional
+        Instance of the MemoryManager class enforcing the memory caps. Default is a manager without caps.
+    openai_compatible_strategies : Dict[str, ChatModelStrategy], optional
+        Strategies of the configured OpenAI-compatible servers, by provider name. Default is none.
 
     Methods
     -------
@@ -52,14 +81,24 @@ class StreamlitInterface:
         log_manager: LogManager,
         file_manager: FileManager,
         chat_history_manager: ChatHistoryManager,
+        context_manager: ContextManager,
+        cost_estimator: CostEstimator,
         openai_api_key: str = None,
         anthropic_api_key: str = None,
         google_api_key: str = None,
+        simulated_provider: bool = False,
+        profiler: RerunProfiler = None,
+        memory_manager: MemoryManager = None,
+        openai_compatible_strategies: Dict[str, ChatModelStrategy] = None,
     ):
         self.settings_manager = settings_manager
         self.log_manager = log_manager
         self.chat_history_manager = chat_history_manager
         self.file_manager = file_manager
+        self.context_manager = context_manager
+        self.cost_estimator = cost_estimator
+        self.profiler = profiler or RerunProfiler()
+        self.memory_manager = memory_manager or MemoryManager()
 
         # TODO - handle error if model list is empty due to missing env keys
         self.strategies = {
@@ -79,7 +118,27 @@ class StreamlitInterface:
                 if deepseeker_api_key
                 else None
             ),
+            "Simulated": SimulatedChatStrategy() if simulated_provider else None,
         }
+        self.strategies.update(openai_compatible_strategies or {})
+        failover_strategy = FailoverChatStrategy(self.strategies)
+        self.strategies["Failover"] = (
+            failover_strategy if failover_strategy.get_models() else None
+        )
+        auto_strategy = AutoChatStrategy(self.strategies)
+        self.strategies["Auto"] = auto_strategy if auto_strategy.get_models() else None
+
+        for manager in (
+            settings_manager,
+            log_manager,
+            file_manager,
+            chat_history_manager,
+            context_manager,
+            cost_estimator,
+        ):
+            self.profiler.instrument(manager, type(manager).__name__)
+        for strategy_name, strategy in self.strategies.items():
+            self.profiler.instrument(strategy, strategy_name)
 
     def run(self):
         """
@@ -88,18 +147,29 @@ class StreamlitInterface:
         st.set_page_config(page_title="Chat App", layout="wide")
 
         # Settings sidebar ==========================================
-        self.current_strategy, self.current_model, temperature, max_tokens = (
-            SettingsSidebar(self.settings_manager, self.strategies).render()
-        )
+        with self.profiler.section("SettingsSidebar.render"):
+            self.current_strategy, self.current_model, temperature, max_tokens = (
+                SettingsSidebar(self.settings_manager, self.strategies).render()
+            )
+
+        # Memory caps ===============================================
+        ctx = get_script_run_ctx()
+        session_id = ctx.session_id if ctx else "local"
+        with self.profiler.section("MemoryManager.enforce"):
+            for action in self.memory_manager.enforce(
+                session_id, st.session_state, self.log_manager
+            ):
+                self.log_manager.add_log(f"Memory cap: {action}")
+                st.toast(action)
 
         # Main interface ============================================
-        tab1, tab2, tab3 = st.tabs(["📚 Context", "💬 Chat", "📜 Log"])
+        tabs = st.tabs(["📚 Context", "💬 Chat", "📜 Log", "🩺 Diagnostics"])
 
-        with tab1:
-            ContextTab(self.file_manager).render()
+        with tabs[0], self.profiler.section("ContextTab.render"):
+            ContextTab(self.file_manager, self.settings_manager).render()
 
         # Chat =======================================================
-        with tab2:
+        with tabs[1], self.profiler.section("ChatTab.render"):
             ChatTab(
                 self.strategies,
                 self.current_strategy,
@@ -108,11 +178,19 @@ class StreamlitInterface:
                 max_tokens,
                 self.log_manager,
                 self.chat_history_manager,
+                self.context_manager,
+                self.cost_estimator,
             ).render()
 
-        with tab3:
+        with tabs[2], self.profiler.section("LogTab.render"):
             LogTab(self.log_manager).render()
 
+        diagnostics_tab = DiagnosticsTab(self.profiler, self.memory_manager, session_id)
+        with tabs[3], self.profiler.section("DiagnosticsTab.render"):
+            diagnostics_tab.render()
+        if self.profiler.enabled:
+            diagnostics_tab.save_profile()
+
 
 if __name__ == "__main__":
     load_dotenv(find_dotenv())  # read local.env file
@@ -120,19 +198,46 @@ if __name__ == "__main__":
     anthropic_api_key = os.environ.get("ANTHROPIC_API_KEY", None)
     google_api_key = os.environ.get("GOOGLE_API_KEY", None)
     deepseeker_api_key = os.environ.get("DEEPSEEKER_API_KEY", None)
+    simulated_provider = os.environ.get("SIMULATED_PROVIDER", "").lower() in (
+        "1",
+        "true",
+    )
+    profile_reruns = os.environ.get("PROFILE_RERUNS", "").lower() in ("1", "true")
+    profiler = RerunProfiler(enabled=profile_reruns)
+    # Rate limits of the account tiers, e.g. OPENAI_TOKENS_PER_MINUTE
+    configure_rate_limits_from_env(os.environ)
+    # Local inference servers and other OpenAI-compatible providers
+    openai_compatible_config = os.environ.get("OPENAI_COMPATIBLE_CONFIG", "")
+    openai_compatible_strategies = (
+        get_openai_compatible_strategies(openai_compatible_config)
+        if openai_compatible_config
+        else {}
+    )
+    memory_manager = MemoryManager(
+        session_cap_mb=float(os.environ.get("SESSION_MEMORY_CAP_MB", 0) or 0),
+        global_cap_mb=float(os.environ.get("GLOBAL_MEMORY_CAP_MB", 0) or 0),
+    )
 
     settings_manager = SettingsManager()
     log_manager = LogManager()
     chat_history_manager = ChatHistoryManager()
     file_manager = FileManager()
+    context_manager = ContextManager()
+    cost_estimator = CostEstimator()
 
     app = StreamlitInterface(
         settings_manager,
         log_manager,
         file_manager,
         chat_history_manager,
+        context_manager,
+        cost_estimator,
         openai_api_key,
         anthropic_api_key,
         google_api_key,
+        simulated_provider,
+        profiler,
+        memory_manager,
+        openai_compatible_strategies,
     )
     app.run()
@@ -0,0 +1,220 @@
+"""
+Builds outlines of Python files for broad questions about a code base: the module, class and function
+signatures with the first line of their docstrings, the imports and the module and class constants,
+without the function bodies. Selected symbols can be expanded to their full source. The `if`, `try` and
+`with` blocks holding definitions or imports are kept with their outlined body, e.g. import fallbacks.
+
+Outlines are cached by content hash, so that unchanged files are not parsed again on a context update.
+"""
+
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+import ast
+import hashlib
+import threading
+
+# Number of cached outlines
+OUTLINE_CACHE_SIZE = 2048
+# Longer constant values are elided
+MAX_VALUE_LENGTH = 80
+
+# (content hash, expanded symbols) -> outline, None for the files that cannot be parsed
+_cache: "OrderedDict[Tuple[str, Tuple[str, ...]], Optional[str]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _docstring_line(node: ast.AST, indent: str) -> List[str]:
+    """
+    Returns the first line of the docstring of a node as a docstring statement, if it has one.
+    """
+    docstring = ast.get_docstring(node)
+    if not docstring or not docstring.strip():
+        return []
+    first_line = docstring.strip().splitlines()[0].replace('"""', "'''")
+    return [f'{indent}"""{first_line}"""']
+
+
+def _assignment(node: ast.AST, indent: str) -> List[str]:
+    """
+    Returns an assignment to names with its value, elided if long.
+    """
+    if isinstance(node, ast.AnnAssign):
+        if not isinstance(node.target, ast.Name):
+            return []
+        line = f"{indent}{node.target.id}: {ast.unparse(node.annotation)}"
+        if node.value is None:
+            return [line]
+        target = line
+    elif all(isinstance(target, ast.Name) for target in node.targets):
+        target = indent + " = ".join(target.id for target in node.targets)
+    else:
+        return []
+    value = ast.unparse(node.value)
+    if len(value) > MAX_VALUE_LENGTH or "\n" in value:
+        value = "..."
+    return [f"{target} = {value}"]
+
+
+def _decorators(node: ast.AST, indent: str) -> List[str]:
+    return [f"{indent}@{ast.unparse(decorator)}" for decorator in node.decorator_list]
+
+
+def _signature(node: ast.AST) -> str:
+    """
+    Returns the definition line of a function or a class, without its indentation.
+    """
+    if isinstance(node, ast.ClassDef):
+        bases = [ast.unparse(base) for base in node.bases] + [
+            ast.unparse(keyword) for keyword in node.keywords
+        ]
+        return (
+            f"class {node.name}({', '.join(bases)}):"
+            if bases
+            else f"class {node.name}:"
+        )
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    return f"{prefix} {node.name}({ast.unparse(node.args)}){returns}:"
+
+
+class _Outliner:
+    """
+    Outlines the statements of a parsed module, keeping the source of the expanded symbols.
+    """
+
+    def __init__(self, lines: List[str], expand: Iterable[str]):
+        self.lines = lines
+        self.expand = set(expand)
+
+    def _source(self, node: ast.AST) -> List[str]:
+        first = min(
+            [node.lineno] + [decorator.lineno for decorator in node.decorator_list]
+        )
+        return self.lines[first - 1 : node.end_lineno]
+
+    def _is_expanded(self, qualname: str) -> bool:
+        return qualname in self.expand or qualname.rsplit(".", 1)[-1] in self.expand
+
+    def _block(self, node: ast.stmt, indent: str, scope: str) -> List[str]:
+        """
+        Returns an `if`, `try` or `with` block with its clauses outlined, empty if none of them outlines
+        anything. The empty clauses of a kept block are reduced to `...`.
+        """
+        # (header, body) of the clauses
+        clauses: List[Tuple[str, List[ast.stmt]]] = []
+        if isinstance(node, ast.If):
+            keyword = "if"
+            while True:
+                clauses.append(
+                    (f"{indent}{keyword} {ast.unparse(node.test)}:", node.body)
+                )
+                orelse = node.orelse
+                # An elif is an if alone in the else clause, on a line starting with elif
+                if (
+                    len(orelse) == 1
+                    and isinstance(orelse[0], ast.If)
+                    and self.lines[orelse[0].lineno - 1].lstrip().startswith("elif")
+                ):
+                    node, keyword = orelse[0], "elif"
+                    continue
+                if orelse:
+                    clauses.append((f"{indent}else:", orelse))
+                break
+        elif isinstance(node, ast.Try):
+            clauses.append((f"{indent}try:", node.body))
+            for handler in node.handlers:
+                header = "except"
+                if handler.type is not None:
+                    header += " " + ast.unparse(handler.type)
+                if handler.name:
+                    header += f" as {handler.name}"
+                clauses.append((f"{indent}{header}:", handler.body))
+            if node.orelse:
+                clauses.append((f"{indent}else:", node.orelse))
+            if node.finalbody:
+                clauses.append((f"{indent}finally:", node.finalbody))
+        else:
+            prefix = "async with" if isinstance(node, ast.AsyncWith) else "with"
+            items = ", ".join(ast.unparse(item) for item in node.items)
+            clauses.append((f"{indent}{prefix} {items}:", node.body))
+
+        outlined = [self.outline(body, scope) for _, body in clauses]
+        if not any(outlined):
+            return []
+        result = []
+        for (header, body), members in zip(clauses, outlined):
+            result.append(header)
+            result.extend(members or [" " * body[0].col_offset + "..."])
+        return result
+
+    def outline(self, body: List[ast.stmt], scope: str = "") -> List[str]:
+        result = []
+        for node in body:
+            indent = " " * node.col_offset
+            if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                qualname = scope + node.name
+                if self._is_expanded(qualname):
+                    result.extend(self._source(node))
+                    continue
+                result.extend(_decorators(node, indent))
+                result.append(indent + _signature(node))
+                body_indent = " " * node.body[0].col_offset
+                docstring = _docstring_line(node, body_indent)
+                if isinstance(node, ast.ClassDef):
+                    members = self.outline(node.body, qualname + ".")
+                    result.extend(
+                        docstring
+                        + (members or ([] if docstring else [body_indent + "..."]))
+                    )
+                else:
+                    # A docstring alone is a valid body
+                    result.extend(docstring or [body_indent + "..."])
+            elif isinstance(node, (ast.Import, ast.ImportFrom)) and not scope:
+                result.append(indent + ast.unparse(node))
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                result.extend(_assignment(node, indent))
+            elif isinstance(node, (ast.If, ast.Try, ast.With, ast.AsyncWith)):
+                result.extend(self._block(node, indent, scope))
+        return result
+
+
+def outline_python(content: str, expand: Iterable[str] = ()) -> Optional[str]:
+    """
+    Returns the outline of a Python file.
+
+    Parameters
+    ----------
+    content : str
+        Python source code.
+    expand : Iterable[str], optional
+        Symbols kept with their full source, as qualified names (e.g. "FileManager.read_files")
+        or bare names matching at any level. Default is none.
+
+    Returns
+    -------
+    str
+        The outline, valid Python with the function bodies reduced to their docstring first line or `...`,
+        or None if the content cannot be parsed.
+    """
+    expand = tuple(sorted(set(expand)))
+    key = (hashlib.sha256(content.encode("utf-8")).hexdigest(), expand)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        outline = None
+    else:
+        lines = content.splitlines()
+        outline = "\n".join(
+            _docstring_line(tree, "") + _Outliner(lines, expand).outline(tree.body)
+        )
+
+    with _cache_lock:
+        _cache[key] = outline
+        while len(_cache) > OUTLINE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return outline
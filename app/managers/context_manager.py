@@ -0,0 +1,216 @@
+"""
+Builds the context block sent to the chat models from the selected context files.
+
+The context is versioned within a conversation: the first context message is kept byte-identical, so the
+provider prompt caches stay valid, and later file changes are appended to the history as unified diffs.
+"""
+
+from typing import Any, Dict, List
+import difflib
+
+CONTEXT_ACKNOWLEDGEMENT = "Ok, I got it!"
+# Question of the cache pre-warm request, answered with a single token
+CACHE_PREWARM_MESSAGE = "Reply with OK."
+
+
+def file_header(item: Dict[str, Any]) -> str:
+    """
+    Returns the header introducing a file in the context.
+
+    Parameters
+    ----------
+    item : Dict[str, Any]
+        File dictionary with a 'path' and an optional precomputed 'header' (set by the minifier).
+
+    Returns
+    -------
+    str
+        The header of the file.
+    """
+    return item.get("header") or "LOCAL FILEPATH: " + item["path"] + "\nCONTENTS:\n"
+
+
+class ContextManager:
+    """
+    Class for building the context messages of a conversation.
+
+    Methods
+    -------
+    build_context_string(context: List[Dict[str, Any]]) -> str
+        Joins the selected files into a single context string.
+    build_context_messages(context: List[Dict[str, Any]]) -> List[Dict[str, str]]
+        Returns the messages introducing the context to the chat model.
+    build_prewarm_messages(context: List[Dict[str, Any]]) -> List[Dict[str, str]]
+        Returns the messages of a minimal request writing the context prefix to the prompt cache.
+    snapshot(context: List[Dict[str, Any]]) -> Dict[str, str]
+        Returns the version of the context seen by the chat model.
+    build_context_update(previous: Dict[str, str], context: List[Dict[str, Any]]) -> List[Dict[str, Any]]
+        Returns the messages describing the changes of the context since the previous version.
+    clean_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]
+        Returns the messages with only the keys accepted by the chat model APIs.
+    """
+
+    def build_context_string(self, context: List[Dict[str, Any]]) -> str:
+        """
+        Joins the selected files into a single context string.
+
+        Parameters
+        ----------
+        context : List[Dict[str, Any]]
+            List of file dictionaries with 'path', 'content' and optional 'header' keys.
+
+        Returns
+        -------
+        str
+            The context string, empty if there are no files.
+        """
+        return "".join(file_header(item) + item["content"] + "\n\n" for item in context)
+
+    def build_context_messages(
+        self, context: List[Dict[str, Any]]
+    ) -> List[Dict[str, str]]:
+        """
+        Returns the messages introducing the context to the chat model.
+
+        Parameters
+        ----------
+        context : List[Dict[str, Any]]
+            List of file dictionaries with 'path' and 'content' keys.
+
+        Returns
+        -------
+        List[Dict[str, str]]
+            A user message with the context and the assistant acknowledgement,
+            or an empty list if there is no context.
+        """
+        context_str = self.build_context_string(context)
+        if len(context_str) == 0:
+            return []
+        return [
+            {"role": "user", "content": f"Context:\n\n{context_str}"},
+            {"role": "assistant", "content": CONTEXT_ACKNOWLEDGEMENT},
+        ]
+
+    def build_prewarm_messages(
+        self, context: List[Dict[str, Any]]
+    ) -> List[Dict[str, str]]:
+        """
+        Returns the messages of a minimal request writing the context prefix to the prompt cache.
+
+        The context messages are those the first question of a conversation is sent with,
+        so that its prompt prefix is read from the cache.
+
+        Parameters
+        ----------
+        context : List[Dict[str, Any]]
+            List of file dictionaries with 'path' and 'content' keys.
+
+        Returns
+        -------
+        List[Dict[str, str]]
+            The context messages and a short question, or an empty list if there is no context.
+        """
+        context_messages = self.build_context_messages(context)
+        if not context_messages:
+            return []
+        return context_messages + [{"role": "user", "content": CACHE_PREWARM_MESSAGE}]
+
+    def snapshot(self, context: List[Dict[str, Any]]) -> Dict[str, str]:
+        """
+        Returns the version of the context seen by the chat model.
+
+        Parameters
+        ----------
+        context : List[Dict[str, Any]]
+            List of file dictionaries with 'path' and 'content' keys.
+
+        Returns
+        -------
+        Dict[str, str]
+            File contents by path.
+        """
+        return {item["path"]: item["content"] for item in context}
+
+    def build_context_update(
+        self, previous: Dict[str, str], context: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns the messages describing the changes of the context since the previous version.
+
+        Changed files are sent as unified diffs, unless the diff is longer than the new content.
+        Added files are sent in full, removed files by path only.
+
+        Parameters
+        ----------
+        previous : Dict[str, str]
+            The previous version of the context, as returned by `snapshot`.
+        context : List[Dict[str, Any]]
+            The current context files.
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            A user message with the changes and the assistant acknowledgement, both flagged with
+            'context_update', or an empty list if the context did not change.
+        """
+        parts = []
+        for item in context:
+            old_content = previous.get(item["path"])
+            if old_content is None:
+                parts.append("ADDED " + file_header(item) + item["content"] + "\n")
+            elif old_content != item["content"]:
+                diff = "\n".join(
+                    difflib.unified_diff(
+                        old_content.splitlines(),
+                        item["content"].splitlines(),
+                        fromfile="a/" + item["path"],
+                        tofile="b/" + item["path"],
+                        lineterm="",
+                        n=2,
+                    )
+                )
+                if len(diff) < len(item["content"]):
+                    parts.append(diff + "\n")
+                else:
+                    parts.append(
+                        "REWRITTEN " + file_header(item) + item["content"] + "\n"
+                    )
+        current_paths = {item["path"] for item in context}
+        for path in previous:
+            if path not in current_paths:
+                parts.append("REMOVED: " + path + "\n")
+
+        if not parts:
+            return []
+        return [
+            {
+                "role": "user",
+                "content": "Context update (unified diffs against the previous version):\n\n"
+                + "\n".join(parts),
+                "context_update": True,
+            },
+            {
+                "role": "assistant",
+                "content": CONTEXT_ACKNOWLEDGEMENT,
+                "context_update": True,
+            },
+        ]
+
+    def clean_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """
+        Returns the messages with only the keys accepted by the chat model APIs.
+
+        Parameters
+        ----------
+        messages : List[Dict[str, Any]]
+            Chat history, possibly with extra keys such as 'context_update'.
+
+        Returns
+        -------
+        List[Dict[str, str]]
+            The messages with the 'role' and 'content' keys only.
+        """
+        return [
+            {"role": message["role"], "content": message["content"]}
+            for message in messages
+        ]
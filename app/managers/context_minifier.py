@@ -0,0 +1,325 @@
+"""
+Minifies the context files to cut the prompt tokens: whitespace normalization, license header removal,
+comment and docstring stripping per language and, at the highest level, outlines of the Python files.
+"""
+
+from typing import Iterable, List, Optional, Tuple
+import ast
+import io
+import os
+import re
+import tokenize
+
+from managers.code_outline import outline_python
+
+# Minification levels, from the least to the most aggressive
+MINIFY_LEVELS: Tuple[str, ...] = ("none", "whitespace", "comments", "outline")
+
+C_STYLE_EXTENSIONS = {
+    ".c", ".h", ".cc", ".cpp", ".hpp", ".cs", ".java", ".kt", ".scala", ".go", ".rs", ".swift",
+    ".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs", ".scss", ".less", ".php", ".dart",
+}  # fmt: skip
+# CSS has block comments only, "//" appears in URLs
+BLOCK_COMMENT_EXTENSIONS = {".css"}
+HASH_EXTENSIONS = {
+    ".sh", ".bash", ".zsh", ".rb", ".r", ".pl", ".yml", ".yaml", ".toml", ".cfg", ".ini", ".conf",
+    ".dockerfile", ".mk", ".cmake",
+}  # fmt: skip
+DASH_EXTENSIONS = {".sql", ".lua", ".hs"}
+MARKUP_EXTENSIONS = {".html", ".htm", ".xml", ".svg", ".vue"}
+
+LICENSE_MARKERS = re.compile(r"licen[cs]e|copyright|spdx-license-identifier", re.I)
+
+# Strings and comments of C-style languages, strings first so that "//" inside a string is kept
+C_STYLE_TOKENS = re.compile(
+    r"""("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)"""
+    r"|(//[^\n]*|/\*.*?\*/)",
+    re.S,
+)
+BLOCK_COMMENTS = re.compile(r"/\*.*?\*/", re.S)
+MARKUP_COMMENTS = re.compile(r"<!--.*?-->", re.S)
+
+
+def normalize_whitespace(content: str) -> str:
+    """
+    Strips the trailing whitespace and collapses the runs of blank lines.
+
+    Parameters
+    ----------
+    content : str
+        File content.
+
+    Returns
+    -------
+    str
+        The normalized content. Indentation is kept, it is significant in some languages.
+    """
+    lines = [line.rstrip() for line in content.splitlines()]
+    result: List[str] = []
+    for line in lines:
+        if line or (result and result[-1]):
+            result.append(line)
+    while result and not result[-1]:
+        result.pop()
+    return "\n".join(result)
+
+
+def strip_license_header(content: str) -> str:
+    """
+    Removes the leading comment block of a file if it is a license or copyright notice.
+
+    Parameters
+    ----------
+    content : str
+        File content.
+
+    Returns
+    -------
+    str
+        The content without the license header.
+    """
+    lines = content.splitlines()
+    start = 0
+    # Keep the shebang and the encoding declaration
+    while start < len(lines) and (
+        lines[start].startswith("#!") or re.match(r"#.*coding[:=]", lines[start])
+    ):
+        start += 1
+
+    end = start
+    stripped = lines[start].lstrip() if start < len(lines) else ""
+    if stripped.startswith("/*"):
+        while end < len(lines) and "*/" not in lines[end]:
+            end += 1
+        end += 1
+    elif stripped.startswith(('"""', "'''")):
+        quote = stripped[:3]
+        end = start + 1
+        if stripped.count(quote) < 2:
+            while end < len(lines) and quote not in lines[end]:
+                end += 1
+            end += 1
+    else:
+        for prefix in ("#", "//", "--", ";"):
+            if stripped.startswith(prefix):
+                while end < len(lines) and lines[end].lstrip().startswith(prefix):
+                    end += 1
+                break
+
+    header = "\n".join(lines[start:end])
+    if end == start or not LICENSE_MARKERS.search(header):
+        return content
+    return "\n".join(lines[:start] + lines[end:])
+
+
+def strip_python_comments(content: str) -> str:
+    """
+    Removes the comments and the docstrings of Python code.
+
+    Docstrings that are the only statement of a body are replaced with `...` to keep the code valid.
+
+    Parameters
+    ----------
+    content : str
+        Python source code.
+
+    Returns
+    -------
+    str
+        The code without comments and docstrings, or the original content if it cannot be parsed.
+    """
+    try:
+        tree = ast.parse(content)
+        tokens = list(tokenize.generate_tokens(io.StringIO(content).readline))
+    except (SyntaxError, tokenize.TokenError, ValueError):
+        return content
+
+    # None marks the lines left empty by a removed comment
+    lines: List[Optional[str]] = content.splitlines()
+    # Cut the comments, keeping the code before them
+    for token in tokens:
+        if token.type == tokenize.COMMENT:
+            row, col = token.start
+            lines[row - 1] = lines[row - 1][:col].rstrip() or None
+
+    # Docstring nodes, with whether they are the only statement of their body
+    docstrings = []
+    for node in ast.walk(tree):
+        if not isinstance(
+            node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+        ):
+            continue
+        body = node.body
+        if (
+            body
+            and isinstance(body[0], ast.Expr)
+            and isinstance(body[0].value, ast.Constant)
+            and isinstance(body[0].value.value, str)
+        ):
+            docstrings.append((body[0], len(body) == 1))
+
+    # Replace from the bottom so that the line numbers stay valid
+    for node, only_statement in sorted(
+        docstrings, key=lambda item: item[0].lineno, reverse=True
+    ):
+        first, last = node.lineno - 1, node.end_lineno
+        # Docstrings sharing a line with other code are left alone
+        if lines[first][: node.col_offset].strip() or lines[last - 1][
+            node.end_col_offset :
+        ].strip().lstrip(";"):
+            continue
+        replacement = [" " * node.col_offset + "..."] if only_statement else []
+        lines[first:last] = replacement
+
+    return "\n".join(line for line in lines if line is not None)
+
+
+def strip_c_style_comments(content: str) -> str:
+    """
+    Removes the `//` and `/* */` comments of C-style languages, keeping the strings intact.
+
+    Parameters
+    ----------
+    content : str
+        Source code.
+
+    Returns
+    -------
+    str
+        The code without comments.
+    """
+
+    def replace(match: re.Match) -> str:
+        if match.group(1):
+            return match.group(1)
+        # A multi-line comment becomes a line break, the blank lines are collapsed afterwards
+        return "\n" if "\n" in match.group(2) else ""
+
+    return C_STYLE_TOKENS.sub(replace, content)
+
+
+def strip_line_comments(content: str, prefix: str) -> str:
+    """
+    Removes the full-line comments starting with `prefix`, keeping a shebang.
+
+    Parameters
+    ----------
+    content : str
+        Source code.
+    prefix : str
+        Comment prefix, e.g. "#".
+
+    Returns
+    -------
+    str
+        The code without full-line comments.
+    """
+    return "\n".join(
+        line
+        for i, line in enumerate(content.splitlines())
+        if not line.lstrip().startswith(prefix) or (i == 0 and line.startswith("#!"))
+    )
+
+
+class ContextMinifier:
+    """
+    Class for minifying the context files before they are sent to the chat models.
+
+    Parameters
+    ----------
+    level : str, optional
+        Minification level, one of MINIFY_LEVELS. Default is "none".
+        - "none": files are sent verbatim with the full header.
+        - "whitespace": trailing whitespace, blank line runs and license headers are removed,
+          and the per-file header is compact.
+        - "comments": comments and docstrings are stripped as well, for the known languages.
+        - "outline": Python files are replaced with their outline (signatures, docstring first lines,
+          imports and constants), the other files are minified as with "comments".
+    expand : Iterable[str], optional
+        Python symbols kept with their full source at the "outline" level, as "name", "Class.method"
+        or "path:Class.method" to limit the symbol to the files whose path ends with `path`. Default is none.
+
+    Methods
+    -------
+    header(path: str) -> str
+        Returns the compact header introducing a minified file in the context.
+    minify(path: str, content: str) -> str
+        Returns the minified content of a file.
+    """
+
+    def __init__(self, level: str = "none", expand: Iterable[str] = ()):
+        if level not in MINIFY_LEVELS:
+            raise ValueError(f"Unknown minification level: {level}")
+        self.level = level
+        self.expand = [symbol.strip() for symbol in expand if symbol.strip()]
+
+    def _expanded_symbols(self, path: str) -> List[str]:
+        """
+        Returns the symbols to expand in a file.
+        """
+        symbols = []
+        for symbol in self.expand:
+            file_path, _, name = symbol.rpartition(":")
+            if not file_path or path.replace("\\", "/").endswith(file_path):
+                symbols.append(name)
+        return symbols
+
+    def header(self, path: str) -> str:
+        """
+        Returns the compact header introducing a minified file in the context.
+
+        Parameters
+        ----------
+        path : str
+            Path of the file.
+
+        Returns
+        -------
+        str
+            The header.
+        """
+        return "FILE: " + path + "\n"
+
+    def minify(self, path: str, content: str) -> str:
+        """
+        Returns the minified content of a file.
+
+        Parameters
+        ----------
+        path : str
+            Path of the file, its extension selects the comment syntax.
+        content : str
+            Content of the file.
+
+        Returns
+        -------
+        str
+            The minified content.
+        """
+        if self.level == "none":
+            return content
+
+        name = os.path.basename(path).lower()
+        extension = os.path.splitext(name)[1] or (
+            ".dockerfile" if name == "dockerfile" else ""
+        )
+        if self.level == "outline" and extension in (".py", ".pyi"):
+            outline = outline_python(content, self._expanded_symbols(path))
+            if outline is not None:
+                return outline
+
+        content = strip_license_header(content)
+        if self.level in ("comments", "outline"):
+            if extension in (".py", ".pyi"):
+                content = strip_python_comments(content)
+            elif extension in C_STYLE_EXTENSIONS:
+                content = strip_c_style_comments(content)
+            elif extension in BLOCK_COMMENT_EXTENSIONS:
+                content = BLOCK_COMMENTS.sub("", content)
+            elif extension in HASH_EXTENSIONS or name == "makefile":
+                content = strip_line_comments(content, "#")
+            elif extension in DASH_EXTENSIONS:
+                content = strip_line_comments(content, "--")
+            elif extension in MARKUP_EXTENSIONS:
+                content = MARKUP_COMMENTS.sub("", content)
+        return normalize_whitespace(content)
@@ -0,0 +1,234 @@
+"""
+Stores the branches of a conversation as a tree of messages, so that a conversation can be forked at any
+message to try an alternative follow-up.
+
+Branches share the nodes of their common prefix and the message dictionaries themselves, so a branch only
+holds its divergent suffix, and the prefix sent to the chat model stays byte-identical across branches,
+which keeps it in the provider prompt caches.
+"""
+
+from typing import Any, Dict, List, Optional
+
+MAIN_BRANCH = "Main"
+
+
+class MessageNode:
+    """
+    A message of the conversation tree.
+
+    Parameters
+    ----------
+    message : Dict[str, Any]
+        The message, shared with the message lists of the branches.
+    parent : MessageNode, optional
+        The previous message, None for the first one.
+    context_snapshot : Dict[str, str], optional
+        The version of the context seen by the chat model after this message.
+    """
+
+    __slots__ = ("message", "parent", "context_snapshot")
+
+    def __init__(
+        self,
+        message: Dict[str, Any],
+        parent: Optional["MessageNode"],
+        context_snapshot: Optional[Dict[str, str]],
+    ):
+        self.message = message
+        self.parent = parent
+        self.context_snapshot = context_snapshot
+
+
+class ConversationTree:
+    """
+    Class for the branches of a conversation.
+
+    The active branch is kept as a plain list of messages by the chat tab, and synchronized with the tree
+    before forking or switching.
+
+    Attributes
+    ----------
+    current : str
+        Name of the active branch.
+
+    Methods
+    -------
+    sync(messages: List[Dict[str, Any]], context_messages: List[Dict[str, str]], context_snapshot: Dict[str, str])
+        Records the current state of the active branch.
+    messages(name: str) -> List[Dict[str, Any]]
+        Returns the messages of a branch.
+    fork(index: int) -> Dict[str, Any]
+        Creates a branch with the messages of the active branch before `index`, and activates it.
+    switch(name: str) -> Dict[str, Any]
+        Activates a branch and returns its state.
+    branch_names() -> List[str]
+        Returns the names of the branches, in creation order.
+    describe(name: str) -> str
+        Returns a short description of a branch for display.
+    nodes() -> List[MessageNode]
+        Returns every node of the tree once, e.g. to measure its memory.
+    """
+
+    def __init__(self):
+        self.branches: Dict[str, Dict[str, Any]] = {
+            MAIN_BRANCH: self._branch(None, None, None, None)
+        }
+        self.current = MAIN_BRANCH
+
+    def _branch(
+        self,
+        leaf: Optional[MessageNode],
+        context_messages: Optional[List[Dict[str, str]]],
+        context_snapshot: Optional[Dict[str, str]],
+        origin: Optional[str],
+    ) -> Dict[str, Any]:
+        return {
+            "leaf": leaf,
+            "context_messages": context_messages,
+            "context_snapshot": context_snapshot,
+            "origin": origin,
+        }
+
+    def _nodes(self, leaf: Optional[MessageNode]) -> List[MessageNode]:
+        """
+        Returns the nodes from the first message to `leaf`.
+        """
+        nodes = []
+        while leaf is not None:
+            nodes.append(leaf)
+            leaf = leaf.parent
+        nodes.reverse()
+        return nodes
+
+    def sync(
+        self,
+        messages: List[Dict[str, Any]],
+        context_messages: Optional[List[Dict[str, str]]],
+        context_snapshot: Optional[Dict[str, str]],
+    ) -> None:
+        """
+        Records the current state of the active branch.
+
+        The messages are compared by identity with the branch, the nodes of the common prefix are kept
+        and the new messages are added after them.
+
+        Parameters
+        ----------
+        messages : List[Dict[str, Any]]
+            The messages of the active branch.
+        context_messages : List[Dict[str, str]]
+            The context messages the branch is sent with, None before the first request.
+        context_snapshot : Dict[str, str]
+            The version of the context seen by the chat model, None before the first request.
+        """
+        branch = self.branches[self.current]
+        nodes = self._nodes(branch["leaf"])
+        common = 0
+        while (
+            common < min(len(nodes), len(messages))
+            and nodes[common].message is messages[common]
+        ):
+            common += 1
+        leaf = nodes[common - 1] if common else None
+        for message in messages[common:]:
+            leaf = MessageNode(message, leaf, context_snapshot)
+        branch.update(
+            leaf=leaf,
+            context_messages=context_messages,
+            context_snapshot=context_snapshot,
+        )
+
+    def messages(self, name: str) -> List[Dict[str, Any]]:
+        """
+        Returns the messages of a branch.
+
+        Parameters
+        ----------
+        name : str
+            Name of the branch.
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            The messages, shared with the other branches.
+        """
+        return [node.message for node in self._nodes(self.branches[name]["leaf"])]
+
+    def fork(self, index: int) -> Dict[str, Any]:
+        """
+        Creates a branch with the messages of the active branch before `index`, and activates it.
+
+        Parameters
+        ----------
+        index : int
+            Index of the first message replaced in the new branch.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The state of the new branch, as returned by `switch`.
+        """
+        source = self.branches[self.current]
+        nodes = self._nodes(source["leaf"])
+        leaf = nodes[index - 1] if index else None
+        name = f"Branch {len(self.branches)}"
+        self.branches[name] = self._branch(
+            leaf,
+            source["context_messages"],
+            leaf.context_snapshot if leaf else source["context_snapshot"],
+            f"{self.current}, message {index + 1}",
+        )
+        return self.switch(name)
+
+    def switch(self, name: str) -> Dict[str, Any]:
+        """
+        Activates a branch and returns its state.
+
+        Parameters
+        ----------
+        name : str
+            Name of the branch.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The 'messages', 'context_messages' and 'context_snapshot' of the branch,
+            the last two are None before the first request.
+        """
+        self.current = name
+        branch = self.branches[name]
+        return {
+            "messages": self.messages(name),
+            "context_messages": branch["context_messages"],
+            "context_snapshot": branch["context_snapshot"],
+        }
+
+    def branch_names(self) -> List[str]:
+        """
+        Returns the names of the branches, in creation order.
+        """
+        return list(self.branches)
+
+    def describe(self, name: str) -> str:
+        """
+        Returns a short description of a branch for display, e.g. "Branch 1 (from Main, message 3)".
+        """
+        origin = self.branches[name]["origin"]
+        return f"{name} (from {origin})" if origin else name
+
+    def nodes(self) -> List[MessageNode]:
+        """
+        Returns every node of the tree once, e.g. to measure its memory.
+
+        Returns
+        -------
+        List[MessageNode]
+            The nodes of all the branches, the shared ones once.
+        """
+        nodes: Dict[int, MessageNode] = {}
+        for branch in self.branches.values():
+            leaf = branch["leaf"]
+            while leaf is not None and id(leaf) not in nodes:
+                nodes[id(leaf)] = leaf
+                leaf = leaf.parent
+        return list(nodes.values())
@@ -0,0 +1,270 @@
+"""
+Estimates the tokens and the cost of a chat request before it is sent.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import os
+import threading
+
+from chat_strategies.chat_model_strategy import ChatModelStrategy
+from chat_strategies.token_calibrator import get_token_calibrator
+from managers.context_manager import file_header
+from managers.file_manager import num_tokens_from_content
+
+TOKEN_CACHE_SIZE = 10_000
+
+# Token counts of the texts seen recently. Keyed by the text itself: str objects cache their hash,
+# so looking up a text already counted on a previous rerun costs no re-tokenization.
+_token_cache: "OrderedDict[str, int]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    """
+    Returns the number of tokens of a text, memoized across reruns.
+
+    Parameters
+    ----------
+    text : str
+        Text content.
+
+    Returns
+    -------
+    int
+        Number of tokens in the text.
+    """
+    with _token_cache_lock:
+        if text in _token_cache:
+            _token_cache.move_to_end(text)
+            return _token_cache[text]
+    tokens = num_tokens_from_content(text)
+    with _token_cache_lock:
+        _token_cache[text] = tokens
+        if len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return tokens
+
+
+def pop_token_count(text: str) -> Optional[int]:
+    """
+    Removes a text from the token count memo, e.g. when it is spilled to disk, and returns its count.
+
+    Parameters
+    ----------
+    text : str
+        Text content.
+
+    Returns
+    -------
+    Optional[int]
+        Number of tokens in the text, None if it was not counted.
+    """
+    with _token_cache_lock:
+        return _token_cache.pop(text, None)
+
+
+class CostEstimate:
+    """
+    Estimated tokens and cost of a chat request.
+
+    Attributes
+    ----------
+    input_tokens : int
+        Estimated number of uncached input tokens.
+    cache_create_tokens : int
+        Estimated number of input tokens written to the prompt cache.
+    cache_read_tokens : int
+        Estimated number of input tokens read from the prompt cache.
+    max_output_tokens : int
+        Maximum number of output tokens of the request.
+    prompt_cost : float
+        Estimated cost of the prompt in dollars.
+    max_cost : float
+        Cost in dollars if the whole output budget is used.
+    """
+
+    __slots__ = (
+        "input_tokens",
+        "cache_create_tokens",
+        "cache_read_tokens",
+        "max_output_tokens",
+        "prompt_cost",
+        "max_cost",
+    )
+
+    def __init__(
+        self,
+        input_tokens: int,
+        cache_create_tokens: int,
+        cache_read_tokens: int,
+        max_output_tokens: int,
+        prompt_cost: float,
+        max_cost: float,
+    ):
+        self.input_tokens = input_tokens
+        self.cache_create_tokens = cache_create_tokens
+        self.cache_read_tokens = cache_read_tokens
+        self.max_output_tokens = max_output_tokens
+        self.prompt_cost = prompt_cost
+        self.max_cost = max_cost
+
+    @property
+    def prompt_tokens(self) -> int:
+        """
+        Total number of prompt tokens, cached or not.
+        """
+        return self.input_tokens + self.cache_create_tokens + self.cache_read_tokens
+
+
+class CostEstimator:
+    """
+    Class for estimating the cost of a chat request with local tokenizers.
+
+    Token counts are memoized and the context files carry their own precomputed counts, so an estimate
+    only tokenizes the texts that changed since the previous rerun. The local counts are then corrected
+    with the token calibration of the model, learned from the usage reported by the provider.
+
+    Methods
+    -------
+    context_tokens(context: List[Dict[str, Any]]) -> int
+        Returns the number of tokens of the context block.
+    context_message_tokens(context_messages: List[Dict[str, Any]]) -> int
+        Returns the number of tokens of the context messages of a started conversation.
+    estimate(strategy, model_name, system_prompt, context, messages, user_message, max_tokens,
+             context_messages) -> CostEstimate
+        Estimates the tokens and the cost of a request.
+    """
+
+    def context_tokens(self, context: List[Dict[str, Any]]) -> int:
+        """
+        Returns the number of tokens of the context block.
+
+        Parameters
+        ----------
+        context : List[Dict[str, Any]]
+            List of file dictionaries with precomputed 'tokens'.
+
+        Returns
+        -------
+        int
+            Number of tokens of the context block, including the per-file headers.
+        """
+        if not context:
+            return 0
+        return (
+            count_tokens("Context:\n\n")
+            + count_tokens("Ok, I got it!")
+            + sum(item["tokens"] + count_tokens(file_header(item)) for item in context)
+        )
+
+    def context_message_tokens(self, context_messages: List[Dict[str, Any]]) -> int:
+        """
+        Returns the number of tokens of the context messages of a started conversation.
+
+        Parameters
+        ----------
+        context_messages : List[Dict[str, Any]]
+            The context messages sent at the start of every request.
+
+        Returns
+        -------
+        int
+            Number of tokens of the messages. Messages spilled to disk count with the tokens recorded
+            when they were spilled, or about 4 bytes per token.
+        """
+        tokens = 0
+        for message in context_messages:
+            if "spilled" not in message:
+                tokens += count_tokens(message["content"])
+            elif message.get("spilled_tokens") is not None:
+                tokens += message["spilled_tokens"]
+            elif os.path.exists(message["spilled"]):
+                tokens += os.path.getsize(message["spilled"]) // 4
+        return tokens
+
+    def estimate(
+        self,
+        strategy: ChatModelStrategy,
+        model_name: str,
+        system_prompt: str,
+        context: List[Dict[str, Any]],
+        messages: List[Dict[str, str]],
+        user_message: str,
+        max_tokens: int,
+        context_messages: Optional[List[Dict[str, Any]]] = None,
+    ) -> CostEstimate:
+        """
+        Estimates the tokens and the cost of a request.
+
+        Once the conversation has started, the system prompt, context and history are expected to be
+        read from the prompt cache of the providers that support it. The context is then sent as the
+        context messages frozen at the start, its later changes being diffs in the history.
+
+        Parameters
+        ----------
+        strategy : ChatModelStrategy
+            The strategy the request is sent with.
+        model_name : str
+            The name of the model.
+        system_prompt : str
+            The system prompt.
+        context : List[Dict[str, Any]]
+            The context files.
+        messages : List[Dict[str, str]]
+            The chat history, without the new user message.
+        user_message : str
+            The new user message, empty to estimate the fixed part of the request.
+        max_tokens : int
+            The maximum number of output tokens.
+        context_messages : List[Dict[str, Any]], optional
+            The context messages of the started conversation. Default is None, the context files
+            are counted instead.
+
+        Returns
+        -------
+        CostEstimate
+            The estimate.
+        """
+        prefix_tokens = (
+            count_tokens(system_prompt)
+            + (
+                self.context_message_tokens(context_messages)
+                if context_messages is not None
+                else self.context_tokens(context)
+            )
+            + sum(count_tokens(message["content"]) for message in messages)
+        )
+        new_tokens = count_tokens(user_message) if user_message else 0
+
+        # The calibration corrects the whole prompt, split back proportionally
+        local_tokens = prefix_tokens + new_tokens
+        calibrated_tokens = get_token_calibrator().correct(
+            strategy.provider, model_name, local_tokens
+        )
+        if calibrated_tokens != local_tokens:
+            new_tokens = round(new_tokens * calibrated_tokens / local_tokens)
+            prefix_tokens = calibrated_tokens - new_tokens
+
+        cache_create_tokens = cache_read_tokens = 0
+        input_tokens = prefix_tokens + new_tokens
+        if (
+            strategy.supports_prompt_cache
+            and prefix_tokens >= strategy.prompt_cache_min_tokens
+        ):
+            if messages:
+                cache_read_tokens, input_tokens = prefix_tokens, new_tokens
+            else:
+                cache_create_tokens, input_tokens = prefix_tokens, new_tokens
+
+        prompt_cost = strategy.estimate_price(
+            model_name, input_tokens, 0, cache_create_tokens, cache_read_tokens
+        )
+        return CostEstimate(
+            input_tokens=input_tokens,
+            cache_create_tokens=cache_create_tokens,
+            cache_read_tokens=cache_read_tokens,
+            max_output_tokens=max_tokens,
+            prompt_cost=prompt_cost,
+            max_cost=prompt_cost + strategy.estimate_price(model_name, 0, max_tokens),
+        )
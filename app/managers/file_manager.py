@@ -1,12 +1,29 @@
 """
-Handles file-related operations, such as reading files from a directory, filtering by extensions,
+Handles file-related operations, such as reading files from directories and archives, filtering by extensions,
 and calculating token counts for the contents of each file.
 """
 
+import mmap
 import os
-from typing import List, Dict, Any
+import posixpath
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, BinaryIO, Iterable, Iterator, Tuple
 import tiktoken
 
+FILTER_KEYS = ("target_extensions", "always_include", "excluded_dirs")
+
+# Files larger than this are scanned in chunks and only their head and tail are kept
+LARGE_FILE_BYTES = 1024 * 1024
+HEAD_BYTES = 64 * 1024
+TAIL_BYTES = 16 * 1024
+SCAN_CHUNK_BYTES = 1024 * 1024
+# Maps the whitespace bytes (those of bytes.split) to b" " and the others to b"x", to count the words
+_WORD_TABLE = bytes(
+    b" "[0] if chr(i) in " \t\n\r\x0b\x0c" else b"x"[0] for i in range(256)
+)
+
 
 # TODO FileManager занимается чтением файлов и их анализом на токены.
 # TODO Эти две задачи можно разделить на два разных класса:
@@ -14,6 +31,65 @@ import tiktoken
 # TODO и подсчёта токенов.
 
 
+def truncate_chunks(
+    chunks: Iterable[bytes], head_bytes: int, tail_bytes: int
+) -> Dict[str, Any]:
+    """
+    Scans a large file chunk by chunk, keeping only its head and tail, so the memory stays bounded.
+
+    Parameters
+    ----------
+    chunks : Iterable[bytes]
+        The consecutive chunks of the file.
+    head_bytes : int
+        Size of the head window.
+    tail_bytes : int
+        Size of the tail window.
+
+    Returns
+    -------
+    Dict[str, Any]
+        'content' (the head and the tail cut on line boundaries, joined by an elision marker),
+        'truncated', and the stats of the whole file: 'length' (bytes), 'words' and 'lines'.
+    """
+    head = bytearray()
+    tail = b""
+    size = newlines = words = 0
+    in_word = False
+    for chunk in chunks:
+        if len(head) < head_bytes:
+            head += chunk[: head_bytes - len(head)]
+        tail = (tail + chunk)[-tail_bytes:] if tail_bytes else b""
+        size += len(chunk)
+        newlines += chunk.count(b"\n")
+        # Every word starts after a whitespace, or at the start of the chunk unless it continues a word
+        mapped = chunk.translate(_WORD_TABLE)
+        words += mapped.count(b" x") + (mapped[:1] == b"x" and not in_word)
+        in_word = mapped[-1:] == b"x"
+
+    if size <= head_bytes + tail_bytes:
+        head, tail = head + tail[len(tail) - (size - len(head)) :], b""
+        omitted = b""
+    else:
+        # Cut on line boundaries, which are also character boundaries in UTF-8
+        if b"\n" in head:
+            head = head[: head.rfind(b"\n") + 1]
+        if b"\n" in tail:
+            tail = tail[tail.find(b"\n") + 1 :]
+        omitted_bytes = size - len(head) - len(tail)
+        omitted_lines = newlines - head.count(b"\n") - tail.count(b"\n")
+        omitted = f"\n... [{omitted_lines} lines, {omitted_bytes} bytes omitted] ...\n".encode()
+
+    return {
+        # Windows cut inside a line may split a character
+        "content": (bytes(head) + omitted + tail).decode("utf-8", errors="ignore"),
+        "truncated": bool(omitted),
+        "length": size,
+        "words": words,
+        "lines": newlines + 1 if size else 0,
+    }
+
+
 def num_tokens_from_content(content: str, model: str = "gpt-3.5-turbo") -> int:
     """
     Computes the number of tokens in the given text for the specified model.
@@ -38,16 +114,69 @@ class FileManager:
     """
     Class for managing file operations.
 
+    Files larger than `large_file_bytes` are never loaded whole: their stats are computed by scanning them
+    in chunks (memory-mapped on disk, streamed in archives), and only their head and tail are kept and tokenized.
+
+    Parameters
+    ----------
+    large_file_bytes : int, optional
+        Size above which a file is truncated. Default is LARGE_FILE_BYTES.
+    head_bytes : int, optional
+        Size of the head kept of a large file. Default is HEAD_BYTES.
+    tail_bytes : int, optional
+        Size of the tail kept of a large file. Default is TAIL_BYTES.
+
     Methods
     -------
     read_files(folder_path: str, target_extensions: str, always_include: str, excluded_dirs: str)
         -> List[Dict[str, Any]]
         Reads files from the specified directory and its subdirectories, filtering by file extensions,
         including specified always-included files, and excluding specified directories.
+    read_sources(sources: List[Dict[str, str]], target_extensions: str, always_include: str, excluded_dirs: str)
+        -> List[Dict[str, Any]]
+        Reads files from several directories and archives in parallel and merges them.
     """
 
-    def __init__(self):
-        pass
+    def __init__(
+        self,
+        large_file_bytes: int = LARGE_FILE_BYTES,
+        head_bytes: int = HEAD_BYTES,
+        tail_bytes: int = TAIL_BYTES,
+    ):
+        self.large_file_bytes = large_file_bytes
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+
+    def _read_file(self, full_path: str) -> Dict[str, Any]:
+        """
+        Reads a file from disk, memory-mapping and truncating it if it is large.
+        """
+        if os.path.getsize(full_path) > self.large_file_bytes:
+            with open(full_path, "rb") as f, mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mapped:
+                return truncate_chunks(
+                    (
+                        mapped[i : i + SCAN_CHUNK_BYTES]
+                        for i in range(0, len(mapped), SCAN_CHUNK_BYTES)
+                    ),
+                    self.head_bytes,
+                    self.tail_bytes,
+                )
+        with open(full_path, "r", encoding="utf-8") as f:
+            return {"content": f.read()}
+
+    def _read_member(self, f: BinaryIO, size: int) -> Dict[str, Any]:
+        """
+        Reads an archive member, streaming and truncating it if it is large.
+        """
+        if size > self.large_file_bytes:
+            return truncate_chunks(
+                iter(lambda: f.read(SCAN_CHUNK_BYTES), b""),
+                self.head_bytes,
+                self.tail_bytes,
+            )
+        return {"content": f.read().decode("utf-8")}
 
     def _prepare_files_list(
         self,
@@ -75,22 +204,80 @@ class FileManager:
         List[Dict[str, Any]]
             List of dictionaries representing files.
         """
+        if os.path.isfile(folder_path):
+            return [
+                {"path": path, "filename": posixpath.basename(path), **file_data}
+                for path, file_data in self._read_archive(
+                    folder_path, target_extensions, always_include, excluded_dirs
+                )
+            ]
+
         files_list = []
         for subdir, dirs, files in os.walk(folder_path):
             dirs[:] = [d for d in dirs if d not in excluded_dirs]
             for file in files:
                 full_path = os.path.join(subdir, file)
                 if file.endswith(tuple(target_extensions)) or file in always_include:
-                    with open(full_path, "r", encoding="utf-8") as f:
-                        files_list.append(
-                            {
-                                "path": os.path.relpath(full_path, folder_path),
-                                "filename": file,
-                                "content": f.read(),
-                            }
-                        )
+                    files_list.append(
+                        {
+                            "path": os.path.relpath(full_path, folder_path),
+                            "filename": file,
+                            **self._read_file(full_path),
+                        }
+                    )
         return files_list
 
+    def _read_archive(
+        self,
+        archive_path: str,
+        target_extensions: List[str],
+        always_include: List[str],
+        excluded_dirs: List[str],
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Reads the selected files of a zip or tar archive, member by member, without extracting it.
+
+        Parameters
+        ----------
+        archive_path : str
+            Path to the archive.
+        target_extensions : List[str]
+            List of target file extensions.
+        always_include : List[str]
+            List of files that should always be included.
+        excluded_dirs : List[str]
+            List of directories to be excluded.
+
+        Yields
+        ------
+        Tuple[str, Dict[str, Any]]
+            The path of the file in the archive and its content, truncated if it is large.
+        """
+
+        def selected(name: str) -> bool:
+            parts = posixpath.normpath(name).lstrip("/").split("/")
+            return not any(part in excluded_dirs for part in parts[:-1]) and (
+                parts[-1].endswith(tuple(target_extensions))
+                or parts[-1] in always_include
+            )
+
+        if zipfile.is_zipfile(archive_path):
+            with zipfile.ZipFile(archive_path) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and selected(info.filename):
+                        with archive.open(info) as f:
+                            file_data = self._read_member(f, info.file_size)
+                        yield posixpath.normpath(info.filename).lstrip("/"), file_data
+        else:
+            # Stream mode reads the members in order, compressed tars are never seeked
+            with tarfile.open(archive_path, "r|*") as archive:
+                for member in archive:
+                    if member.isfile() and selected(member.name):
+                        file_data = self._read_member(
+                            archive.extractfile(member), member.size
+                        )
+                        yield posixpath.normpath(member.name).lstrip("/"), file_data
+
     def _augment_files_data(
         self, files_data: List[Dict[str, Any]]
     ) -> List[Dict[str, Any]]:
@@ -109,14 +296,19 @@ class FileManager:
             The same list of dictionaries, but each dictionary is augmented with 'length' (number of characters),
             'words' (number of words), 'lines' (number of lines) and
             'tokens' (number of tokens, computed using the num_tokens_from_content function).
+            The stats of the large files, computed while scanning them, describe the whole file
+            (with 'length' in bytes), their tokens only the kept head and tail.
         """
 
         for file_dict in files_data:
             content = file_dict["content"]
-            file_dict["length"] = len(content)
-            file_dict["words"] = len(content.split())
+            if "truncated" not in file_dict:
+                file_dict["length"] = len(content)
+                file_dict["words"] = len(content.split())
+                file_dict["lines"] = (
+                    (content.count("\n") + 1) if len(content) > 0 else 0
+                )
             file_dict["tokens"] = num_tokens_from_content(content)
-            file_dict["lines"] = (content.count("\n") + 1) if len(content) > 0 else 0
 
         return files_data
 
@@ -134,7 +326,7 @@ class FileManager:
         Parameters
         ----------
         folder_path : str
-            Path to the directory.
+            Path to the directory, or to a zip or tar archive read without extracting it.
         target_extensions : str
             String with target file extensions, separated by commas.
         always_include : str
@@ -157,3 +349,68 @@ class FileManager:
         )
         files_list = self._augment_files_data(files_list)
         return files_list
+
+    def read_sources(
+        self,
+        sources: List[Dict[str, str]],
+        target_extensions: str,
+        always_include: str,
+        excluded_dirs: str,
+    ) -> List[Dict[str, Any]]:
+        """
+        Reads files from several directories and archives in parallel and merges them.
+
+        Each source is scanned and tokenized in its own thread, so the scan takes about as long as the
+        largest source. With several sources, the paths are prefixed with the name of their source.
+
+        Parameters
+        ----------
+        sources : List[Dict[str, str]]
+            List of sources with a 'path' to a directory or an archive (.zip, .tar, .tar.gz, .tgz, ...),
+            and optional 'target_extensions', 'always_include' and 'excluded_dirs' overriding the
+            common filters when not empty.
+        target_extensions : str
+            String with target file extensions, separated by commas.
+        always_include : str
+            String with names of files that should always be included, separated by commas.
+        excluded_dirs : str
+            String with names of directories to be excluded, separated by commas.
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            List of dictionaries representing files with additional information, in the order of the sources.
+        """
+        common_filters = {
+            "target_extensions": target_extensions,
+            "always_include": always_include,
+            "excluded_dirs": excluded_dirs,
+        }
+
+        def read_source(source: Dict[str, str]) -> List[Dict[str, Any]]:
+            filters = {
+                key: source.get(key) or common_filters[key] for key in FILTER_KEYS
+            }
+            return self.read_files(folder_path=source["path"], **filters)
+
+        if not sources:
+            return []
+        with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+            results = list(executor.map(read_source, sources))
+        if len(sources) == 1:
+            return results[0]
+
+        files_list = []
+        labels = set()
+        for source, files in zip(sources, results):
+            label = os.path.basename(os.path.normpath(source["path"]))
+            # Sources with the same name, e.g. two "src" folders, get a numbered label
+            unique_label, number = label, 1
+            while unique_label in labels:
+                number += 1
+                unique_label = f"{label}~{number}"
+            labels.add(unique_label)
+            for file_dict in files:
+                file_dict["path"] = posixpath.join(unique_label, file_dict["path"])
+                files_list.append(file_dict)
+        return files_list
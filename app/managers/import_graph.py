@@ -0,0 +1,220 @@
+"""
+Builds the graph of the local imports between the Python files of the context, to select an entry file
+and the files it depends on in one go.
+
+The imports of a file are parsed once per content, so that a context update only parses the changed files.
+Module names are resolved against every suffix of the file paths, as the import roots are not known.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import ast
+import hashlib
+import os
+import posixpath
+
+# (level of a relative import, module, imported names)
+Import = Tuple[int, str, Tuple[str, ...]]
+
+
+def parse_imports(content: str) -> List[Import]:
+    """
+    Returns the imports of a Python file, including those inside functions and conditional blocks.
+
+    Parameters
+    ----------
+    content : str
+        Python source code.
+
+    Returns
+    -------
+    List[Import]
+        The imports as (level, module, names): level is 0 for absolute imports and the number of leading
+        dots for relative ones, names are those of a "from" import. Empty if the content cannot be parsed.
+    """
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return []
+    imports = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.extend((0, alias.name, ()) for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.append(
+                (node.level, node.module or "", tuple(a.name for a in node.names))
+            )
+    return imports
+
+
+def _module_path(path: str) -> Tuple[str, ...]:
+    """
+    Returns the dotted parts of the module of a file path, e.g. ("managers", "file_manager").
+    """
+    parts = tuple(path.replace("\\", "/")[: -len(".py")].split("/"))
+    return parts[:-1] if parts[-1] == "__init__" else parts
+
+
+class ImportGraph:
+    """
+    Class for the graph of the local imports between the Python files of the context.
+
+    Methods
+    -------
+    update(files: List[Dict[str, Any]]) -> int
+        Updates the graph with the current context files and returns the number of parsed files.
+    dependencies(path: str) -> List[str]
+        Returns the local files imported by a file.
+    closure(entries: Iterable[str], depth: int = 0) -> List[str]
+        Returns the entry files and the local files they import, transitively.
+    """
+
+    def __init__(self):
+        # Per path: hash of the content and its parsed imports
+        self.parsed: Dict[str, Tuple[str, List[Import]]] = {}
+        # Per path: the local files it imports
+        self.edges: Dict[str, List[str]] = {}
+
+    def update(self, files: List[Dict[str, Any]]) -> int:
+        """
+        Updates the graph with the current context files.
+
+        Parameters
+        ----------
+        files : List[Dict[str, Any]]
+            File dictionaries with 'path' and 'content' keys, the non-Python files are ignored.
+
+        Returns
+        -------
+        int
+            Number of files parsed, the unchanged ones are reused.
+        """
+        parsed = {}
+        parsed_count = 0
+        for item in files:
+            if not item["path"].endswith(".py"):
+                continue
+            digest = hashlib.sha1(item["content"].encode("utf-8")).hexdigest()
+            previous = self.parsed.get(item["path"])
+            if previous and previous[0] == digest:
+                parsed[item["path"]] = previous
+            else:
+                parsed[item["path"]] = (digest, parse_imports(item["content"]))
+                parsed_count += 1
+        self.parsed = parsed
+
+        # Resolution depends on all the files, it is cheap compared to parsing
+        modules: Dict[str, List[str]] = {}
+        for path in parsed:
+            parts = _module_path(path)
+            for i in range(len(parts)):
+                modules.setdefault(".".join(parts[i:]), []).append(path)
+        self.edges = {
+            path: self._resolve_imports(path, imports, modules)
+            for path, (_, imports) in parsed.items()
+        }
+        return parsed_count
+
+    def _resolve_imports(
+        self, path: str, imports: List[Import], modules: Dict[str, List[str]]
+    ) -> List[str]:
+        """
+        Returns the local files matching the imports of a file.
+        """
+        package = _module_path(path)
+        if not path.replace("\\", "/").endswith("/__init__.py"):
+            package = package[:-1]
+
+        dependencies = []
+        for level, module, names in imports:
+            if level:
+                if level - 1 > len(package):
+                    continue
+                base = package[: len(package) - (level - 1)]
+                module = ".".join(base + tuple(filter(None, module.split("."))))
+            prefix = module + "." if module else ""
+            # "from package import name" may import a submodule
+            found = [
+                self._match(path, name, modules, exact=bool(level))
+                for name in [prefix + name for name in names] + [module]
+            ]
+            submodules = [match for match in found[:-1] if match]
+            if submodules:
+                dependencies.extend(submodules)
+            elif found[-1]:
+                dependencies.append(found[-1])
+        return sorted(set(dependencies) - {path})
+
+    def _match(
+        self,
+        importer: str,
+        module: str,
+        modules: Dict[str, List[str]],
+        exact: bool = False,
+    ) -> Optional[str]:
+        """
+        Returns the file of a module, the closest to the importer if several files match.
+
+        Relative imports are matched against the full module path only (`exact`).
+        """
+        candidates = modules.get(module, [])
+        if exact:
+            candidates = [c for c in candidates if ".".join(_module_path(c)) == module]
+        if not candidates:
+            return None
+        directory = posixpath.dirname(importer.replace("\\", "/"))
+        return max(
+            candidates,
+            key=lambda candidate: len(
+                os.path.commonprefix(
+                    [directory, posixpath.dirname(candidate.replace("\\", "/"))]
+                )
+            ),
+        )
+
+    def dependencies(self, path: str) -> List[str]:
+        """
+        Returns the local files imported by a file.
+
+        Parameters
+        ----------
+        path : str
+            Path of the file in the context.
+
+        Returns
+        -------
+        List[str]
+            Paths of the imported files.
+        """
+        return self.edges.get(path, [])
+
+    def closure(self, entries: Iterable[str], depth: int = 0) -> List[str]:
+        """
+        Returns the entry files and the local files they import, transitively.
+
+        Parameters
+        ----------
+        entries : Iterable[str]
+            Paths of the entry files.
+        depth : int, optional
+            Maximum number of import levels followed, 0 for no limit. Default is 0.
+
+        Returns
+        -------
+        List[str]
+            Paths of the selected files, the entries first, then by import level.
+        """
+        selected = list(dict.fromkeys(entries))
+        seen = set(selected)
+        frontier = list(selected)
+        level = 0
+        while frontier and (not depth or level < depth):
+            level += 1
+            next_frontier = []
+            for path in frontier:
+                for dependency in self.dependencies(path):
+                    if dependency not in seen:
+                        seen.add(dependency)
+                        next_frontier.append(dependency)
+            selected.extend(next_frontier)
+            frontier = next_frontier
+        return selected
@@ -0,0 +1,597 @@
+"""
+Accounts for the memory held by the Streamlit sessions and enforces the configured caps, so that a few users
+loading big repositories cannot exhaust the memory of a shared server.
+
+Over a cap, memory is freed in stages until the session fits: the contents of the disabled context files
+are spilled to disk, the oldest logs are dropped (they stay in the log file), the inactive conversation
+branches are spilled, and finally the enabled context files, the context message and the context snapshot.
+Spilled contents are loaded back where they are used: when files are enabled, a branch is loaded or a
+request is sent.
+"""
+
+from typing import Any, Dict, Iterable, List, MutableMapping, Optional, Tuple
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import pandas as pd
+from streamlit import runtime
+
+from managers.conversation_tree import ConversationTree
+from managers.cost_estimator import pop_token_count
+from managers.log_manager import LogManager
+
+# Sessions that did not report for this long are left out of the global total, their spilled
+# files are only removed once Streamlit has closed them
+SESSION_TTL = 3600
+# Key of a context snapshot spilled to disk, never a file path
+SNAPSHOT_SPILL_KEY = "\0spilled"
+
+# Usage reported by every session: session id -> (report time, total bytes, bytes per key)
+_sessions: Dict[str, Dict[str, Any]] = {}
+# Sessions left out of the total, whose spilled files are kept until Streamlit closes them
+_idle_sessions: set = set()
+_sessions_lock = threading.Lock()
+
+
+class SpillLostError(RuntimeError):
+    """
+    Raised when a content spilled to disk cannot be loaded back.
+    """
+
+
+def estimate_size(obj: Any, seen: Optional[set] = None) -> int:
+    """
+    Estimates the memory used by an object and the containers and strings it holds.
+
+    Parameters
+    ----------
+    obj : Any
+        The object.
+    seen : set, optional
+        Ids of the objects already counted, shared between calls to count shared objects once.
+
+    Returns
+    -------
+    int
+        Approximate size in bytes. The conversation tree is counted with its messages, other objects
+        (e.g. jobs, clients) are counted shallowly.
+    """
+    return _measure(obj, set() if seen is None else seen, None)[0]
+
+
+def _measure(obj: Any, seen: set, counted: Optional[set]) -> Tuple[int, int]:
+    """
+    Returns the size of an object, and the part of it not yet in `counted`, whose ids are added to it.
+    """
+    if id(obj) in seen:
+        return 0, 0
+    seen.add(id(obj))
+    new = counted is not None and id(obj) not in counted
+    if new:
+        counted.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        size = int(obj.memory_usage(index=True, deep=True).sum())
+        return size, size if new else 0
+    size = sys.getsizeof(obj)
+    new_size = size if new else 0
+    if isinstance(obj, ConversationTree):
+        # The nodes are walked iteratively, a long conversation would exceed the recursion limit
+        children = [obj.branches]
+        for node in obj.nodes():
+            children += (node.message, node.context_snapshot)
+    elif isinstance(obj, dict):
+        children = [part for item in obj.items() for part in item]
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        children = obj
+    else:
+        children = ()
+    for child in children:
+        child_size, child_new_size = _measure(child, seen, counted)
+        size += child_size
+        new_size += child_new_size
+    return size, new_size
+
+
+def _session_closed(session_id: str) -> bool:
+    """
+    Returns whether Streamlit has closed the session, False when it cannot tell (e.g. outside the app).
+    """
+    if not runtime.exists():
+        return False
+    # The session manager also keeps the disconnected sessions, until they can no longer reconnect
+    session_manager = getattr(runtime.get_instance(), "_session_mgr", None)
+    if session_manager is None:
+        return False
+    return session_manager.get_session_info(session_id) is None
+
+
+def format_size(size: int) -> str:
+    """
+    Formats a size in bytes for display, e.g. "1.5 MB".
+    """
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def spill_content(item: Dict[str, Any], directory: str) -> int:
+    """
+    Moves the content of a context file or a message to disk.
+
+    Parameters
+    ----------
+    item : Dict[str, Any]
+        File or message dictionary, changed in place so that every reference to it is freed.
+    directory : str
+        Directory of the spilled contents.
+
+    Returns
+    -------
+    int
+        Approximate number of bytes freed.
+    """
+    if "spilled" in item or not item.get("content"):
+        return 0
+    os.makedirs(directory, exist_ok=True)
+    spill_path = os.path.join(directory, uuid.uuid4().hex + ".txt")
+    with open(spill_path, "w", encoding="utf-8") as f:
+        f.write(item["content"])
+    freed = sys.getsizeof(item["content"])
+    # The token count memo would keep the content in memory, the count is kept with the item
+    tokens = pop_token_count(item["content"])
+    if tokens is not None and "tokens" not in item:
+        item["spilled_tokens"] = tokens
+    item["content"] = ""
+    item["spilled"] = spill_path
+    return freed
+
+
+def restore_content(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Loads back the content of a context file or a message spilled to disk.
+
+    Parameters
+    ----------
+    item : Dict[str, Any]
+        File or message dictionary.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The same dictionary, with its content in memory.
+
+    Raises
+    ------
+    SpillLostError
+        If the spilled file no longer exists, the item is left spilled.
+    """
+    spill_path = item.get("spilled")
+    if spill_path:
+        item["content"] = _read_spilled(spill_path)
+        del item["spilled"]
+        os.remove(spill_path)
+    item.pop("spilled_tokens", None)
+    return item
+
+
+def _read_spilled(spill_path: str) -> str:
+    """
+    Reads a spilled file, raising SpillLostError if it no longer exists.
+    """
+    try:
+        with open(spill_path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError as error:
+        raise SpillLostError(
+            f"A content spilled to disk over the memory cap was lost ({spill_path})"
+        ) from error
+
+
+def spill_snapshot(snapshot: Dict[str, str], directory: str) -> int:
+    """
+    Moves a context snapshot (file contents by path) to disk.
+
+    Parameters
+    ----------
+    snapshot : Dict[str, str]
+        The snapshot, changed in place so that every reference to it is freed.
+    directory : str
+        Directory of the spilled contents.
+
+    Returns
+    -------
+    int
+        Approximate number of bytes freed.
+    """
+    if not snapshot or SNAPSHOT_SPILL_KEY in snapshot:
+        return 0
+    os.makedirs(directory, exist_ok=True)
+    spill_path = os.path.join(directory, uuid.uuid4().hex + ".json")
+    with open(spill_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    freed = sum(sys.getsizeof(content) for content in snapshot.values())
+    snapshot.clear()
+    snapshot[SNAPSHOT_SPILL_KEY] = spill_path
+    return freed
+
+
+def restore_snapshot(snapshot: Optional[Dict[str, str]]) -> Optional[Dict[str, str]]:
+    """
+    Loads back a context snapshot spilled to disk.
+
+    Parameters
+    ----------
+    snapshot : Dict[str, str], optional
+        The snapshot, restored in place.
+
+    Returns
+    -------
+    Dict[str, str]
+        The same snapshot, with the file contents in memory.
+
+    Raises
+    ------
+    SpillLostError
+        If the spilled file no longer exists, the snapshot is left spilled.
+    """
+    spill_path = snapshot.get(SNAPSHOT_SPILL_KEY) if snapshot else None
+    if spill_path:
+        contents = json.loads(_read_spilled(spill_path))
+        del snapshot[SNAPSHOT_SPILL_KEY]
+        snapshot.update(contents)
+        os.remove(spill_path)
+    return snapshot
+
+
+def restore_conversation(
+    messages: Iterable[Dict[str, Any]],
+    context_messages: Optional[List[Dict[str, str]]],
+    context_snapshot: Optional[Dict[str, str]],
+) -> None:
+    """
+    Loads back the spilled parts of a conversation before it is displayed or continued.
+
+    Parameters
+    ----------
+    messages : Iterable[Dict[str, Any]]
+        The messages of the conversation.
+    context_messages : List[Dict[str, str]], optional
+        The context messages the conversation is sent with.
+    context_snapshot : Dict[str, str], optional
+        The version of the context seen by the chat model.
+
+    Raises
+    ------
+    SpillLostError
+        If a spilled file no longer exists, once the other parts are loaded back.
+    """
+    lost = None
+    for message in list(messages) + list(context_messages or []):
+        try:
+            restore_content(message)
+        except SpillLostError as error:
+            lost = error
+    try:
+        restore_snapshot(context_snapshot)
+    except SpillLostError as error:
+        lost = error
+    if lost:
+        raise lost
+
+
+def discard_spilled(items: List[Dict[str, Any]]) -> None:
+    """
+    Removes the spilled contents of context files that are no longer used, e.g. after a context update.
+
+    Parameters
+    ----------
+    items : List[Dict[str, Any]]
+        File dictionaries of the previous full context.
+    """
+    for item in items:
+        spill_path = item.pop("spilled", None)
+        if spill_path and os.path.exists(spill_path):
+            os.remove(spill_path)
+
+
+class MemoryManager:
+    """
+    Class for accounting and capping the memory held by the sessions.
+
+    Parameters
+    ----------
+    session_cap_mb : float, optional
+        Maximum memory of a session in MB, 0 for no limit. Default is 0.
+    global_cap_mb : float, optional
+        Maximum memory of all the sessions in MB, 0 for no limit. Default is 0.
+    spill_dir : str, optional
+        Directory of the spilled file contents. Default is a "chat_app_spill" directory in the temp directory.
+
+    Methods
+    -------
+    account(session_id: str, session_state: MutableMapping) -> Dict[str, int]
+        Measures the memory of a session and reports it for the global totals.
+    enforce(session_id: str, session_state: MutableMapping, log_manager: LogManager = None) -> List[str]
+        Frees memory of the session while it is over a cap, and returns what was done.
+    sessions() -> Dict[str, Dict[str, Any]]
+        Returns the memory usage reported by every live session.
+    clear_spill(session_id: str) -> None
+        Removes the spilled files of a session, e.g. once it has been closed.
+    """
+
+    def __init__(
+        self,
+        session_cap_mb: float = 0,
+        global_cap_mb: float = 0,
+        spill_dir: str = None,
+    ):
+        self.session_cap = int(session_cap_mb * 1024 * 1024)
+        self.global_cap = int(global_cap_mb * 1024 * 1024)
+        self.spill_dir = spill_dir or os.path.join(
+            tempfile.gettempdir(), "chat_app_spill"
+        )
+
+    def account(self, session_id: str, session_state: MutableMapping) -> Dict[str, int]:
+        """
+        Measures the memory of a session and reports it for the global totals.
+
+        Parameters
+        ----------
+        session_id : str
+            Id of the session.
+        session_state : MutableMapping
+            The state of the session.
+
+        Returns
+        -------
+        Dict[str, int]
+            Approximate bytes per session key, largest first. Objects shared by several keys
+            (e.g. the enabled files of `context` and `full_context`) are counted in each of them.
+        """
+        # The keys are walked once, the total counts the shared objects once
+        keys = {}
+        counted = set()
+        total = 0
+        for key in list(session_state):
+            keys[str(key)], key_total = _measure(session_state[key], set(), counted)
+            total += key_total
+
+        now = time.time()
+        with _sessions_lock:
+            _sessions[session_id] = {"updated": now, "total": total, "keys": keys}
+            _idle_sessions.discard(session_id)
+            for sid, usage in list(_sessions.items()):
+                if now - usage["updated"] > SESSION_TTL:
+                    del _sessions[sid]
+                    _idle_sessions.add(sid)
+            idle_ids = list(_idle_sessions)
+        # An idle session may still be open in a browser tab and load its spilled contents back
+        closed_ids = [sid for sid in idle_ids if _session_closed(sid)]
+        with _sessions_lock:
+            _idle_sessions.difference_update(closed_ids)
+        for closed_id in closed_ids:
+            self.clear_spill(closed_id)
+        return dict(sorted(keys.items(), key=lambda item: item[1], reverse=True))
+
+    def sessions(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the memory usage reported by every live session.
+
+        Returns
+        -------
+        Dict[str, Dict[str, Any]]
+            Per session id: the report time, the total bytes and the bytes per key.
+        """
+        with _sessions_lock:
+            return dict(_sessions)
+
+    def _excess(self, session_id: str) -> int:
+        """
+        Returns the number of bytes to free for the session to fit both caps.
+        """
+        usage = self.sessions()
+        excess = 0
+        if self.session_cap:
+            excess = usage[session_id]["total"] - self.session_cap
+        if self.global_cap:
+            global_total = sum(session["total"] for session in usage.values())
+            excess = max(excess, global_total - self.global_cap)
+        return max(excess, 0)
+
+    def _release(self, session_id: str, freed: int) -> None:
+        """
+        Deducts the bytes freed by `enforce` from the reported total of the session.
+        """
+        with _sessions_lock:
+            if session_id in _sessions:
+                _sessions[session_id]["total"] -= freed
+
+    def _inactive_branches(
+        self, session_state: MutableMapping
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, str]]]:
+        """
+        Returns the messages and context messages, and the snapshots, only used by the inactive branches.
+        """
+        tree: Optional[ConversationTree] = session_state.get("conversation_tree")
+        if tree is None:
+            return [], []
+        current = tree.branches[tree.current]
+        active = {id(message) for message in session_state.get("messages", [])}
+        active.update(id(item) for item in current["context_messages"] or [])
+        active.add(id(current["context_snapshot"]))
+        active.add(id(session_state.get("context_snapshot")))
+        items: Dict[int, Dict[str, Any]] = {}
+        snapshots: Dict[int, Dict[str, str]] = {}
+        for name, branch in tree.branches.items():
+            if name == tree.current:
+                continue
+            for message in tree.messages(name) + list(branch["context_messages"] or []):
+                if id(message) not in active:
+                    items[id(message)] = message
+            if (
+                branch["context_snapshot"]
+                and id(branch["context_snapshot"]) not in active
+            ):
+                snapshots[id(branch["context_snapshot"])] = branch["context_snapshot"]
+        return list(items.values()), list(snapshots.values())
+
+    def _spill(
+        self, items: List[Dict[str, Any]], directory: str, excess: int
+    ) -> Tuple[int, int]:
+        """
+        Spills the contents of the items, largest first, until `excess` bytes are freed.
+
+        Returns
+        -------
+        Tuple[int, int]
+            Number of spilled items and number of bytes freed.
+        """
+        items = sorted(
+            items, key=lambda item: len(item.get("content", "")), reverse=True
+        )
+        spilled = freed = 0
+        for item in items:
+            if freed >= excess:
+                break
+            item_freed = spill_content(item, directory)
+            if item_freed:
+                spilled += 1
+                freed += item_freed
+        return spilled, freed
+
+    def _drop_logs(self, logs: List[Any], excess: int) -> Tuple[int, int]:
+        """
+        Drops the oldest entries of a log until `excess` bytes are freed.
+
+        Returns
+        -------
+        Tuple[int, int]
+            Number of dropped entries and number of bytes freed.
+        """
+        dropped = freed = 0
+        while logs and freed < excess:
+            freed += estimate_size(logs.pop(0))
+            dropped += 1
+        return dropped, freed
+
+    def enforce(
+        self,
+        session_id: str,
+        session_state: MutableMapping,
+        log_manager: LogManager = None,
+    ) -> List[str]:
+        """
+        Frees memory of the session while it is over a cap, and returns what was done.
+
+        The stages are tried in order, each one until the session fits: the disabled context files are
+        spilled to disk, the oldest logs are dropped, the inactive branches are spilled, then the enabled
+        context files, the context message and the context snapshot. The displayed messages are never touched.
+
+        Parameters
+        ----------
+        session_id : str
+            Id of the session.
+        session_state : MutableMapping
+            The state of the session.
+        log_manager : LogManager, optional
+            The log manager of the run, whose entries are dropped with the logs of the log tab. Default is None.
+
+        Returns
+        -------
+        List[str]
+            Descriptions of the actions taken, empty if the session fits the caps.
+        """
+        if not (self.session_cap or self.global_cap):
+            return []
+        self.account(session_id, session_state)
+        excess = initial_excess = self._excess(session_id)
+        if not excess:
+            return []
+        directory = os.path.join(self.spill_dir, session_id)
+        actions = []
+
+        # The context holds the enabled files of the full context
+        context = session_state.get("context", [])
+        enabled = {id(item) for item in context}
+        disabled = [
+            item
+            for item in session_state.get("full_context", [])
+            if id(item) not in enabled
+        ]
+        spilled, freed = self._spill(disabled, directory, excess)
+        if spilled:
+            actions.append(f"Spilled {spilled} disabled context files to disk")
+            excess -= freed
+
+        # The logs are kept in the log file
+        dropped = 0
+        for logs in (
+            session_state.get("logs", []),
+            log_manager.logs if log_manager else [],
+        ):
+            if excess > 0:
+                logs_dropped, freed = self._drop_logs(logs, excess)
+                dropped += logs_dropped
+                excess -= freed
+        if dropped:
+            actions.append(f"Dropped the {dropped} oldest log entries")
+
+        if excess > 0:
+            items, snapshots = self._inactive_branches(session_state)
+            spilled, freed = self._spill(items, directory, excess)
+            excess -= freed
+            for snapshot in snapshots:
+                if excess <= 0:
+                    break
+                spilled += 1
+                excess -= spill_snapshot(snapshot, directory)
+            if spilled:
+                actions.append(
+                    f"Spilled {spilled} messages and snapshots of inactive branches to disk"
+                )
+
+        if excess > 0:
+            # Loaded back by the next request
+            spilled, freed = self._spill(
+                list(context) + list(session_state.get("context_messages") or []),
+                directory,
+                excess,
+            )
+            excess -= freed
+            snapshot_freed = 0
+            if excess > 0 and session_state.get("context_snapshot"):
+                snapshot_freed = spill_snapshot(
+                    session_state["context_snapshot"], directory
+                )
+            if spilled or snapshot_freed:
+                actions.append(
+                    f"Spilled {spilled} enabled context files and context messages to disk"
+                    + (", and the context snapshot" if snapshot_freed else "")
+                )
+
+        self._release(session_id, initial_excess - excess)
+        if self._excess(session_id):
+            actions.append(
+                "Still over the memory cap, clear the chat or remove context files"
+            )
+        return actions
+
+    def clear_spill(self, session_id: str) -> None:
+        """
+        Removes the spilled files of a session, e.g. once it has been closed.
+
+        Parameters
+        ----------
+        session_id : str
+            Id of the session.
+        """
+        shutil.rmtree(os.path.join(self.spill_dir, session_id), ignore_errors=True)
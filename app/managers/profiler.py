@@ -0,0 +1,141 @@
+"""
+Profiles the Streamlit reruns: wall time, memory allocations (tracemalloc) and call counts of the UI components
+and of the manager and strategy calls made during a rerun.
+"""
+
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+import functools
+import inspect
+import threading
+import time
+import tracemalloc
+
+
+class RerunProfiler:
+    """
+    Class for profiling a rerun of the app.
+
+    Sections can be nested; the time and allocations of a section include its nested sections.
+    Only the script thread of the rerun is profiled. tracemalloc is process-wide, so the allocations
+    of concurrent sessions and background threads are mixed together.
+
+    Parameters
+    ----------
+    enabled : bool, optional
+        Whether to profile. A disabled profiler adds no overhead. Default is False.
+
+    Attributes
+    ----------
+    stats : Dict[str, Dict[str, float]]
+        Per section name: calls, total time (ms), allocated memory (KB) and peak memory (KB).
+
+    Methods
+    -------
+    section(name: str)
+        Context manager profiling a block of code.
+    instrument(obj: Any, label: str) -> None
+        Profiles every public method of an object.
+    report() -> Dict[str, Any]
+        Returns the profile of the rerun.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.stats: Dict[str, Dict[str, float]] = {}
+        self.stack: List[Dict[str, int]] = []
+        self.started = time.perf_counter()
+        self.thread = threading.get_ident()
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        """
+        Context manager profiling a block of code.
+
+        Parameters
+        ----------
+        name : str
+            Name of the section, calls with the same name are aggregated.
+        """
+        # Calls made from the background threads (e.g. the event loop) are not part of the rerun
+        if not self.enabled or threading.get_ident() != self.thread:
+            yield
+            return
+
+        current, peak = tracemalloc.get_traced_memory()
+        if self.stack:
+            self.stack[-1]["peak"] = max(self.stack[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        self.stack.append({"start": current, "peak": current})
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            current, peak = tracemalloc.get_traced_memory()
+            frame = self.stack.pop()
+            frame["peak"] = max(frame["peak"], peak)
+            # The peak of a nested section is also a peak of the enclosing one
+            if self.stack:
+                self.stack[-1]["peak"] = max(self.stack[-1]["peak"], frame["peak"])
+            tracemalloc.reset_peak()
+
+            stats = self.stats.setdefault(
+                name, {"calls": 0, "time_ms": 0.0, "alloc_kb": 0.0, "peak_kb": 0.0}
+            )
+            stats["calls"] += 1
+            stats["time_ms"] += elapsed * 1000
+            stats["alloc_kb"] += (current - frame["start"]) / 1024
+            stats["peak_kb"] = max(
+                stats["peak_kb"], (frame["peak"] - frame["start"]) / 1024
+            )
+
+    def _wrap(self, name: str, method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with self.section(name):
+                return method(*args, **kwargs)
+
+        return wrapper
+
+    def instrument(self, obj: Any, label: str) -> None:
+        """
+        Profiles every public method of an object, by wrapping them on the instance.
+
+        Parameters
+        ----------
+        obj : Any
+            The object, e.g. a manager or a strategy.
+        label : str
+            Prefix of the section names, e.g. "FileManager".
+        """
+        if not self.enabled or obj is None:
+            return
+        for name, method in inspect.getmembers(obj, inspect.ismethod):
+            # The async methods run on the event loop thread, outside of the rerun
+            if name.startswith(("_", "async_")):
+                continue
+            setattr(obj, name, self._wrap(f"{label}.{name}", method))
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Returns the profile of the rerun.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The total time of the rerun (ms) and the stats of every section, slowest first.
+        """
+        return {
+            "timestamp": time.time(),
+            "total_ms": (time.perf_counter() - self.started) * 1000,
+            "sections": dict(
+                sorted(
+                    self.stats.items(),
+                    key=lambda item: item[1]["time_ms"],
+                    reverse=True,
+                )
+            ),
+        }
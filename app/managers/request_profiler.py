@@ -0,0 +1,177 @@
+"""
+Profiles single chat requests with cProfile and tracemalloc, and saves the reports next to the log,
+to find out where the time of a slow turn went without a debugger.
+"""
+
+from contextlib import contextmanager
+from typing import Iterator
+import cProfile
+import datetime
+import io
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+
+# Number of functions and allocation sites in the text report
+REPORT_LIMIT = 30
+
+# tracemalloc is process-wide, it runs while at least one request is profiled
+_tracing_lock = threading.Lock()
+_tracing_requests = 0
+_tracing_started = False
+
+
+def _start_tracing() -> None:
+    global _tracing_requests, _tracing_started
+    with _tracing_lock:
+        if _tracing_requests == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_requests += 1
+
+
+def _stop_tracing() -> None:
+    global _tracing_requests, _tracing_started
+    with _tracing_lock:
+        _tracing_requests -= 1
+        # Tracing started by someone else, e.g. the rerun profiler, is left running
+        if _tracing_requests == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+
+class RequestProfile:
+    """
+    Profile of a single chat request, possibly spanning several reruns.
+
+    Parameters
+    ----------
+    label : str
+        Label of the request, e.g. "OpenAI - gpt-4o", used in the report name.
+
+    Methods
+    -------
+    capture()
+        Context manager profiling a part of the request.
+    finish() -> tracemalloc.Snapshot
+        Ends the profiling and returns the final memory snapshot.
+    """
+
+    def __init__(self, label: str):
+        self.label = label
+        self.profile = cProfile.Profile()
+        self.started = time.perf_counter()
+        self.timestamp = datetime.datetime.now()
+        self.captured = 0.0
+        self.finished = False
+        _start_tracing()
+        self.snapshot = tracemalloc.take_snapshot()
+
+    @contextmanager
+    def capture(self) -> Iterator[None]:
+        """
+        Context manager profiling a part of the request. Only the calling thread is profiled by cProfile,
+        the strategy call running on the event loop shows up as the time spent waiting for it.
+        """
+        started = time.perf_counter()
+        self.profile.enable()
+        try:
+            yield
+        finally:
+            self.profile.disable()
+            self.captured += time.perf_counter() - started
+
+    def finish(self) -> tracemalloc.Snapshot:
+        """
+        Ends the profiling and returns the final memory snapshot.
+        """
+        snapshot = tracemalloc.take_snapshot()
+        if not self.finished:
+            self.finished = True
+            _stop_tracing()
+        return snapshot
+
+
+class RequestProfiler:
+    """
+    Class for profiling chat requests and saving the reports.
+
+    Parameters
+    ----------
+    report_dir : str, optional
+        Directory of the reports. Default is "logs", next to the application log.
+
+    Methods
+    -------
+    start(label: str) -> RequestProfile
+        Starts profiling a request.
+    save(profile: RequestProfile) -> str
+        Saves the report of a request and returns its path.
+    """
+
+    def __init__(self, report_dir: str = "logs"):
+        self.report_dir = report_dir
+
+    def start(self, label: str) -> RequestProfile:
+        """
+        Starts profiling a request.
+
+        Parameters
+        ----------
+        label : str
+            Label of the request.
+
+        Returns
+        -------
+        RequestProfile
+            The profile, to be captured and then saved.
+        """
+        return RequestProfile(label)
+
+    def save(self, profile: RequestProfile, limit: int = REPORT_LIMIT) -> str:
+        """
+        Saves the report of a request: the raw pstats data (`.prof`, readable with pstats or snakeviz)
+        and a text summary with the slowest functions and the top allocations (`.txt`).
+
+        Parameters
+        ----------
+        profile : RequestProfile
+            The profile of the request.
+        limit : int, optional
+            Number of functions and allocation sites in the summary. Default is REPORT_LIMIT.
+
+        Returns
+        -------
+        str
+            Path of the text summary.
+        """
+        snapshot = profile.finish()
+        os.makedirs(self.report_dir, exist_ok=True)
+        name = "request_{}_{}".format(
+            profile.timestamp.strftime("%Y%m%d_%H%M%S"),
+            re.sub(r"[^\w.-]+", "_", profile.label).strip("_"),
+        )
+        base_path = os.path.join(self.report_dir, name)
+        profile.profile.dump_stats(base_path + ".prof")
+
+        stats_output = io.StringIO()
+        stats = pstats.Stats(profile.profile, stream=stats_output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+
+        allocations = snapshot.compare_to(profile.snapshot, "lineno")[:limit]
+        with open(base_path + ".txt", "w", encoding="utf-8") as report:
+            report.write(f"Request: {profile.label}\n")
+            report.write(f"Started: {profile.timestamp:%Y-%m-%d %H:%M:%S}\n")
+            report.write(
+                f"Wall time: {time.perf_counter() - profile.started:.3f} s, "
+                f"profiled: {profile.captured:.3f} s\n\n"
+            )
+            report.write(f"Top {limit} functions by cumulative time\n")
+            report.write(stats_output.getvalue())
+            report.write(f"\nTop {limit} allocations (process-wide, all threads)\n")
+            for allocation in allocations:
+                report.write(f"{allocation}\n")
+        return base_path + ".txt"
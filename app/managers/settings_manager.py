@@ -2,7 +2,7 @@
 Handles the loading and saving of application settings, as well as providing default settings when necessary.
 """
 
-from typing import Dict, TextIO
+from typing import Any, Dict, List, TextIO
 import os
 import json
 
@@ -23,6 +23,8 @@ class SettingsManager:
         Saves settings to a JSON file.
     load_settings_from_file(file: TextIO) -> Dict[str, str]:
         Loads settings from a file object.
+    context_sources(settings: Dict[str, Any]) -> List[Dict[str, str]]:
+        Returns the context sources of the settings.
     """
 
     def __init__(self):
@@ -39,10 +41,17 @@ class SettingsManager:
         """
         return {
             "folder_path": "",
+            "context_sources": [],
             "target_extensions": "",
             "always_include": "",
             "excluded_dirs": "",
+            "context_minify": "none",
+            "outline_expand": "",
+            "prewarm_cache": False,
             "system_prompt": "",
+            "request_budget": 0.0,
+            "session_budget": 0.0,
+            "budget_action": "confirm",
         }
 
     def load_settings(self, filename: str = DEFAULT_SETTINGS_FILE) -> Dict[str, str]:
@@ -61,7 +70,8 @@ class SettingsManager:
         """
         try:
             with open(filename, "r", encoding="utf-8") as f:
-                return json.load(f)
+                # Settings files saved by older versions lack the newer keys
+                return {**self.default_settings(), **json.load(f)}
         except FileNotFoundError:
             return self.default_settings()
 
@@ -98,6 +108,27 @@ class SettingsManager:
             Dictionary with loaded settings or default settings if the file cannot be decoded.
         """
         try:
-            return json.load(file)
+            return {**self.default_settings(), **json.load(file)}
         except json.JSONDecodeError:
             return self.default_settings()
+
+    def context_sources(self, settings: Dict[str, Any]) -> List[Dict[str, str]]:
+        """
+        Returns the context sources of the settings.
+
+        Settings saved by older versions only have a single `folder_path`, which becomes the only source.
+
+        Parameters
+        ----------
+        settings : Dict[str, Any]
+            The settings.
+
+        Returns
+        -------
+        List[Dict[str, str]]
+            List of sources with a 'path' and optional per-source filters, the sources without a path are skipped.
+        """
+        sources = settings.get("context_sources") or [
+            {"path": settings.get("folder_path", "")}
+        ]
+        return [source for source in sources if source.get("path")]
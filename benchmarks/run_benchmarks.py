@@ -0,0 +1,420 @@
+"""
+Benchmark suite for the hot paths of the app.
+
+Runs each benchmark several times, stores the results as JSON and optionally compares them with a previous run.
+Timings are also reported normalized by a fixed calibration workload measured in the same run, so results
+from different machines can be compared.
+
+Usage (from the repository root):
+    python benchmarks/run_benchmarks.py [--quick] [--filter TEXT] [--output PATH] [--compare PATH]
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, os.path.abspath(APP_DIR))
+
+# pylint: disable=wrong-import-position
+from managers.chat_history_manager import ChatHistoryManager  # noqa: E402
+from managers.context_manager import ContextManager  # noqa: E402
+from managers.context_minifier import ContextMinifier  # noqa: E402
+from managers.file_manager import FileManager, num_tokens_from_content  # noqa: E402
+from managers.import_graph import ImportGraph  # noqa: E402
+from managers.log_manager import LogManager  # noqa: E402
+from chat_strategies.model_catalog import get_model_catalog  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+SEED = 42
+WORDS = (
+    "def class return import self value items result context model token file "
+    "path content messages strategy price cache settings for in if else None"
+).split()
+
+
+def synthetic_text(rng: random.Random, lines: int) -> str:
+    """
+    Generates deterministic source-like text.
+    """
+    return "\n".join(
+        "    " * rng.randint(0, 3)
+        + " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 12)))
+        for _ in range(lines)
+    )
+
+
+def make_tree(root: str, files: int, lines: int) -> None:
+    """
+    Creates a synthetic source tree with `files` files of about `lines` lines.
+    """
+    rng = random.Random(SEED)
+    for i in range(files):
+        subdir = os.path.join(root, f"pkg_{i % 10}", f"sub_{i % 3}")
+        os.makedirs(subdir, exist_ok=True)
+        extension = ".py" if i % 4 else ".txt"
+        with open(
+            os.path.join(subdir, f"module_{i}{extension}"), "w", encoding="utf-8"
+        ) as f:
+            f.write(synthetic_text(rng, lines))
+    excluded = os.path.join(root, ".venv")
+    os.makedirs(excluded, exist_ok=True)
+    with open(os.path.join(excluded, "ignored.py"), "w", encoding="utf-8") as f:
+        f.write(synthetic_text(rng, lines))
+
+
+def measure(func: Callable[[], Any], repeat: int, min_time: float) -> Dict[str, float]:
+    """
+    Times `func`, calling it enough times per repetition to last at least `min_time` seconds.
+
+    Returns
+    -------
+    Dict[str, float]
+        Seconds per call: minimum, median and standard deviation over the repetitions.
+    """
+    func()  # warm-up
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - started) / number)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "stdev": statistics.pstdev(timings),
+        "number": number,
+    }
+
+
+def calibration_workload() -> None:
+    """
+    A fixed pure-Python workload (hashing, sorting, string building) used as the time unit.
+    """
+    rng = random.Random(SEED)
+    data = [rng.random() for _ in range(20_000)]
+    data.sort()
+    text = "".join(f"{value:.6f}" for value in data[:5_000])
+    hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chat_messages(count: int) -> List[Dict[str, str]]:
+    """
+    Generates a synthetic conversation.
+    """
+    rng = random.Random(SEED)
+    return [
+        {
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": synthetic_text(rng, 5 if i % 2 == 0 else 40),
+        }
+        for i in range(count)
+    ]
+
+
+def price_strategy(name: str, module_name: str, class_name: str) -> Any:
+    """
+    Creates a strategy with a dummy API key, None if its SDK is unavailable.
+    """
+    try:
+        module = __import__(module_name, fromlist=[class_name])
+    except ImportError as e:
+        print(f"  skipping {name} price benchmark: {e}")
+        return None
+    return getattr(module, class_name)(api_key="benchmark")
+
+
+PRICE_STRATEGIES = [
+    ("OpenAI", "chat_strategies.openai_strategy", "OpenAIChatStrategy"),
+    ("Anthropic", "chat_strategies.anthropic_strategy", "AnthropicChatStrategy"),
+    ("Gemini", "chat_strategies.gemini_strategy", "GeminiChatStrategy"),
+    ("Deepseeker", "chat_strategies.deepseeker_strategy", "DeepseekerChatStrategy"),
+]
+
+
+class Fixtures:
+    """
+    Creates the fixtures on first use, so that only the selected benchmarks pay for them.
+    """
+
+    TREE_SIZES = {"small": (20, 50), "medium": (200, 100), "large": (1000, 200)}
+    # Files of the medium tree read as context: every file but the excluded .venv
+    CONTEXT_FILES = TREE_SIZES["medium"][0]
+
+    def __init__(self, tmp_dir: str, quick: bool):
+        self.tmp_dir = tmp_dir
+        self.tree_sizes = {
+            size: files_lines
+            for size, files_lines in self.TREE_SIZES.items()
+            if not (quick and size == "large")
+        }
+        self.file_manager = FileManager()
+        self.cache: Dict[str, Any] = {}
+
+    def _cached(self, key: str, build: Callable[[], Any]) -> Any:
+        if key not in self.cache:
+            self.cache[key] = build()
+        return self.cache[key]
+
+    def tree(self, size: str) -> str:
+        def build() -> str:
+            root = os.path.join(self.tmp_dir, f"tree_{size}")
+            make_tree(root, *self.tree_sizes[size])
+            return root
+
+        return self._cached(f"tree_{size}", build)
+
+    def archive(self) -> str:
+        return self._cached(
+            "archive",
+            lambda: shutil.make_archive(
+                os.path.join(self.tmp_dir, "tree_medium"), "zip", self.tree("medium")
+            ),
+        )
+
+    def large_log(self) -> str:
+        def build() -> str:
+            log_dir = os.path.join(self.tmp_dir, "large_log")
+            os.makedirs(log_dir, exist_ok=True)
+            rng = random.Random(SEED)
+            with open(os.path.join(log_dir, "app.log"), "w", encoding="utf-8") as f:
+                line = synthetic_text(rng, 1) + "\n"
+                f.write(line * (32 * 1024 * 1024 // len(line)))
+            return log_dir
+
+        return self._cached("large_log", build)
+
+    def context(self) -> List[Dict[str, Any]]:
+        return self._cached(
+            "context",
+            lambda: self.file_manager.read_files(
+                folder_path=self.tree("medium"),
+                target_extensions=".py, .txt",
+                always_include="",
+                excluded_dirs=".venv",
+            ),
+        )
+
+
+def build_benchmarks(
+    tmp_dir: str, quick: bool
+) -> Dict[str, Callable[[], Optional[Callable[[], Any]]]]:
+    """
+    Returns the benchmarks by name, as factories preparing their fixtures and returning the benchmarked
+    function (None if it cannot run).
+    """
+    fixtures = Fixtures(tmp_dir, quick)
+    file_manager = fixtures.file_manager
+    benchmarks = {}
+
+    def read_files(folder: Callable[[], str], extensions: str = ".py, .txt"):
+        def factory() -> Callable[[], Any]:
+            folder_path = folder()
+            return lambda: file_manager.read_files(
+                folder_path=folder_path,
+                target_extensions=extensions,
+                always_include="README.md" if extensions != ".log" else "",
+                excluded_dirs=".venv" if extensions != ".log" else "",
+            )
+
+        return factory
+
+    for size, (files, _) in fixtures.tree_sizes.items():
+        benchmarks[f"file_manager.read_files[{size}:{files}]"] = read_files(
+            lambda size=size: fixtures.tree(size)
+        )
+
+    # All the trees at once, scanned in parallel: about the time of the largest one
+    def read_sources() -> Callable[[], Any]:
+        sources = [{"path": fixtures.tree(size)} for size in fixtures.tree_sizes]
+        return lambda: file_manager.read_sources(
+            sources=sources,
+            target_extensions=".py, .txt",
+            always_include="README.md",
+            excluded_dirs=".venv",
+        )
+
+    benchmarks[f"file_manager.read_sources[{len(fixtures.tree_sizes)} roots]"] = (
+        read_sources
+    )
+    benchmarks["file_manager.read_files[zip:medium]"] = read_files(fixtures.archive)
+
+    # A huge log: scanned in chunks, only its head and tail are tokenized
+    benchmarks["file_manager.read_files[large:32MB log]"] = read_files(
+        fixtures.large_log, ".log"
+    )
+
+    rng = random.Random(SEED)
+    for label, lines in (("1k", 25), ("100k", 2500)):
+        text = synthetic_text(rng, lines)
+        benchmarks[f"num_tokens_from_content[{label}]"] = (
+            lambda text=text: lambda: num_tokens_from_content(text)
+        )
+
+    context_files = Fixtures.CONTEXT_FILES
+    context_manager = ContextManager()
+
+    def build_context_messages() -> Callable[[], Any]:
+        context = fixtures.context()
+        return lambda: context_manager.build_context_messages(context)
+
+    def update_import_graph() -> Callable[[], Any]:
+        context = fixtures.context()
+        return lambda: ImportGraph().update(context)
+
+    benchmarks[f"context_manager.build_context_messages[{context_files} files]"] = (
+        build_context_messages
+    )
+    benchmarks[f"import_graph.update[{context_files} files]"] = update_import_graph
+    for level in ("whitespace", "comments", "outline"):
+
+        def minify(level=level) -> Callable[[], Any]:
+            minifier = ContextMinifier(level)
+            context = fixtures.context()
+            return lambda: [
+                minifier.minify(item["path"], item["content"]) for item in context
+            ]
+
+        benchmarks[f"context_minifier.minify[{level}:{context_files} files]"] = minify
+
+    messages = chat_messages(200)
+
+    def save_chat_history() -> Callable[[], Any]:
+        chat_history_manager = ChatHistoryManager(
+            directory=os.path.join(tmp_dir, "histories")
+        )
+        return lambda: chat_history_manager.save_chat_history(messages, "benchmark.md")
+
+    benchmarks["chat_history_manager.save_chat_history[200 messages]"] = (
+        save_chat_history
+    )
+
+    log_message = synthetic_text(rng, 10)
+
+    def add_log() -> Callable[[], Any]:
+        log_manager = LogManager(log_file_path=os.path.join(tmp_dir, "logs", "app.log"))
+
+        def run() -> None:
+            log_manager.add_log(log_message)
+            # Keep the in-memory log bounded across iterations
+            log_manager.logs.clear()
+
+        return run
+
+    benchmarks["log_manager.add_log"] = add_log
+
+    catalog = get_model_catalog()
+    for name, module_name, class_name in PRICE_STRATEGIES:
+        models = catalog.get_model_names(name)
+
+        def estimate_price(
+            name=name, module_name=module_name, class_name=class_name, models=models
+        ) -> Optional[Callable[[], Any]]:
+            strategy = price_strategy(name, module_name, class_name)
+            if strategy is None:
+                return None
+
+            def run() -> None:
+                for model_name in models:
+                    strategy.estimate_price(model_name, 12_345, 678, 1_000, 10_000)
+
+            return run
+
+        benchmarks[f"{name}.estimate_price[{len(models)} models]"] = estimate_price
+
+    return benchmarks
+
+
+def compare(results: Dict[str, Any], baseline_path: str) -> None:
+    """
+    Prints the normalized timings of this run against a previous run.
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nComparison with {baseline_path} (normalized median, lower is better):")
+    for name, result in results["benchmarks"].items():
+        previous = baseline["benchmarks"].get(name)
+        if previous is None:
+            print(f"  {name}: new")
+            continue
+        ratio = result["normalized_median"] / previous["normalized_median"]
+        print(f"  {name}: {ratio:6.2f}x {'(slower)' if ratio > 1.1 else ''}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--quick", action="store_true", help="Smaller fixtures and fewer repetitions"
+    )
+    parser.add_argument("--output", help="Path of the JSON results file")
+    parser.add_argument("--compare", help="Path of a previous JSON results file")
+    parser.add_argument("--filter", default="", help="Run benchmarks containing this")
+    args = parser.parse_args()
+
+    repeat, min_time = (3, 0.05) if args.quick else (7, 0.2)
+
+    print("Calibrating...")
+    calibration = measure(calibration_workload, repeat, min_time)
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+        },
+        "quick": args.quick,
+        "calibration": calibration,
+        "benchmarks": {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, factory in build_benchmarks(tmp_dir, args.quick).items():
+            if args.filter not in name:
+                continue
+            func = factory()
+            if func is None:
+                continue
+            result = measure(func, repeat, min_time)
+            result["normalized_median"] = result["median"] / calibration["median"]
+            results["benchmarks"][name] = result
+            print(
+                f"  {name}: {result['median'] * 1000:.3f} ms "
+                f"({result['normalized_median']:.3f} units)"
+            )
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
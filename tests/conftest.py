@@ -0,0 +1,35 @@
+"""
+Test configuration: the app modules are imported as in the Streamlit app, relative to app/.
+
+The tokenizer is replaced with a word counter, as tiktoken downloads its encodings on first use and the
+tests run offline.
+"""
+
+import os
+import re
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "app"))
+
+from managers import file_manager  # noqa: E402
+
+
+class WordEncoding:
+    """
+    Deterministic stand-in of a tiktoken encoding, one token per word or punctuation mark.
+    """
+
+    def encode(self, text):
+        return re.findall(r"\w+|[^\w\s]", text)
+
+
+@pytest.fixture(autouse=True)
+def offline_tokenizer(monkeypatch):
+    monkeypatch.setattr(
+        file_manager,
+        "tiktoken",
+        types.SimpleNamespace(encoding_for_model=lambda model: WordEncoding()),
+    )
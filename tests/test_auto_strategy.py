@@ -0,0 +1,117 @@
+import pytest
+
+from chat_strategies.auto_strategy import AutoChatStrategy
+from chat_strategies.chat_model_strategy import ChatModelStrategy
+from chat_strategies.chat_response import Usage
+from chat_strategies.latency_tracker import LatencyTracker
+
+
+class FakeStrategy(ChatModelStrategy):
+    """
+    Answers with the name of the model, failing for the models in `failing`.
+    """
+
+    provider = "Simulated"
+
+    def __init__(self):
+        self.failing = set()
+        self.calls = []
+
+    def get_models(self):
+        return ["simulated-fast", "simulated-large"]
+
+    def get_output_max_tokens(self, model_name):
+        return 1000
+
+    async def async_send_message(
+        self, system_prompt, messages, model_name, max_tokens, temperature=0
+    ):
+        self.calls.append(model_name)
+        if model_name in self.failing:
+            raise RuntimeError(f"{model_name} is down")
+        return self._build_response(
+            model_name, Usage(input_tokens=10, output_tokens=5), model_name, 0.0
+        )
+
+
+@pytest.fixture
+def auto(monkeypatch):
+    monkeypatch.setattr(AutoChatStrategy, "routes", AutoChatStrategy.routes.copy())
+    AutoChatStrategy.routes.clear()
+    strategy = FakeStrategy()
+    tiers = {
+        "small": [("Fake", "simulated-fast"), ("Fake", "simulated-large")],
+        "large": [("Fake", "simulated-large")],
+    }
+    return strategy, AutoChatStrategy(
+        {"Fake": strategy}, tiers=tiers, latency_tracker=LatencyTracker()
+    )
+
+
+def conversation(*questions):
+    messages = [
+        {"role": "user", "content": "Context"},
+        {"role": "assistant", "content": "Ok, I got it!"},
+    ]
+    for question in questions[:-1]:
+        messages += [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": "Answer"},
+        ]
+    return messages + [{"role": "user", "content": questions[-1]}]
+
+
+def test_cheapest_model_is_chosen(auto):
+    strategy, router = auto
+
+    response = router.send_message("system", conversation("Hi"), "cheapest", 100)
+
+    assert response.text == "simulated-fast"
+    assert "simulated-fast" in response.metadata["route"]
+
+
+def test_route_sticks_to_the_model_that_answered(auto):
+    strategy, router = auto
+    strategy.failing.add("simulated-fast")
+    first = router.send_message("system", conversation("Hi"), "cheapest", 100)
+    strategy.failing.clear()
+
+    second = router.send_message("system", conversation("Hi", "And?"), "cheapest", 100)
+
+    assert first.text == second.text == "simulated-large"
+    assert "of the previous turn" in second.metadata["route"]
+    # Another conversation is routed on its own
+    other = [{"role": "user", "content": "Other context"}] + conversation("Hi")[1:]
+    route = router.send_message("system", other, "cheapest", 100).metadata["route"]
+    assert "of the previous turn" not in route
+
+
+def test_route_changes_with_the_tier(auto):
+    strategy, router = auto
+    router.send_message("system", conversation("Hi"), "cheapest", 100)
+
+    hard = router.send_message(
+        "system", conversation("Hi", "Refactor this"), "cheapest", 100
+    )
+    easy = router.send_message(
+        "system", conversation("Hi", "Refactor this", "Thanks"), "cheapest", 100
+    )
+
+    assert hard.text == "simulated-large"
+    assert easy.text == "simulated-fast"
+
+
+def test_failed_route_is_replaced(auto):
+    strategy, router = auto
+    router.send_message("system", conversation("Hi"), "cheapest", 100)
+    strategy.failing.add("simulated-fast")
+
+    failover = router.send_message(
+        "system", conversation("Hi", "And?"), "cheapest", 100
+    )
+    strategy.failing.clear()
+    sticky = router.send_message(
+        "system", conversation("Hi", "And?", "More"), "cheapest", 100
+    )
+
+    assert failover.text == sticky.text == "simulated-large"
@@ -0,0 +1,82 @@
+import ast
+
+from managers.code_outline import outline_python
+
+
+def outline(source):
+    result = outline_python(source)
+    # The outline stays valid Python
+    ast.parse(result)
+    return result
+
+
+def test_functions_are_reduced_to_their_signature():
+    result = outline(
+        'def greet(name: str) -> str:\n    """Greets.\n\n    More."""\n    return name\n'
+    )
+
+    assert result == 'def greet(name: str) -> str:\n    """Greets."""'
+
+
+def test_import_fallbacks_are_kept():
+    result = outline(
+        "try:\n"
+        "    import ujson as json\n"
+        "except ImportError:  # optional\n"
+        "    import json\n"
+    )
+
+    assert result == (
+        "try:\n    import ujson as json\nexcept ImportError:\n    import json"
+    )
+
+
+def test_type_checking_imports_are_kept():
+    result = outline(
+        "from typing import TYPE_CHECKING\n"
+        "if TYPE_CHECKING:\n"
+        "    from managers.file_manager import FileManager\n"
+    )
+
+    assert (
+        "if TYPE_CHECKING:\n    from managers.file_manager import FileManager" in result
+    )
+
+
+def test_version_dependent_definitions_are_kept():
+    result = outline(
+        "import sys\n"
+        "if sys.version_info >= (3, 11):\n"
+        "    def parse(data):\n"
+        '        """Parses with tomllib."""\n'
+        "        return tomllib.loads(data)\n"
+        "elif sys.version_info >= (3, 9):\n"
+        "    class Parser:\n"
+        "        pass\n"
+        "else:\n"
+        "    print('unsupported')\n"
+    )
+
+    assert result == (
+        "import sys\n"
+        "if sys.version_info >= (3, 11):\n"
+        "    def parse(data):\n"
+        '        """Parses with tomllib."""\n'
+        "elif sys.version_info >= (3, 9):\n"
+        "    class Parser:\n"
+        "        ...\n"
+        "else:\n"
+        "    ..."
+    )
+
+
+def test_with_blocks_keep_their_constants():
+    result = outline("with open('VERSION') as f:\n    VERSION = f.read()\n")
+
+    assert result == "with open('VERSION') as f:\n    VERSION = f.read()"
+
+
+def test_blocks_without_definitions_are_dropped():
+    result = outline("X = 1\nif __name__ == '__main__':\n    main()\n")
+
+    assert result == "X = 1"
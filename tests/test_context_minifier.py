@@ -0,0 +1,116 @@
+import ast
+
+import pytest
+
+from managers.context_minifier import (
+    ContextMinifier,
+    normalize_whitespace,
+    strip_c_style_comments,
+    strip_license_header,
+    strip_python_comments,
+)
+
+PYTHON_SOURCE = '''#!/usr/bin/env python
+# Copyright (c) 2024 Example Corp.
+# Licensed under the MIT License.
+"""Module docstring."""
+
+import os  # the os module
+
+URL = "http://example.com/#anchor"
+
+
+class Greeter:
+    """Greets."""
+
+    def greet(self, name):
+        """
+        Returns a greeting.
+        """
+        # Build the greeting
+        return f"Hello, {name}"
+
+    def noop(self):
+        """Does nothing."""
+'''
+
+
+def test_none_level_keeps_the_content():
+    assert ContextMinifier("none").minify("a.py", PYTHON_SOURCE) == PYTHON_SOURCE
+
+
+def test_unknown_level_is_rejected():
+    with pytest.raises(ValueError):
+        ContextMinifier("everything")
+
+
+def test_whitespace_level_strips_blank_runs_and_license():
+    minified = ContextMinifier("whitespace").minify(
+        "a.txt",
+        "// Copyright 2024 Example\n// SPDX-License-Identifier: MIT\nfirst   \n\n\n\nsecond\n\n",
+    )
+
+    assert minified == "first\n\nsecond"
+
+
+def test_license_header_keeps_the_shebang():
+    stripped = strip_license_header(PYTHON_SOURCE)
+
+    assert stripped.startswith('#!/usr/bin/env python\n"""Module docstring."""')
+    assert "Copyright" not in stripped
+
+
+def test_other_headers_are_kept():
+    content = "/* Utilities for parsing. */\nint x;"
+
+    assert strip_license_header(content) == content
+    assert strip_license_header("/* Copyright 2024 */\nint x;") == "int x;"
+
+
+def test_python_comments_and_docstrings_are_stripped():
+    stripped = strip_python_comments(PYTHON_SOURCE)
+
+    assert "#" not in stripped.replace("#!/usr/bin/env", "").replace("/#anchor", "")
+    assert '"""' not in stripped
+    assert 'URL = "http://example.com/#anchor"' in stripped
+    assert "import os\n" in stripped
+    # A body left empty keeps a statement, the code stays valid
+    tree = ast.parse(stripped)
+    noop = tree.body[-1].body[-1]
+    assert noop.name == "noop" and isinstance(noop.body[0].value, ast.Constant)
+
+
+def test_invalid_python_is_kept():
+    content = "def broken(:\n    # comment\n"
+
+    assert strip_python_comments(content) == content
+
+
+def test_c_style_strings_with_slashes_are_kept():
+    content = (
+        'const url = "http://example.com"; // the endpoint\n'
+        "const path = '//cdn/*.js'; /* a\n"
+        "multi-line comment */ let x = `a // b`;\n"
+    )
+
+    stripped = normalize_whitespace(strip_c_style_comments(content))
+
+    assert stripped == (
+        'const url = "http://example.com";\n'
+        "const path = '//cdn/*.js';\n"
+        " let x = `a // b`;"
+    )
+
+
+def test_comments_level_selects_the_syntax_by_extension():
+    minifier = ContextMinifier("comments")
+
+    assert minifier.minify("style.css", "a { b: url(//x); } /* c */") == (
+        "a { b: url(//x); }"
+    )
+    assert minifier.minify("run.sh", "#!/bin/sh\n# comment\necho 1") == (
+        "#!/bin/sh\necho 1"
+    )
+    assert minifier.minify("query.sql", "-- comment\nSELECT 1;") == "SELECT 1;"
+    assert minifier.minify("page.html", "<p><!-- c -->x</p>") == "<p>x</p>"
+    assert minifier.minify("Dockerfile", "# base\nFROM python") == "FROM python"
@@ -0,0 +1,63 @@
+from chat_strategies.simulated_strategy import SimulatedChatStrategy
+from managers import cost_estimator
+from managers.cost_estimator import CostEstimator, count_tokens
+from managers.memory_manager import restore_content, spill_content
+
+CONTEXT_MESSAGES = [
+    {"role": "user", "content": "Context:\n\nLOCAL FILEPATH: a.py\nCONTENTS:\nx = 1"},
+    {"role": "assistant", "content": "Ok, I got it!"},
+]
+
+
+def estimate(context, messages, context_messages=None):
+    return CostEstimator().estimate(
+        strategy=SimulatedChatStrategy(),
+        model_name="simulated-fast",
+        system_prompt="system",
+        context=context,
+        messages=messages,
+        user_message="question",
+        max_tokens=10,
+        context_messages=context_messages,
+    )
+
+
+def test_first_request_counts_the_context_files():
+    context = [{"path": "a.py", "content": "x = 1", "tokens": 4}]
+    expected = (
+        count_tokens("system")
+        + CostEstimator().context_tokens(context)
+        + count_tokens("question")
+    )
+
+    assert estimate(context, []).prompt_tokens == expected
+
+
+def test_started_conversation_counts_the_frozen_context_and_the_diffs():
+    # The file grew after the start, its change is in the history as a diff
+    context = [{"path": "a.py", "content": "x = 1\n" * 1000, "tokens": 4000}]
+    history = [
+        {"role": "user", "content": "first"},
+        {"role": "assistant", "content": "answer"},
+        {"role": "user", "content": "Context update: a.py\n+x = 1"},
+        {"role": "assistant", "content": "Ok"},
+    ]
+    expected = (
+        count_tokens("system")
+        + sum(count_tokens(message["content"]) for message in CONTEXT_MESSAGES)
+        + sum(count_tokens(message["content"]) for message in history)
+        + count_tokens("question")
+    )
+
+    assert estimate(context, history, CONTEXT_MESSAGES).prompt_tokens == expected
+
+
+def test_spilled_context_messages_keep_their_count(tmp_path):
+    messages = [dict(message) for message in CONTEXT_MESSAGES]
+    tokens = CostEstimator().context_message_tokens(messages)
+    content = messages[0]["content"]
+    spill_content(messages[0], str(tmp_path))
+
+    assert content not in cost_estimator._token_cache
+    assert CostEstimator().context_message_tokens(messages) == tokens
+    assert "spilled_tokens" not in restore_content(messages[0])
@@ -0,0 +1,169 @@
+import asyncio
+import time
+
+import pytest
+
+from chat_strategies.chat_model_strategy import ChatModelStrategy
+from chat_strategies.chat_response import AsyncChatStream, Usage
+from chat_strategies.failover_strategy import FailoverChatStrategy
+from chat_strategies.latency_tracker import FIRST_CHUNK, LatencyTracker
+
+
+class FakeStrategy(ChatModelStrategy):
+    """
+    Answers after `delay` seconds, or fails, at a fixed price per prompt token.
+    """
+
+    def __init__(self, name, delay=0.0, error=None, price=0.001):
+        self.provider = name
+        self.delay = delay
+        self.error = error
+        self.price = price
+        self.calls = 0
+        self.cancelled = 0
+
+    def get_models(self):
+        return ["model"]
+
+    def get_output_max_tokens(self, model_name):
+        return 100
+
+    def estimate_price(
+        self,
+        model_name,
+        input_tokens,
+        output_tokens,
+        cache_create_tokens=0,
+        cache_read_tokens=0,
+    ):
+        return self.price * (input_tokens + output_tokens)
+
+    async def async_send_message(
+        self, system_prompt, messages, model_name, max_tokens, temperature=0
+    ):
+        self.calls += 1
+        started = time.monotonic()
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise self.error
+        return self._build_response(
+            f"answer of {self.provider}", Usage(input_tokens=10), model_name, started
+        )
+
+    def async_stream_message(
+        self, system_prompt, messages, model_name, max_tokens, temperature=0
+    ):
+        async def generate():
+            response = await self.async_send_message(
+                system_prompt, messages, model_name, max_tokens, temperature
+            )
+            for word in response.text.split():
+                yield word
+            yield response
+
+        return AsyncChatStream(generate())
+
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def make_failover(*members, hedge_delay=0.05):
+    strategies = {member.provider: member for member in members}
+    chain = [(member.provider, "model") for member in members]
+    return FailoverChatStrategy(
+        strategies,
+        chains={"chain": chain},
+        default_hedge_delay=hedge_delay,
+        latency_tracker=LatencyTracker(),
+    )
+
+
+def send(strategy):
+    return asyncio.run(strategy.async_send_message("", MESSAGES, "chain", 50))
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream], stream.response
+
+
+def test_primary_answers_without_hedging():
+    primary, backup = FakeStrategy("A"), FakeStrategy("B")
+    response = send(make_failover(primary, backup))
+    assert response.provider == "A"
+    assert response.metadata["chain"] == "chain"
+    assert "hedge_cost" not in response.metadata
+    assert backup.calls == 0
+
+
+def test_fails_over_on_error():
+    primary, backup = FakeStrategy("A", error=RuntimeError("down")), FakeStrategy("B")
+    response = send(make_failover(primary, backup))
+    assert response.provider == "B"
+
+
+def test_raises_the_last_error_when_every_model_fails():
+    failover = make_failover(
+        FakeStrategy("A", error=RuntimeError("a")),
+        FakeStrategy("B", error=RuntimeError("b")),
+    )
+    with pytest.raises(RuntimeError, match="b"):
+        send(failover)
+
+
+def test_slow_primary_is_hedged_and_its_prompt_billed():
+    primary, backup = FakeStrategy("A", delay=5, price=0.01), FakeStrategy("B")
+    response = send(make_failover(primary, backup))
+    assert response.provider == "B"
+    assert primary.cancelled == 1
+    assert response.metadata["cancelled_hedges"] == ["A - model"]
+    # The backup cost plus the prompt of the cancelled primary
+    assert response.metadata["hedge_cost"] > 0
+    assert response.cost == pytest.approx(0.01 + response.metadata["hedge_cost"])
+
+
+def test_stream_fails_over_before_the_first_chunk():
+    primary, backup = FakeStrategy("A", error=RuntimeError("down")), FakeStrategy("B")
+    stream = make_failover(primary, backup).async_stream_message(
+        "", MESSAGES, "chain", 50
+    )
+    chunks, response = asyncio.run(collect(stream))
+    assert chunks == ["answer", "of", "B"]
+    assert response.provider == "B"
+    assert response.metadata["chain"] == "chain"
+
+
+def test_stream_hedges_a_slow_first_chunk():
+    primary, backup = FakeStrategy("A", delay=5), FakeStrategy("B")
+    stream = make_failover(primary, backup).async_stream_message(
+        "", MESSAGES, "chain", 50
+    )
+    chunks, response = asyncio.run(collect(stream))
+    assert chunks[-1] == "B"
+    assert primary.cancelled == 1
+    assert response.metadata["cancelled_hedges"] == ["A - model"]
+
+
+def test_stream_is_hedged_on_the_time_to_first_chunk():
+    primary, backup = FakeStrategy("A", delay=0.5), FakeStrategy("B")
+    failover = make_failover(primary, backup, hedge_delay=30)
+    # Complete responses of A take seconds, its first chunks arrive in 0.1 s
+    for _ in range(5):
+        failover.latency_tracker.record("A", "model", 10.0)
+        failover.latency_tracker.record("A", "model", 0.1, metric=FIRST_CHUNK)
+
+    stream = failover.async_stream_message("", MESSAGES, "chain", 50)
+    chunks, response = asyncio.run(collect(stream))
+
+    assert response.provider == "B"
+    assert (
+        failover.latency_tracker.percentile(
+            "B", "model", 50, min_samples=1, metric=FIRST_CHUNK
+        )
+        is not None
+    )
+    # The stream is not counted as a complete response
+    assert failover.latency_tracker.percentile("B", "model", 50, min_samples=1) is None
@@ -0,0 +1,158 @@
+import asyncio
+import types
+
+import google.generativeai as genai
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from chat_strategies import gemini_cache
+from chat_strategies.gemini_cache import GeminiContextCache, LocalCacheBackend
+from chat_strategies.gemini_strategy import GeminiChatStrategy
+
+CONTENTS = [
+    {"role": "user", "parts": ["Context"]},
+    {"role": "model", "parts": ["Ok, I got it!"]},
+]
+
+
+class SlowBackend(LocalCacheBackend):
+    """
+    Creates the cached contents after a delay, failing the first `failures` creations.
+    """
+
+    def __init__(self, delay=0.05, failures=0):
+        super().__init__()
+        self.delay = delay
+        self.failures = failures
+        self.created = 0
+
+    async def create(self, model_name, system_prompt, contents, ttl):
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("creation failed")
+        self.created += 1
+        return await super().create(model_name, system_prompt, contents, ttl)
+
+
+async def direct(func):
+    return await func()
+
+
+def acquire(cache, system_prompt="system"):
+    return cache.acquire("model", system_prompt, CONTENTS, direct)
+
+
+def test_prefix_is_created_once_then_reused():
+    backend = SlowBackend(delay=0)
+    cache = GeminiContextCache(backend)
+
+    async def run():
+        return await acquire(cache), await acquire(cache)
+
+    (first, created, storage), (second, reused, extension) = asyncio.run(run())
+
+    assert created and storage == cache.ttl
+    assert second is first and not reused and extension == 0.0
+    assert backend.created == 1
+
+
+def test_concurrent_requests_share_the_creation_in_flight():
+    backend = SlowBackend()
+    cache = GeminiContextCache(backend)
+
+    async def run():
+        return await asyncio.gather(*(acquire(cache) for _ in range(5)))
+
+    results = asyncio.run(run())
+
+    assert backend.created == 1
+    assert len({id(entry) for entry, _, _ in results}) == 1
+    assert [created for _, created, _ in results].count(True) == 1
+    assert cache.pending == {}
+
+
+def test_failed_creation_is_taken_over_by_a_waiter():
+    backend = SlowBackend(failures=1)
+    cache = GeminiContextCache(backend)
+
+    async def run():
+        return await asyncio.gather(
+            acquire(cache), acquire(cache), return_exceptions=True
+        )
+
+    failed, (entry, created, _) = asyncio.run(run())
+
+    assert isinstance(failed, RuntimeError)
+    assert created and backend.created == 1
+    assert cache.pending == {}
+
+
+def test_strategies_share_the_process_wide_cache(monkeypatch):
+    monkeypatch.setattr(gemini_cache, "_context_cache", None)
+
+    first = GeminiChatStrategy(api_key="key")
+    second = GeminiChatStrategy(api_key="key")
+
+    assert first.context_cache is second.context_cache
+    assert first.context_cache is gemini_cache.get_gemini_context_cache()
+
+
+class MissingCacheModel:
+    """
+    A model whose chats fail as if their cached content had been deleted.
+    """
+
+    sent = 0
+
+    def __init__(self, model_name, system_instruction=None):
+        pass
+
+    def start_chat(self, history):
+        return self
+
+    async def send_message_async(self, parts, generation_config=None, stream=False):
+        MissingCacheModel.sent += 1
+        raise google_exceptions.NotFound("cached content not found")
+
+
+def test_missing_cached_content_is_retried_once(monkeypatch):
+    monkeypatch.setattr(genai, "GenerativeModel", MissingCacheModel)
+    MissingCacheModel.sent = 0
+    backend = SlowBackend(delay=0)
+    strategy = GeminiChatStrategy("key", context_cache=GeminiContextCache(backend))
+    strategy.prompt_cache_min_tokens = 1
+    model_name = strategy.get_models()[0]
+    messages = [
+        {"role": "user", "content": "Context"},
+        {"role": "assistant", "content": "Ok, I got it!"},
+        {"role": "user", "content": "Question"},
+    ]
+
+    with pytest.raises(google_exceptions.NotFound):
+        strategy.send_message("system", messages, model_name, 10)
+
+    assert MissingCacheModel.sent == 2
+    assert backend.created == 2
+
+    # Without a cached content the error is not retried
+    MissingCacheModel.sent = 0
+    with pytest.raises(google_exceptions.NotFound):
+        strategy.send_message("system", messages[-1:], model_name, 10)
+    assert MissingCacheModel.sent == 1
+
+
+def test_usage_of_a_created_content():
+    strategy = GeminiChatStrategy(
+        "key", context_cache=GeminiContextCache(LocalCacheBackend())
+    )
+    entry = gemini_cache.CachedContext("cachedContents/local-1", "model", 40, 0.0)
+    metadata = types.SimpleNamespace(prompt_token_count=50, candidates_token_count=5)
+
+    usage = strategy._usage(metadata, {"entry": entry, "created": True})
+
+    assert (usage.input_tokens, usage.cache_read_tokens, usage.cache_create_tokens) == (
+        10,
+        40,
+        40,
+    )
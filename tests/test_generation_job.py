@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from chat_strategies.chat_model_strategy import ChatModelStrategy
+from chat_strategies.chat_response import AsyncChatStream
+from chat_strategies.failover_strategy import FailoverChatStrategy
+from chat_strategies.generation_job import GenerationJob
+from chat_strategies.latency_tracker import LatencyTracker
+
+MESSAGES = [
+    {"role": "user", "content": "Context: " + "word " * 50},
+    {"role": "assistant", "content": "Ok, I got it!"},
+    {"role": "user", "content": "question"},
+]
+
+
+class EndlessStrategy(ChatModelStrategy):
+    """
+    Streams words until cancelled, with the prompt cache of the simulated provider.
+    """
+
+    provider = "Simulated"
+    supports_prompt_cache = True
+    prompt_cache_min_tokens = 10
+
+    def get_models(self):
+        return ["simulated-fast"]
+
+    def get_output_max_tokens(self, model_name):
+        return 1000
+
+    async def async_send_message(
+        self, system_prompt, messages, model_name, max_tokens, temperature=0
+    ):
+        raise NotImplementedError
+
+    def async_stream_message(
+        self, system_prompt, messages, model_name, max_tokens, temperature=0
+    ):
+        async def generate():
+            while True:
+                yield "word "
+                await asyncio.sleep(0.01)
+
+        return AsyncChatStream(generate())
+
+
+def stop_after_chunks(strategy, model_name, cached_prefix):
+    job = GenerationJob(
+        strategy=strategy,
+        strategy_name="test",
+        system_prompt="system",
+        messages=MESSAGES,
+        model_name=model_name,
+        max_tokens=100,
+        cached_prefix=cached_prefix,
+    )
+    job.start()
+    while len(job.chunks) < 3:
+        job.wait(0.01)
+    job.stop()
+    return job.response
+
+
+@pytest.mark.parametrize("cached_prefix", [False, True])
+def test_stopped_prompt_prefix_is_billed_as_cached(cached_prefix):
+    strategy = EndlessStrategy()
+    response = stop_after_chunks(strategy, "simulated-fast", cached_prefix)
+
+    usage = response.usage
+    assert response.metadata["stopped"]
+    assert usage.input_tokens == 1
+    if cached_prefix:
+        assert usage.cache_read_tokens > 50 and usage.cache_create_tokens == 0
+    else:
+        assert usage.cache_create_tokens > 50 and usage.cache_read_tokens == 0
+    assert response.cost == pytest.approx(
+        strategy.estimate_price(
+            "simulated-fast",
+            usage.input_tokens,
+            usage.output_tokens,
+            usage.cache_create_tokens,
+            usage.cache_read_tokens,
+        )
+    )
+
+
+def test_stopped_composite_is_billed_for_the_member_that_streamed():
+    failover = FailoverChatStrategy(
+        {"A": EndlessStrategy(), "B": EndlessStrategy()},
+        chains={"chain": [("A", "simulated-fast"), ("B", "simulated-fast")]},
+        latency_tracker=LatencyTracker(),
+    )
+
+    response = stop_after_chunks(failover, "chain", cached_prefix=True)
+
+    assert (response.provider, response.model) == ("Simulated", "simulated-fast")
+    assert response.usage.cache_read_tokens > 50
+    assert response.cost > 0
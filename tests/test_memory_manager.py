@@ -0,0 +1,155 @@
+import os
+
+import pytest
+
+from managers import memory_manager
+from managers.conversation_tree import MAIN_BRANCH, ConversationTree
+from managers.log_manager import LogManager
+from managers.memory_manager import (
+    SESSION_TTL,
+    MemoryManager,
+    SpillLostError,
+    estimate_size,
+    restore_content,
+    restore_conversation,
+    spill_content,
+)
+
+MB = 1024 * 1024
+
+
+def make_files(count, size):
+    return [
+        {"path": f"file_{i}.py", "content": str(i) * size, "tokens": 1}
+        for i in range(count)
+    ]
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    # The reported usage is process-wide, each test starts without sessions
+    monkeypatch.setattr(memory_manager, "_sessions", {})
+    monkeypatch.setattr(memory_manager, "_idle_sessions", set())
+
+
+def make_manager(tmp_path, cap_mb):
+    return MemoryManager(session_cap_mb=cap_mb, spill_dir=str(tmp_path))
+
+
+def test_no_action_under_the_cap(tmp_path):
+    files = make_files(2, 1000)
+    state = {"full_context": files, "context": files}
+    assert make_manager(tmp_path, 1).enforce("s", state) == []
+    assert files[0]["content"]
+
+
+def test_disabled_files_are_spilled_first(tmp_path):
+    files = make_files(4, MB // 2)
+    state = {"full_context": files, "context": files[:1]}
+    actions = make_manager(tmp_path, 1).enforce("s", state)
+    assert actions[0].startswith("Spilled")
+    assert files[0]["content"]
+    assert all(item["content"] == "" for item in files[2:] if "spilled" in item)
+    assert restore_content(files[3])["content"] == "3" * (MB // 2)
+
+
+def test_enabled_files_are_spilled_when_all_enabled(tmp_path):
+    files = make_files(4, MB // 2)
+    state = {"full_context": files, "context": files}
+    actions = make_manager(tmp_path, 1).enforce("s", state)
+    assert any("enabled context files" in action for action in actions)
+    assert not any(action.startswith("Still over") for action in actions)
+    # The reported total is updated from the freed bytes
+    manager = make_manager(tmp_path, 1)
+    assert manager.sessions()["s"]["total"] <= manager.session_cap
+    for item in files:
+        restore_content(item)
+    assert [item["content"][0] for item in files] == ["0", "1", "2", "3"]
+
+
+def test_shared_objects_count_in_each_key_and_once_in_the_total(tmp_path):
+    files = make_files(2, 1000)
+    state = {"full_context": files, "context": files[:1]}
+    keys = make_manager(tmp_path, 0).account("s", state)
+    assert keys["context"] == estimate_size(files[:1])
+    assert keys["full_context"] == estimate_size(files)
+    seen = set()
+    total = sum(estimate_size(value, seen) for value in state.values())
+    assert make_manager(tmp_path, 0).sessions()["s"]["total"] == total
+
+
+def test_oldest_logs_are_dropped(tmp_path):
+    log_manager = LogManager(log_file_path=str(tmp_path / "logs" / "app.log"))
+    log_manager.logs.append("recent")
+    # The log tab keeps the log of every run, the current one last
+    old_runs = [["x" * (MB // 2)] for _ in range(4)]
+    state = {"logs": old_runs + [log_manager.logs]}
+    actions = make_manager(tmp_path, 1).enforce("s", state, log_manager)
+    assert any("oldest log entries" in action for action in actions)
+    assert not any(action.startswith("Still over") for action in actions)
+    assert state["logs"][-1] is log_manager.logs
+    assert log_manager.logs == ["recent"]
+
+
+def test_inactive_branches_are_spilled_and_restored(tmp_path):
+    context_messages = [{"role": "user", "content": "context"}]
+    snapshot = {"a.py": "a"}
+    tree = ConversationTree()
+    main_messages = [
+        {"role": "user", "content": "q" * MB},
+        {"role": "assistant", "content": "a" * MB},
+    ]
+    tree.sync(main_messages, context_messages, snapshot)
+    branch = tree.fork(0)
+    state = {
+        "conversation_tree": tree,
+        "messages": branch["messages"],
+        "context_messages": context_messages,
+        "context_snapshot": snapshot,
+    }
+    actions = make_manager(tmp_path, 1).enforce("s", state)
+    assert any("inactive branches" in action for action in actions)
+    assert main_messages[0]["content"] == ""
+    # The context of the active branch is not touched
+    assert context_messages[0]["content"] == "context"
+
+    main = tree.switch(MAIN_BRANCH)
+    restore_conversation(
+        main["messages"], main["context_messages"], main["context_snapshot"]
+    )
+    assert main["messages"][0]["content"] == "q" * MB
+
+
+def test_idle_sessions_keep_their_spilled_files(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, 0)
+    item = {"role": "user", "content": "question"}
+    spill_content(item, str(tmp_path / "idle"))
+    manager.account("idle", {})
+    memory_manager._sessions["idle"]["updated"] -= SESSION_TTL + 1
+
+    # The idle session is left out of the total, its tab may still be open
+    manager.account("active", {})
+    assert "idle" not in manager.sessions()
+    assert os.path.exists(item["spilled"])
+
+    monkeypatch.setattr(
+        memory_manager, "_session_closed", lambda session_id: session_id == "idle"
+    )
+    manager.account("active", {})
+    assert not os.path.exists(tmp_path / "idle")
+
+
+def test_lost_spilled_content_fails_cleanly(tmp_path):
+    messages = [
+        {"role": "user", "content": "question"},
+        {"role": "assistant", "content": "answer"},
+    ]
+    for message in messages:
+        spill_content(message, str(tmp_path))
+    os.remove(messages[0]["spilled"])
+
+    with pytest.raises(SpillLostError, match="lost"):
+        restore_conversation(messages, None, None)
+    # The lost message stays spilled, the others are loaded back
+    assert "spilled" in messages[0]
+    assert messages[1]["content"] == "answer"
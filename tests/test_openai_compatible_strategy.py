@@ -0,0 +1,74 @@
+import json
+import os
+
+import pytest
+
+from chat_strategies import openai_compatible_strategy, rate_limiter
+from chat_strategies.model_catalog import get_model_catalog
+from chat_strategies.openai_compatible_strategy import (
+    get_openai_compatible_strategies,
+)
+
+
+def write_config(path, model_name, requests_per_minute=600):
+    path.write_text(
+        json.dumps(
+            {
+                "providers": {
+                    "TestLocal": {
+                        "base_url": "http://localhost:8000/v1",
+                        "limits": {
+                            "requests_per_minute": requests_per_minute,
+                            "tokens_per_minute": 100000,
+                        },
+                        "models": [
+                            {
+                                "name": model_name,
+                                "context_window": 4096,
+                                "output_max_tokens": 1024,
+                                "price_input": 0.0,
+                                "price_output": 0.0,
+                            }
+                        ],
+                    }
+                }
+            }
+        )
+    )
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    monkeypatch.setattr(openai_compatible_strategy, "_loaded", {})
+    monkeypatch.setattr(rate_limiter, "_limits", dict(rate_limiter._limits))
+    monkeypatch.setattr(rate_limiter, "_limiters", {})
+    path = tmp_path / "openai_compatible.json"
+    write_config(path, "first-model")
+    return path
+
+
+def test_config_is_loaded_once(config):
+    strategies = get_openai_compatible_strategies(str(config))
+    limiter = rate_limiter.get_rate_limiter("TestLocal", "first-model")
+
+    assert get_openai_compatible_strategies(str(config)) is strategies
+    assert rate_limiter.get_rate_limiter("TestLocal", "first-model") is limiter
+    assert strategies["TestLocal"].get_models() == ["first-model"]
+
+
+def test_modified_config_is_reloaded(config):
+    strategies = get_openai_compatible_strategies(str(config))
+    write_config(config, "second-model", requests_per_minute=60)
+    mtime = os.path.getmtime(config) + 10
+    os.utime(config, (mtime, mtime))
+
+    reloaded = get_openai_compatible_strategies(str(config))
+
+    assert reloaded is not strategies
+    assert reloaded["TestLocal"].get_models() == ["second-model"]
+    assert (
+        get_model_catalog().get_model("TestLocal", "second-model").context_window
+        == 4096
+    )
+    with pytest.raises(KeyError):
+        get_model_catalog().get_model("TestLocal", "first-model")
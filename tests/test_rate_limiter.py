@@ -0,0 +1,196 @@
+import asyncio
+
+import pytest
+
+from chat_strategies import rate_limiter
+from chat_strategies.rate_limiter import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RateLimiter,
+    RetriesExhaustedError,
+    TokenBucket,
+)
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def make_limiter(breaker=None, **kwargs):
+    kwargs.setdefault("base_delay", 0)
+    return RateLimiter(
+        "test", 600, 60_000, breaker or CircuitBreaker("test"), headroom=1.0, **kwargs
+    )
+
+
+def test_token_bucket_goes_into_debt():
+    bucket = TokenBucket(rate_per_minute=60, capacity=10)
+    assert bucket.reserve(10) == 0
+    assert bucket.reserve(3) == pytest.approx(3, abs=0.05)
+    bucket.adjust(100)
+    assert bucket.tokens == 10
+
+
+def test_idle_limiter_sends_a_full_minute_of_tokens_at_once():
+    limiter = make_limiter()
+    assert limiter.acquire(60_000) == 0
+    assert limiter.acquire(6_000) == pytest.approx(6, abs=0.05)
+
+
+def test_circuit_opens_after_threshold_and_recovers():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_circuit_fails_fast():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=60)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_failed_trial_reopens_circuit():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.trial_in_flight
+
+
+def test_cancelled_trial_releases_the_slot():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    limiter = make_limiter(breaker)
+
+    async def run():
+        task = asyncio.create_task(limiter.async_call(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        assert breaker.trial_in_flight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.trial_in_flight
+    breaker.before_call()
+
+
+def test_call_retries_transient_errors():
+    limiter = make_limiter()
+    attempts = []
+
+    def func():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise StatusError(503)
+        return "ok"
+
+    assert limiter.call(func) == "ok"
+    assert len(attempts) == 3
+    assert limiter.circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_call_does_not_retry_client_errors():
+    limiter = make_limiter()
+
+    def func():
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        limiter.call(func)
+
+
+def test_retries_exhausted():
+    breaker = CircuitBreaker("test", failure_threshold=100)
+    limiter = make_limiter(breaker, max_retries=2)
+
+    async def func():
+        raise StatusError(500)
+
+    with pytest.raises(RetriesExhaustedError):
+        asyncio.run(limiter.async_call(func))
+    assert breaker.failures == 3
+
+
+def test_failed_attempts_refund_their_reservation():
+    limiter = make_limiter(max_retries=2)
+    attempts = []
+
+    def func():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise StatusError(429)
+        return "ok"
+
+    assert limiter.call(func, estimated_tokens=20_000) == "ok"
+    # Only the attempt that got a response keeps its reservation
+    assert limiter.tokens.tokens == pytest.approx(40_000, abs=50)
+
+
+def test_cancelled_call_refunds_its_reservation():
+    limiter = make_limiter()
+    limiter.acquire(60_000)
+
+    async def run():
+        # Waits in debt for the tokens, then is cancelled like a lost hedge
+        task = asyncio.create_task(
+            limiter.async_call(lambda: asyncio.sleep(0), estimated_tokens=6_000)
+        )
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert limiter.tokens.tokens == pytest.approx(0, abs=50)
+
+
+def test_retry_after_blocks_the_other_callers():
+    limiter = make_limiter()
+    error = StatusError(429)
+    error.response = type("Response", (), {"headers": {"retry-after": "5"}})()
+    assert limiter._backoff(0, error) == 5
+    assert limiter.acquire(0) == pytest.approx(5, abs=0.05)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # The limits and limiters are process-wide, the tests change copies
+    monkeypatch.setattr(
+        rate_limiter,
+        "_limits",
+        {provider: dict(limits) for provider, limits in rate_limiter._limits.items()},
+    )
+    monkeypatch.setattr(rate_limiter, "_limiters", {})
+
+
+def test_configuring_the_same_limits_keeps_the_limiters(registry):
+    rate_limiter.configure_rate_limits("TestProvider", tokens_per_minute=1000)
+    limiter = rate_limiter.get_rate_limiter("TestProvider", "model")
+    rate_limiter.configure_rate_limits("TestProvider", tokens_per_minute=1000)
+    assert rate_limiter.get_rate_limiter("TestProvider", "model") is limiter
+    rate_limiter.configure_rate_limits("TestProvider", tokens_per_minute=2000)
+    assert rate_limiter.get_rate_limiter("TestProvider", "model") is not limiter
+
+
+def test_limits_from_env(registry):
+    rate_limiter.configure_rate_limits_from_env({"GEMINI_TOKENS_PER_MINUTE": "1234"})
+    assert rate_limiter._limits["Gemini"]["tokens_per_minute"] == 1234
+    assert (
+        rate_limiter._limits["Gemini"]["requests_per_minute"]
+        == rate_limiter.DEFAULT_LIMITS["Gemini"]["requests_per_minute"]
+    )
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from chat_strategies import token_calibrator
+from chat_strategies.token_calibrator import MIN_SAMPLES, TokenCalibrator
+
+
+def test_uncalibrated_model_keeps_the_local_count():
+    calibrator = TokenCalibrator()
+    for _ in range(MIN_SAMPLES - 1):
+        calibrator.record("OpenAI", "gpt", 100, 150)
+
+    assert calibrator.correct("OpenAI", "gpt", 100) == 100
+    assert calibrator.correct("OpenAI", "other", 100) == 100
+
+
+def test_corrections_start_at_min_samples():
+    calibrator = TokenCalibrator()
+    for _ in range(MIN_SAMPLES):
+        calibrator.record("OpenAI", "gpt", 100, 150)
+
+    assert calibrator.correct("OpenAI", "gpt", 100) == 150
+
+
+def test_fits_slope_and_overhead():
+    calibrator = TokenCalibrator()
+    for local in (100, 400, 1000, 2500, 50, 1800):
+        calibrator.record("OpenAI", "gpt", local, round(1.1 * local + 20))
+
+    fit = calibrator.summary()["OpenAI/gpt"]
+    assert fit["slope"] == pytest.approx(1.1, abs=0.01)
+    assert fit["overhead"] == pytest.approx(20, abs=2)
+    assert calibrator.correct("OpenAI", "gpt", 3000) == pytest.approx(3320, abs=5)
+
+
+def test_narrow_samples_fall_back_to_the_ratio():
+    calibrator = TokenCalibrator()
+    for _ in range(5):
+        calibrator.record("Anthropic", "claude", 1000, 1200)
+
+    fit = calibrator.summary()["Anthropic/claude"]
+    assert fit["slope"] == pytest.approx(1.2)
+    assert fit["overhead"] == 0.0
+    assert calibrator.correct("Anthropic", "claude", 500) == 600
+
+
+def test_invalid_samples_are_ignored():
+    calibrator = TokenCalibrator()
+    calibrator.record("", "gpt", 100, 150)
+    calibrator.record("OpenAI", "gpt", 0, 150)
+    calibrator.record("OpenAI", "gpt", 100, 0)
+
+    assert calibrator.summary() == {}
+
+
+def test_saves_are_throttled_and_flushed(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(token_calibrator.time, "monotonic", lambda: now[0])
+    path = tmp_path / "data" / "calibration.json"
+    calibrator = TokenCalibrator(str(path))
+
+    calibrator.record("OpenAI", "gpt", 100, 150)
+    assert not path.exists()
+
+    now[0] += token_calibrator.SAVE_INTERVAL
+    calibrator.record("OpenAI", "gpt", 200, 300)
+    assert json.loads(path.read_text())["OpenAI/gpt"]["x"] == pytest.approx(298.0)
+
+    calibrator.record("OpenAI", "gpt", 300, 450)
+    calibrator.flush()
+    assert TokenCalibrator(str(path)).summary() == calibrator.summary()
+
+
+def test_corrupted_file_starts_over(tmp_path):
+    path = tmp_path / "calibration.json"
+    path.write_text("{not json")
+
+    assert TokenCalibrator(str(path)).summary() == {}
@@ -0,0 +1,149 @@
+"""
+A stub of an OpenAI-compatible inference server, to try and test the OpenAI-compatible strategy offline.
+
+Answers the chat completions requests, streamed or not, with a short echo of the last message and a usage
+counted in words, and lists the configured models. Only the standard library is used.
+
+Usage:
+    python tools/openai_stub_server.py [--port 8000] [--model stub-model] [--token-delay 0.02]
+
+then set OPENAI_COMPATIBLE_CONFIG to a file pointing a provider at http://localhost:8000/v1,
+e.g. openai_compatible.sample.json.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import time
+import uuid
+
+
+def count_words(messages) -> int:
+    return sum(len(str(message.get("content", "")).split()) for message in messages)
+
+
+def make_handler(models, token_delay: float):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status: int, body) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):  # noqa: N802
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json(
+                    200,
+                    {
+                        "object": "list",
+                        "data": [
+                            {"id": model, "object": "model", "owned_by": "stub"}
+                            for model in models
+                        ],
+                    },
+                )
+            else:
+                self._send_json(404, {"error": {"message": "Not found"}})
+
+        def do_POST(self):  # noqa: N802
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "Not found"}})
+                return
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            messages = request.get("messages", [])
+            last = str(messages[-1].get("content", "")) if messages else ""
+            words = ["Stub", "answer", "to:"] + last.split()[:20]
+            words = words[: request.get("max_tokens") or len(words)]
+            usage = {
+                "prompt_tokens": count_words(messages),
+                "completion_tokens": len(words),
+                "total_tokens": count_words(messages) + len(words),
+            }
+            response_id = "chatcmpl-" + uuid.uuid4().hex
+            model = request.get("model", models[0])
+            created = int(time.time())
+
+            if not request.get("stream"):
+                self._send_json(
+                    200,
+                    {
+                        "id": response_id,
+                        "object": "chat.completion",
+                        "created": created,
+                        "model": model,
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {
+                                    "role": "assistant",
+                                    "content": " ".join(words),
+                                },
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": usage,
+                    },
+                )
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+
+            def send_chunk(choices, chunk_usage=None) -> None:
+                chunk = {
+                    "id": response_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": choices,
+                }
+                if chunk_usage is not None:
+                    chunk["usage"] = chunk_usage
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            for i, word in enumerate(words):
+                time.sleep(token_delay)
+                delta = {"content": word if i == 0 else " " + word}
+                send_chunk([{"index": 0, "delta": delta, "finish_reason": None}])
+            send_chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if (request.get("stream_options") or {}).get("include_usage"):
+                send_chunk([], usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return StubHandler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--model", action="append", help="Model name, repeatable. Default: stub-model"
+    )
+    parser.add_argument(
+        "--token-delay", type=float, default=0.02, help="Seconds between streamed words"
+    )
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        (args.host, args.port),
+        make_handler(args.model or ["stub-model"], args.token_delay),
+    )
+    print(f"OpenAI-compatible stub server on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()